@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Index inversé des alertes : recherche des alertes correspondant à une annonce
+"""
+
+import logging
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Set
+
+from .normalization import normalize_brand, normalize_model, location_tokens
+
+logger = logging.getLogger(__name__)
+
+# Champs numériques bornés par les alertes (champ de l'annonce, borne min, borne max)
+RANGE_FIELDS = [
+    ("price", "price_min", "price_max"),
+    ("year", "year_min", "year_max"),
+    ("mileage", "mileage_min", "mileage_max")
+]
+
+# Champs comparés à l'identique
+EXACT_FIELDS = ["fuel_type", "source"]
+
+# Champs de l'annonce nécessaires à l'évaluation des alertes
+CAR_PROJECTION = {
+    "_id": 1, "brand": 1, "model": 1, "price": 1, "year": 1, "mileage": 1,
+    "fuel_type": 1, "transmission": 1, "location": 1, "source": 1,
+    "brand_norm": 1, "model_norm": 1, "location_tokens": 1,
+    "is_good_deal": 1, "title": 1, "description": 1, "created_at": 1
+}
+
+def car_brand_norm(car: Dict[str, Any]) -> str:
+    """
+    Marque normalisée d'une annonce (calculée si l'annonce n'a pas encore le champ)
+    """
+    if "brand_norm" in car:
+        return car["brand_norm"] or ""
+    return normalize_brand(car.get("brand"))
+
+def car_model_norm(car: Dict[str, Any]) -> str:
+    """
+    Modèle normalisé d'une annonce (calculé si l'annonce n'a pas encore le champ)
+    """
+    if "model_norm" in car:
+        return car["model_norm"] or ""
+    return normalize_model(car.get("model"), car.get("brand"))
+
+def car_location_tokens(car: Dict[str, Any]) -> Set[str]:
+    """
+    Mots de la localisation d'une annonce (calculés si l'annonce n'a pas encore le champ)
+    """
+    if "location_tokens" in car:
+        return set(car["location_tokens"] or [])
+    return set(location_tokens(car.get("location")))
+
+class CompiledAlert:
+    """
+    Alerte compilée : critères normalisés évalués en mémoire
+
+    Reproduit la requête de AlertsService._build_search_query_from_alert
+    (préfixes des marque et modèle normalisés, mots de la localisation,
+    sous-chaînes pour les mots-clés).
+    """
+
+    def __init__(self, alert: Dict[str, Any]):
+        self.alert = alert
+        self.alert_id = alert["_id"]
+        self.brand = normalize_brand(alert.get("brand")) or None
+        self.model = normalize_model(alert.get("model"), alert.get("brand")) or None
+        self.location = set(location_tokens(alert.get("location")))
+        self.keywords = (alert.get("keywords") or "").lower().split()
+        self.fuel_type = alert.get("fuel_type") or None
+        self.transmission = alert.get("transmission") or None
+        self.source = alert.get("source") or None
+        self.good_deals_only = bool(alert.get("good_deals_only"))
+        self.ranges = [
+            (field, alert.get(min_key), alert.get(max_key))
+            for field, min_key, max_key in RANGE_FIELDS
+            if alert.get(min_key) is not None or alert.get(max_key) is not None
+        ]
+
+    def matches(self, car: Dict[str, Any]) -> bool:
+        """
+        Vérifie si une annonce satisfait tous les critères de l'alerte
+        """
+        if self.brand and not car_brand_norm(car).startswith(self.brand):
+            return False
+        if self.model and not car_model_norm(car).startswith(self.model):
+            return False
+        if self.fuel_type and car.get("fuel_type") != self.fuel_type:
+            return False
+        if self.transmission and car.get("transmission") != self.transmission:
+            return False
+        if self.source and car.get("source") != self.source:
+            return False
+        if self.good_deals_only and car.get("is_good_deal") is not True:
+            return False
+        if self.location and not self.location.issubset(car_location_tokens(car)):
+            return False
+
+        for field, low, high in self.ranges:
+            value = car.get(field)
+            if not isinstance(value, (int, float)):
+                return False
+            if low is not None and value < low:
+                return False
+            if high is not None and value > high:
+                return False
+
+        if self.keywords:
+            title = str(car.get("title") or "").lower()
+            description = str(car.get("description") or "").lower()
+            for keyword in self.keywords:
+                if keyword not in title and keyword not in description:
+                    return False
+
+        return True
+
+class AlertIndex:
+    """
+    Index inversé des alertes actives
+
+    Les alertes sont indexées par préfixe de marque, par carburant et par
+    source, et leurs bornes numériques sont triées : pour une annonce, seules
+    les alertes candidates sont évaluées, au lieu d'une requête par alerte.
+    """
+
+    def __init__(self, alerts: Iterable[Dict[str, Any]]):
+        """
+        Compile et indexe les alertes
+        """
+        self.alerts: List[CompiledAlert] = []
+
+        # Marque : préfixe exact de l'alerte -> alertes ; alertes sans marque à part
+        self._brand_prefixes: Dict[str, Set[int]] = defaultdict(set)
+        self._any_brand: Set[int] = set()
+        self._brand_prefix_lengths: Set[int] = set()
+
+        # Champs exacts : valeur -> alertes ; alertes sans critère à part
+        self._exact: Dict[str, Dict[Any, Set[int]]] = {field: defaultdict(set) for field in EXACT_FIELDS}
+        self._any_exact: Dict[str, Set[int]] = {field: set() for field in EXACT_FIELDS}
+
+        # Bornes numériques triées : (valeurs, positions des alertes)
+        self._mins: Dict[str, List] = {}
+        self._maxs: Dict[str, List] = {}
+        self._bounded: Dict[str, Set[int]] = {}
+
+        for alert in alerts:
+            try:
+                self._add(CompiledAlert(alert))
+            except Exception as e:
+                logger.error(f"Impossible de compiler l'alerte {alert.get('_id')}: {str(e)}")
+
+        for field, min_key, max_key in RANGE_FIELDS:
+            mins = sorted(
+                (alert.alert[min_key], position) for position, alert in enumerate(self.alerts)
+                if alert.alert.get(min_key) is not None
+            )
+            maxs = sorted(
+                (alert.alert[max_key], position) for position, alert in enumerate(self.alerts)
+                if alert.alert.get(max_key) is not None
+            )
+            self._mins[field] = [[value for value, _ in mins], [position for _, position in mins]]
+            self._maxs[field] = [[value for value, _ in maxs], [position for _, position in maxs]]
+            self._bounded[field] = set(self._mins[field][1]) | set(self._maxs[field][1])
+
+    def _add(self, alert: CompiledAlert) -> None:
+        position = len(self.alerts)
+        self.alerts.append(alert)
+
+        if alert.brand:
+            self._brand_prefixes[alert.brand].add(position)
+            self._brand_prefix_lengths.add(len(alert.brand))
+        else:
+            self._any_brand.add(position)
+
+        for field in EXACT_FIELDS:
+            value = getattr(alert, field)
+            if value:
+                self._exact[field][value].add(position)
+            else:
+                self._any_exact[field].add(position)
+
+    def __len__(self) -> int:
+        return len(self.alerts)
+
+    def candidates(self, car: Dict[str, Any]) -> Set[int]:
+        """
+        Positions des alertes compatibles avec les champs indexés de l'annonce
+        """
+        brand = car_brand_norm(car)
+        candidates = set(self._any_brand)
+        for length in self._brand_prefix_lengths:
+            if length <= len(brand):
+                candidates |= self._brand_prefixes.get(brand[:length], set())
+
+        for field in EXACT_FIELDS:
+            if not candidates:
+                return candidates
+            value = car.get(field)
+            if value:
+                candidates &= self._any_exact[field] | self._exact[field].get(value, set())
+            else:
+                candidates &= self._any_exact[field]
+
+        for field, _, _ in RANGE_FIELDS:
+            if not candidates:
+                return candidates
+            value = car.get(field)
+            if not isinstance(value, (int, float)):
+                candidates -= self._bounded[field]
+                continue
+
+            # Alertes dont le minimum dépasse la valeur ou dont le maximum lui est inférieur
+            min_values, min_positions = self._mins[field]
+            max_values, max_positions = self._maxs[field]
+            candidates.difference_update(min_positions[bisect_right(min_values, value):])
+            candidates.difference_update(max_positions[:bisect_left(max_values, value)])
+
+        return candidates
+
+    def match(self, car: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Retourne les alertes (documents) auxquelles l'annonce correspond
+        """
+        return [
+            self.alerts[position].alert
+            for position in sorted(self.candidates(car))
+            if self.alerts[position].matches(car)
+        ]
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Index d'autocomplétion en mémoire (tableaux triés et recherche par dichotomie)
+"""
+
+import heapq
+import logging
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .text import fold, tokenize
+
+logger = logging.getLogger(__name__)
+
+SUGGESTION_TYPES = ["brand", "model", "location", "keyword"]
+
+# Les préfixes courts couvrent beaucoup de clés : leur top est précalculé
+PRECOMPUTED_PREFIX_LENGTHS = (2, 3)
+PRECOMPUTED_TOP = 50
+
+class _SortedPrefixIndex:
+    """
+    Clés normalisées triées, chacune pointant vers une valeur affichée et sa fréquence
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, str, int]]):
+        """
+        entries : (clé normalisée, valeur affichée, fréquence)
+        """
+        rows = sorted(entries)
+        self.keys = [key for key, _, _ in rows]
+        self.rows = rows
+
+        self.top_by_prefix: Dict[str, List[Tuple[str, int]]] = {}
+        for length in PRECOMPUTED_PREFIX_LENGTHS:
+            grouped: Dict[str, Dict[str, int]] = defaultdict(dict)
+            for key, value, count in rows:
+                if len(key) >= length:
+                    values = grouped[key[:length]]
+                    values[value] = max(values.get(value, 0), count)
+            for prefix, values in grouped.items():
+                self.top_by_prefix[prefix] = heapq.nlargest(
+                    PRECOMPUTED_TOP, values.items(), key=lambda item: item[1]
+                )
+
+    def lookup(self, prefix: str, limit: int) -> List[Tuple[str, int]]:
+        """
+        Retourne les valeurs les plus fréquentes dont une clé commence par le préfixe
+        """
+        if limit <= PRECOMPUTED_TOP and prefix in self.top_by_prefix:
+            return self.top_by_prefix[prefix][:limit]
+
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + "\uffff", lo=start)
+
+        values: Dict[str, int] = {}
+        for _, value, count in self.rows[start:end]:
+            values[value] = max(values.get(value, 0), count)
+        return heapq.nlargest(limit, values.items(), key=lambda item: item[1])
+
+class AutocompleteIndex:
+    """
+    Index d'autocomplétion pondéré par fréquence, par type de suggestion
+
+    Reconstruit périodiquement à partir de la base puis remplacé d'un bloc :
+    les lectures n'accèdent jamais à MongoDB.
+    """
+
+    def __init__(self):
+        self._indexes: Dict[str, _SortedPrefixIndex] = {}
+        self.built_at = None
+
+    def __bool__(self) -> bool:
+        return bool(self._indexes)
+
+    def load(self, counts: Dict[str, Dict[str, int]], built_at=None) -> None:
+        """
+        Construit l'index à partir de {type: {valeur: fréquence}}
+
+        Les marques et modèles sont indexés par leur début ; les localisations
+        aussi par chacun de leurs mots ; les mots-clés sont déjà des mots isolés.
+        """
+        indexes = {}
+        for suggestion_type, values in counts.items():
+            entries = []
+            for value, count in values.items():
+                if not value:
+                    continue
+                if suggestion_type == "location":
+                    keys = set(tokenize(value)) | {fold(value)}
+                else:
+                    keys = {fold(value)}
+                entries.extend((key, value, count) for key in keys if key)
+            indexes[suggestion_type] = _SortedPrefixIndex(entries)
+
+        self._indexes = indexes
+        self.built_at = built_at
+
+    def suggest(self, prefix: str, suggestion_type: Optional[str] = None, limit: int = 10) -> List[Tuple[str, str, int]]:
+        """
+        Retourne les suggestions (type, valeur, fréquence) pour un préfixe
+        """
+        folded = fold(prefix)
+        if not folded:
+            return []
+
+        types = [suggestion_type] if suggestion_type else SUGGESTION_TYPES
+        results = []
+        for current_type in types:
+            index = self._indexes.get(current_type)
+            if index is None:
+                continue
+            results.extend(
+                (current_type, value, count) for value, count in index.lookup(folded, limit)
+            )
+
+        if len(types) > 1:
+            results = heapq.nlargest(limit, results, key=lambda item: item[2])
+        return results[:limit]
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Cache pour l'API : cache mémoire, cache partagé local et génération des données
+"""
+
+import time
+import pickle
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    """
+    Cache LRU en mémoire avec durée de vie des entrées
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        """
+        Initialise le cache
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+        Récupère une entrée du cache, retourne (trouvé, valeur)
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return False, None
+
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Ajoute ou remplace une entrée du cache
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        """
+        Supprime une entrée du cache
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Vide le cache
+        """
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class SQLiteCacheStore:
+    """
+    Cache partagé entre les processus d'une même machine, stocké dans SQLite
+
+    Conserve aussi la génération des données pour que tous les workers
+    voient les invalidations.
+    """
+
+    def __init__(self, path: str):
+        """
+        Ouvre (ou crée) la base SQLite du cache
+        """
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires_at REAL, value BLOB)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)"
+        )
+        self._conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('ingest_generation', 0)")
+
+    @staticmethod
+    def _key(key: Hashable) -> str:
+        return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+        Récupère une entrée du cache, retourne (trouvé, valeur)
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at, value FROM cache WHERE key = ?", (self._key(key),)
+            ).fetchone()
+        if row is None or row[0] < time.time():
+            return False, None
+        return True, pickle.loads(row[1])
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> None:
+        """
+        Ajoute ou remplace une entrée du cache
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, expires_at, value) VALUES (?, ?, ?)",
+                (self._key(key), time.time() + ttl, pickle.dumps(value))
+            )
+
+    def purge_expired(self) -> None:
+        """
+        Supprime les entrées expirées
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+
+    def get_generation(self) -> int:
+        """
+        Retourne la génération partagée des données
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE name = 'ingest_generation'"
+            ).fetchone()
+        return row[0] if row else 0
+
+    def bump_generation(self) -> int:
+        """
+        Incrémente la génération partagée des données
+        """
+        with self._lock:
+            self._conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'ingest_generation'")
+        self.purge_expired()
+        return self.get_generation()
+
+def _open_shared_store() -> Optional[SQLiteCacheStore]:
+    """
+    Ouvre le cache partagé s'il est configuré
+    """
+    if not settings.RESPONSE_CACHE_SHARED_PATH:
+        return None
+    try:
+        return SQLiteCacheStore(settings.RESPONSE_CACHE_SHARED_PATH)
+    except Exception as e:
+        logger.error(f"Impossible d'ouvrir le cache partagé: {str(e)}")
+        return None
+
+shared_store = _open_shared_store()
+
+# Compteur de génération des données, incrémenté à chaque ingestion d'annonces.
+# Les clés de cache incluent la génération : un incrément invalide tout.
+_ingest_generation = 0
+_generation_lock = threading.Lock()
+
+def get_ingest_generation() -> int:
+    """
+    Retourne la génération courante des données
+    """
+    if shared_store is not None:
+        return shared_store.get_generation()
+    return _ingest_generation
+
+def bump_ingest_generation() -> int:
+    """
+    Incrémente la génération des données après une ingestion
+    """
+    global _ingest_generation
+    with _generation_lock:
+        _ingest_generation += 1
+    if shared_store is not None:
+        return shared_store.bump_generation()
+    return _ingest_generation
+
+# Cache des utilisateurs authentifiés : user_id -> (version du token, utilisateur).
+# Propre à chaque processus ; la durée de vie courte borne le délai de
+# propagation d'une invalidation faite par un autre worker.
+user_cache = TTLCache(maxsize=settings.USER_CACHE_MAX_ENTRIES, ttl=settings.USER_CACHE_TTL_SECONDS)
+
+# Invalidations récentes (user_id -> horodatage) : les tokens émis avant ne sont
+# plus crus sur parole, le temps de leur durée de vie. Elles sont aussi écrites
+# dans le cache partagé pour être vues par tous les workers de la machine ;
+# sans cache partagé, AUTH_TRUST_TOKEN_CLAIMS suppose un seul worker.
+_REVOCATION_TTL_SECONDS = settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+_user_revocations = TTLCache(
+    maxsize=settings.USER_CACHE_MAX_ENTRIES,
+    ttl=_REVOCATION_TTL_SECONDS
+)
+
+def invalidate_user_cache(user_id: str) -> None:
+    """
+    Invalide l'utilisateur en cache après une modification de son compte
+    """
+    user_cache.delete(str(user_id))
+    revoked_at = time.time()
+    _user_revocations.set(str(user_id), revoked_at)
+    if shared_store is not None:
+        try:
+            shared_store.set(("user_revocation", str(user_id)), revoked_at, ttl=_REVOCATION_TTL_SECONDS)
+        except sqlite3.Error as e:
+            logger.error(f"Impossible d'enregistrer la révocation dans le cache partagé: {str(e)}")
+
+def is_user_revoked_since(user_id: str, issued_at: float) -> bool:
+    """
+    Vérifie si le compte a été modifié après l'émission d'un token
+    """
+    found, revoked_at = _user_revocations.get(str(user_id))
+    if found and issued_at <= revoked_at:
+        return True
+    if shared_store is not None:
+        try:
+            found, revoked_at = shared_store.get(("user_revocation", str(user_id)))
+        except sqlite3.Error as e:
+            # Dans le doute, le token n'est pas cru sur parole
+            logger.error(f"Impossible de lire les révocations du cache partagé: {str(e)}")
+            return True
+        return found and issued_at <= revoked_at
+    return False
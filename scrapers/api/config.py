@@ -24,6 +24,15 @@ class Settings(BaseSettings):
     SECRET_KEY: str = secrets.token_urlsafe(32)
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Croire les claims du token d'accès (is_active, is_admin) sans lire la base.
+    # Les révocations passent par RESPONSE_CACHE_SHARED_PATH : sans cache partagé,
+    # réservé à un déploiement à un seul worker
+    AUTH_TRUST_TOKEN_CLAIMS: bool = False
+    # Cache local des utilisateurs, ignoré pour un token émis avant une révocation
+    USER_CACHE_TTL_SECONDS: int = 60
+    USER_CACHE_MAX_ENTRIES: int = 10000
+    # Hachages bcrypt simultanés (threads dédiés, hors de la boucle asyncio)
+    PASSWORD_HASH_MAX_CONCURRENCY: int = 2
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
     
     # CORS
@@ -40,6 +49,10 @@ class Settings(BaseSettings):
     # Base de données
     MONGODB_URL: str = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
     MONGODB_NAME: str = os.getenv("MONGODB_NAME", "drivedeal")
+    MONGODB_MAX_POOL_SIZE: int = 100
+    MONGODB_MIN_POOL_SIZE: int = 10
+    MONGODB_MAX_IDLE_TIME_MS: int = 300000
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = 5000
     
     # Email
     SMTP_TLS: bool = True
@@ -50,6 +63,8 @@ class Settings(BaseSettings):
     EMAILS_FROM_EMAIL: Optional[str] = None
     EMAILS_FROM_NAME: Optional[str] = None
     
+    EMAIL_BACKEND: str = "smtp"  # "smtp" ou "memory" (messages conservés en mémoire)
+    
     @validator("EMAILS_FROM_NAME")
     def get_project_name(cls, v: Optional[str], values: dict) -> str:
         if not v:
@@ -75,12 +90,63 @@ class Settings(BaseSettings):
     LOG_FORMAT: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     LOG_FILE: Optional[str] = "logs/api.log"
     
+    # Recherche
+    AUTOCOMPLETE_REFRESH_MINUTES: int = 15
+    SEARCH_HISTORY_BATCH_SIZE: int = 200
+    SEARCH_HISTORY_FLUSH_SECONDS: float = 5.0
+    SEARCH_HISTORY_BUFFER_SIZE: int = 10000
+    POPULAR_SEARCHES_WINDOW_HOURS: int = 168
+    POPULAR_SEARCHES_TOP_K: int = 50
+    POPULAR_SEARCHES_REFRESH_SECONDS: int = 300
+    SIMILAR_CARS_CHECK_SECONDS: int = 30
+    SIMILAR_CARS_MAX_AGE_MINUTES: int = 30
+    
     # Alertes
     ALERT_CHECK_INTERVAL_MINUTES: int = 30
+    ALERT_INDEX_REFRESH_SECONDS: int = 60
+    MAX_ALERTS_PER_USER: int = 20
+    MAX_ALERT_MATCHES_PER_RUN: int = 100
+    ALERT_EVENT_QUEUE_SIZE: int = 10000
+    ALERT_EVENT_BATCH_SIZE: int = 500
+    ALERT_EVENT_BATCH_WAIT_SECONDS: float = 1.0
+    ALERT_CHANGE_STREAM_ENABLED: bool = True
+    ALERT_CHANGE_STREAM_RETRY_SECONDS: float = 5.0
+    ALERT_CHANGE_STREAM_MAX_RETRY_SECONDS: float = 300.0
+    
+    # Notifications
+    NOTIFICATION_DIGEST_WINDOW_MINUTES: int = 15
+    NOTIFICATION_WORKERS: int = 4
+    NOTIFICATION_BATCH_SIZE: int = 100
+    NOTIFICATION_POLL_SECONDS: int = 30
+    NOTIFICATION_MAX_ATTEMPTS: int = 5
+    NOTIFICATION_RETRY_BASE_SECONDS: int = 60
+    NOTIFICATION_RETRY_MAX_SECONDS: int = 3600
+    
+    # Ingestion en masse (POST /cars/bulk)
+    BULK_INGEST_CHUNK_SIZE: int = 1000
+    BULK_INGEST_MAX_ITEMS: int = 50000
+    
+    # Export des annonces (GET /cars/export) : administrateurs et emails partenaires
+    EXPORT_PARTNER_EMAILS: List[str] = []
+    EXPORT_BATCH_SIZE: int = 5000
     
     # Analyse de prix
     PRICE_ANALYSIS_INTERVAL_HOURS: int = 24
     
+    # Cache des statistiques
+    STATS_CACHE_TTL_SECONDS: int = 300
+    
+    # Cache des réponses HTTP (routes en lecture seule, relatives à API_V1_STR)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_TTL_SECONDS: int = 300
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1024
+    RESPONSE_CACHE_SHARED_PATH: Optional[str] = None
+    RESPONSE_CACHE_PATHS: List[str] = ["/stats/", "/cars/brands/", "/cars/models/", "/search/popular"]
+    
+    # Instantanés quotidiens du marché
+    MARKET_SNAPSHOT_INTERVAL_HOURS: int = 24
+    MARKET_SNAPSHOT_ROLLUP_DAYS: int = 2
+    
     # Nettoyage de la base de données
     DB_CLEANUP_INTERVAL_DAYS: int = 7
     DB_CLEANUP_OLDER_THAN_DAYS: int = 90
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Détection des annonces en double entre les sources (même véhicule publié sur plusieurs sites)
+
+Chaque annonce reçoit une empreinte SimHash de son titre et de sa description
+et une empreinte perceptuelle (dHash) de ses premières images téléchargées.
+Lors de l'enregistrement d'un lot, les candidats sont limités au même bloc
+(marque, modèle, année normalisés, prix à ±10 %, localisation proche) ; les
+annonces reconnues comme doublons partagent le même vehicle_cluster_id.
+
+Le module est partagé par les scrapers (SQL, JSON) et par l'API (MongoDB).
+"""
+
+import hashlib
+import logging
+import math
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .text import tokenize
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - Pillow absent : pas d'empreinte d'image
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Écart de prix relatif maximal entre deux annonces d'un même véhicule
+PRICE_TOLERANCE = 0.10
+
+# Distance maximale entre les localisations géocodées de deux annonces (km)
+MAX_DISTANCE_KM = 60
+
+# Écart de kilométrage toléré : relatif, avec un plancher absolu (km)
+MILEAGE_TOLERANCE = 0.05
+MILEAGE_MIN_GAP = 3000
+
+# Nombre maximal de bits différents pour considérer deux empreintes comme proches
+TEXT_MAX_DISTANCE = 10
+IMAGE_MAX_DISTANCE = 6
+
+# Nombre d'images utilisées pour l'empreinte perceptuelle
+MAX_HASHED_IMAGES = 3
+
+HASH_BITS = 64
+
+Candidate = Dict[str, Any]
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+def simhash(text: Optional[str]) -> Optional[int]:
+    """
+    Empreinte SimHash 64 bits d'un texte (mots et groupes de trois mots)
+
+    Deux textes proches donnent des empreintes séparées par peu de bits.
+    """
+    words = tokenize(text or "")
+    if not words:
+        return None
+
+    features = words + [" ".join(words[i:i + 3]) for i in range(len(words) - 2)]
+    weights = [0] * HASH_BITS
+    for feature in features:
+        value = _hash64(feature)
+        for bit in range(HASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+
+    return sum(1 << bit for bit in range(HASH_BITS) if weights[bit] > 0)
+
+def image_hash(path: str) -> Optional[int]:
+    """
+    Empreinte perceptuelle (dHash 64 bits) d'une image, ou None si elle est illisible
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as image:
+            pixels = list(image.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    except (OSError, ValueError) as e:
+        logger.debug(f"Empreinte impossible pour l'image {path}: {str(e)}")
+        return None
+
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            value = value << 1 | (pixels[row * 9 + column] > pixels[row * 9 + column + 1])
+    return value
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def dedup_fields(car: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Calcule les empreintes d'une annonce (text_simhash, image_hashes) au format stocké (hexadécimal)
+    """
+    text = simhash(f"{car.get('title') or ''} {car.get('description') or ''}")
+    hashes = []
+    for path in (car.get("local_images") or [])[:MAX_HASHED_IMAGES]:
+        value = image_hash(path)
+        if value is not None:
+            hashes.append(f"{value:016x}")
+
+    # Images absentes localement (API) : les empreintes déjà calculées sont conservées
+    return {
+        "text_simhash": f"{text:016x}" if text is not None else None,
+        "image_hashes": hashes or list(car.get("image_hashes") or []),
+    }
+
+def block_key(car: Dict[str, Any]) -> Optional[Tuple[str, str, int]]:
+    """
+    Bloc de comparaison d'une annonce (marque, modèle, année), ou None si incomplet
+    """
+    if not car.get("brand_norm") or not car.get("model_norm") or not car.get("year"):
+        return None
+    return car["brand_norm"], car["model_norm"], int(car["year"])
+
+def price_range(price: Any) -> Optional[Tuple[float, float]]:
+    """
+    Bornes de prix des candidats d'une annonce
+    """
+    if not isinstance(price, (int, float)) or price <= 0:
+        return None
+    return price / (1 + PRICE_TOLERANCE), price * (1 + PRICE_TOLERANCE)
+
+def _distance_km(a: Dict[str, Any], b: Dict[str, Any]) -> float:
+    (lon1, lat1), (lon2, lat2) = a["coordinates"], b["coordinates"]
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi, dlambda = phi2 - phi1, math.radians(lon2 - lon1)
+    h = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(h))
+
+def _compatible(car: Dict[str, Any], other: Dict[str, Any]) -> bool:
+    """
+    Vérifie que prix, kilométrage et localisation ne s'opposent pas à un doublon
+    """
+    bounds = price_range(car.get("price"))
+    other_price = other.get("price")
+    if bounds and isinstance(other_price, (int, float)) and not bounds[0] <= other_price <= bounds[1]:
+        return False
+
+    mileage, other_mileage = car.get("mileage"), other.get("mileage")
+    if isinstance(mileage, (int, float)) and isinstance(other_mileage, (int, float)):
+        if abs(mileage - other_mileage) > max(MILEAGE_MIN_GAP, MILEAGE_TOLERANCE * max(mileage, other_mileage)):
+            return False
+
+    point, other_point = car.get("location_point"), other.get("location_point")
+    if point and other_point and _distance_km(point, other_point) > MAX_DISTANCE_KM:
+        return False
+
+    return True
+
+def _text_hash(car: Dict[str, Any]) -> Optional[int]:
+    if car.get("text_simhash"):
+        return int(car["text_simhash"], 16)
+    return simhash(f"{car.get('title') or ''} {car.get('description') or ''}")
+
+def match_score(car: Dict[str, Any], other: Dict[str, Any]) -> float:
+    """
+    Score de doublon entre deux annonces du même bloc (0 si ce ne sont pas des doublons)
+
+    Les annonces doivent être compatibles (prix, kilométrage, localisation) et
+    avoir des images quasi identiques ou un texte quasi identique.
+    """
+    if not _compatible(car, other):
+        return 0.0
+
+    image_distances = [
+        hamming(int(a, 16), int(b, 16))
+        for a in car.get("image_hashes") or []
+        for b in other.get("image_hashes") or []
+    ]
+    image_distance = min(image_distances, default=HASH_BITS)
+
+    text, other_text = _text_hash(car), _text_hash(other)
+    text_distance = hamming(text, other_text) if text is not None and other_text is not None else HASH_BITS
+
+    if image_distance > IMAGE_MAX_DISTANCE and text_distance > TEXT_MAX_DISTANCE:
+        return 0.0
+    return 1 - min(image_distance, text_distance) / HASH_BITS
+
+def distinct_vehicle_stages() -> List[Dict[str, Any]]:
+    """
+    Étapes d'agrégation MongoDB ne gardant qu'une annonce par vehicle_cluster_id
+
+    L'annonce retenue est la première du cluster dans l'ordre du pipeline ;
+    une annonce sans cluster compte pour un véhicule.
+    """
+    return [
+        {"$group": {"_id": {"$ifNull": ["$vehicle_cluster_id", "$_id"]}, "doc": {"$first": "$$ROOT"}}},
+        {"$replaceRoot": {"newRoot": "$doc"}},
+    ]
+
+def new_cluster_id() -> str:
+    return f"vc_{uuid.uuid4().hex[:16]}"
+
+class DuplicateDetector:
+    """
+    Attribution incrémentale des vehicle_cluster_id sur un lot d'annonces
+
+    `find_candidates(car)` retourne les annonces déjà stockées du même bloc
+    (dictionnaires avec au moins id, vehicle_cluster_id et les champs comparés) ;
+    les annonces du lot en cours sont comparées entre elles en mémoire.
+
+    Après le lot, l'appelant applique au stockage `updates` (annonces stockées
+    sans cluster) et `merges` (clusters fusionnés), en passant chaque cluster
+    par `resolve`.
+    """
+
+    def __init__(self, find_candidates: Callable[[Dict[str, Any]], Iterable[Candidate]]):
+        self.find_candidates = find_candidates
+        self._batch: Dict[Tuple[str, str, int], List[Candidate]] = {}
+        # Annonces déjà stockées sans cluster, rattachées au cluster d'un doublon du lot
+        self.updates: Dict[Any, str] = {}
+        # Clusters absorbés par un autre : vehicle_cluster_id -> cluster qui le remplace
+        self.merges: Dict[str, str] = {}
+
+    def resolve(self, cluster_id: Optional[str]) -> Optional[str]:
+        """
+        Cluster final d'un vehicle_cluster_id, après les fusions du lot
+        """
+        while cluster_id in self.merges:
+            cluster_id = self.merges[cluster_id]
+        return cluster_id
+
+    def assign(self, car: Dict[str, Any]) -> str:
+        """
+        Calcule les empreintes d'une annonce et lui attribue un vehicle_cluster_id
+
+        Une annonce déjà en cluster conserve le sien ; sinon elle rejoint celui
+        de son meilleur doublon, ou un nouveau cluster. Si ses doublons
+        appartiennent à plusieurs clusters, ceux-ci sont fusionnés dans le
+        cluster retenu.
+        """
+        car.update(dedup_fields(car))
+        key = block_key(car)
+
+        # Les annonces du lot sans identifiant (nouvelles) sont distinguées par leur objet
+        candidates: Dict[Any, Candidate] = {}
+        if key is not None:
+            for candidate in self.find_candidates(car):
+                candidates[candidate.get("id")] = candidate
+            for candidate in self._batch.get(key, []):
+                candidates[candidate.get("id") if candidate.get("id") is not None else id(candidate)] = candidate
+
+        previous = candidates.pop(car.get("id"), None) if car.get("id") is not None else None
+        own_cluster = self.resolve(car.get("vehicle_cluster_id") or (previous or {}).get("vehicle_cluster_id"))
+
+        matches = []
+        for candidate in candidates.values():
+            score = match_score(car, candidate)
+            if score > 0:
+                matches.append((score, candidate))
+        matches.sort(key=lambda match: match[0], reverse=True)
+
+        # Cluster retenu : celui de l'annonce, sinon celui du meilleur doublon
+        clusters = [own_cluster] if own_cluster else []
+        for _, candidate in matches:
+            cluster = self.resolve(candidate.get("vehicle_cluster_id"))
+            if cluster and cluster not in clusters:
+                clusters.append(cluster)
+        cluster_id = clusters[0] if clusters else new_cluster_id()
+        for other in clusters[1:]:
+            self.merges[other] = cluster_id
+
+        for _, candidate in matches:
+            if not candidate.get("vehicle_cluster_id") and candidate.get("id") is not None:
+                self.updates[candidate["id"]] = cluster_id
+            candidate["vehicle_cluster_id"] = cluster_id
+
+        car["vehicle_cluster_id"] = cluster_id
+        if key is not None:
+            self._batch.setdefault(key, []).append(car)
+        return cluster_id
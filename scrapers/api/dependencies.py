@@ -6,9 +6,10 @@ Dépendances pour l'API
 """
 
 import os
+import asyncio
 import logging
 from typing import Optional, Tuple, Dict, Any
-from fastapi import Depends, HTTPException, status, Query
+from fastapi import Depends, HTTPException, Request, status, Query
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
@@ -16,6 +17,7 @@ from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 
 from .models.auth import TokenData, User
 from .config import settings
+from .cache import user_cache, is_user_revoked_since
 from .services.auth_service import AuthService
 
 # Configuration du logger
@@ -24,9 +26,78 @@ logger = logging.getLogger(__name__)
 # Configuration de l'authentification
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.api_prefix}/auth/login")
 
-# Connexion à la base de données
-client = AsyncIOMotorClient(settings.MONGODB_URL)
-database = client[settings.MONGODB_NAME]
+# Connexion à la base de données, ouverte et fermée par le lifespan de l'application
+client: Optional[AsyncIOMotorClient] = None
+database: Optional[AsyncIOMotorDatabase] = None
+
+async def connect_to_database() -> AsyncIOMotorDatabase:
+    """
+    Ouvre le client MongoDB partagé et préchauffe son pool de connexions
+    """
+    global client, database
+    if database is not None:
+        return database
+    
+    client = AsyncIOMotorClient(
+        settings.MONGODB_URL,
+        maxPoolSize=settings.MONGODB_MAX_POOL_SIZE,
+        minPoolSize=settings.MONGODB_MIN_POOL_SIZE,
+        maxIdleTimeMS=settings.MONGODB_MAX_IDLE_TIME_MS,
+        serverSelectionTimeoutMS=settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS
+    )
+    database = client[settings.MONGODB_NAME]
+    
+    # Des pings simultanés ouvrent d'emblée minPoolSize connexions
+    try:
+        await asyncio.gather(*(
+            database.command("ping") for _ in range(max(settings.MONGODB_MIN_POOL_SIZE, 1))
+        ))
+    except Exception as e:
+        logger.error(f"Impossible de préchauffer les connexions MongoDB: {str(e)}")
+    
+    return database
+
+async def close_database_connection() -> None:
+    """
+    Ferme le client MongoDB partagé
+    """
+    global client, database
+    if client is not None:
+        client.close()
+    client = None
+    database = None
+
+class ServiceContainer:
+    """
+    Instances uniques des services, partagées par les routes et les tâches de fond
+    """
+    
+    def __init__(self):
+        from .services.car_service import CarService
+        from .services.search_service import SearchService
+        from .services.stats_service import StatsService
+        from .services.favorites_service import FavoritesService
+        from .services.alerts_service import AlertsService
+        from .services.admin_service import AdminService
+        from .services.deal_scoring_service import DealScoringService
+        from .services.market_snapshot_service import MarketSnapshotService
+        from .services.notification_service import NotificationService
+        
+        # Services sans dépendance, puis ceux qui reçoivent ces instances
+        self.auth_service = AuthService()
+        self.favorites_service = FavoritesService()
+        self.deal_scoring_service = DealScoringService()
+        self.market_snapshot_service = MarketSnapshotService()
+        self.notification_service = NotificationService()
+        self.search_service = SearchService()
+        self.car_service = CarService(
+            self.market_snapshot_service, self.favorites_service, self.deal_scoring_service
+        )
+        self.stats_service = StatsService(self.market_snapshot_service)
+        self.alerts_service = AlertsService(self.notification_service)
+        self.admin_service = AdminService(self.auth_service)
+
+services = ServiceContainer()
 
 # Dépendances pour la pagination
 def pagination_params(
@@ -43,12 +114,19 @@ async def get_db() -> AsyncIOMotorDatabase:
     """
     Récupère la connexion à la base de données
     """
+    if database is None:
+        return await connect_to_database()
     return database
 
 # Dépendances pour l'authentification
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict[str, Any]:
     """
     Récupère l'utilisateur connecté à partir du token JWT
+    
+    L'utilisateur est mis en cache (clé : ID et version du token) pour une
+    courte durée. Avec AUTH_TRUST_TOKEN_CLAIMS, les claims du token d'accès
+    suffisent. Dans les deux cas, un compte modifié depuis l'émission du token
+    est relu en base.
     """
     try:
         # Décoder le token
@@ -79,6 +157,37 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict[str, Any
                 headers={"WWW-Authenticate": "Bearer"}
             )
         
+        token_version = payload.get("ver", 0)
+        
+        # Croire les claims du token d'accès, sans accès à la base
+        if (
+            settings.AUTH_TRUST_TOKEN_CLAIMS
+            and "is_active" in payload
+            and not is_user_revoked_since(user_id, payload.get("iat", 0))
+        ):
+            if not payload["is_active"]:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Utilisateur inactif",
+                    headers={"WWW-Authenticate": "Bearer"}
+                )
+            
+            return {
+                "id": user_id,
+                "email": payload.get("email"),
+                "full_name": payload.get("full_name"),
+                "is_active": True,
+                "is_admin": bool(payload.get("is_admin", False))
+            }
+        
+        # Utilisateur en cache pour cette version du token, sauf si le compte a été
+        # modifié depuis l'émission du token (éventuellement par un autre worker)
+        found, cached = user_cache.get(user_id)
+        if found and cached[0] == token_version:
+            if not is_user_revoked_since(user_id, payload.get("iat", 0)):
+                return dict(cached[1])
+            user_cache.delete(user_id)
+        
         # Récupérer l'utilisateur
         db = await get_db()
         user = await auth_service.get_user_by_id(db, user_id)
@@ -98,14 +207,25 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict[str, Any
                 headers={"WWW-Authenticate": "Bearer"}
             )
         
+        # Vérifier que le token n'a pas été révoqué (mot de passe ou statut modifié)
+        if token_version < user.token_version:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token révoqué",
+                headers={"WWW-Authenticate": "Bearer"}
+            )
+        
         # Retourner les informations de l'utilisateur
-        return {
+        user_info = {
             "id": user.id,
             "email": user.email,
             "full_name": user.full_name,
             "is_active": user.is_active,
             "is_admin": user.is_admin
         }
+        user_cache.set(user_id, (token_version, user_info))
+        
+        return dict(user_info)
     
     except HTTPException:
         raise
@@ -141,55 +261,51 @@ async def get_admin_user(current_user: Dict[str, Any] = Depends(get_current_user
     
     return current_user
 
-# Dépendances pour les services
-async def get_car_service():
+# Dépendances pour les services (instances uniques rattachées à l'application)
+def _get_services(request: Request) -> ServiceContainer:
+    return getattr(request.app.state, "services", services)
+
+async def get_car_service(request: Request):
     """
     Récupère le service pour les voitures
     """
-    from .services.car_service import CarService
-    return CarService()
+    return _get_services(request).car_service
 
-async def get_search_service():
+async def get_search_service(request: Request):
     """
     Récupère le service pour la recherche
     """
-    from .services.search_service import SearchService
-    return SearchService()
+    return _get_services(request).search_service
 
-async def get_stats_service():
+async def get_stats_service(request: Request):
     """
     Récupère le service pour les statistiques
     """
-    from .services.stats_service import StatsService
-    return StatsService()
+    return _get_services(request).stats_service
 
-async def get_auth_service():
+async def get_auth_service(request: Request):
     """
     Récupère le service pour l'authentification
     """
-    from .services.auth_service import AuthService
-    return AuthService()
+    return _get_services(request).auth_service
 
-async def get_favorites_service():
+async def get_favorites_service(request: Request):
     """
     Récupère le service pour les favoris
     """
-    from .services.favorites_service import FavoritesService
-    return FavoritesService()
+    return _get_services(request).favorites_service
 
-async def get_alerts_service():
+async def get_alerts_service(request: Request):
     """
     Récupère le service pour les alertes
     """
-    from .services.alerts_service import AlertsService
-    return AlertsService()
+    return _get_services(request).alerts_service
 
-async def get_admin_service():
+async def get_admin_service(request: Request):
     """
     Récupère le service pour l'administration
     """
-    from .services.admin_service import AdminService
-    return AdminService()
+    return _get_services(request).admin_service
 
 # Service d'authentification
-auth_service = AuthService() 
\ No newline at end of file
+auth_service = services.auth_service
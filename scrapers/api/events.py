@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Événements d'ingestion : diffusion des nouvelles annonces aux alertes
+
+Seules les insertions sont diffusées : une mise à jour (changement de prix,
+recalcul des bonnes affaires, réingestion d'un lot) ne doit pas notifier à
+nouveau une annonce déjà connue.
+"""
+
+import asyncio
+import logging
+from typing import Any, Iterable, List
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import OperationFailure
+
+from .config import settings
+from .alert_index import CAR_PROJECTION
+
+logger = logging.getLogger(__name__)
+
+# Codes d'erreur MongoDB : change stream non supporté (serveur autonome)
+_CHANGE_STREAM_UNSUPPORTED_CODES = {40573}
+# Codes d'erreur MongoDB : jeton de reprise inutilisable (oplog dépassé)
+_CHANGE_STREAM_HISTORY_LOST_CODES = {280, 286}
+
+class IngestEventQueue:
+    """
+    File locale des identifiants d'annonces ingérées
+
+    La publication ne bloque jamais le chemin d'écriture : si la file est
+    pleine, l'identifiant est abandonné et le traitement périodique des
+    alertes le rattrapera.
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def publish(self, car_ids: Iterable[Any]) -> None:
+        """
+        Publie des identifiants de nouvelles annonces
+        """
+        for car_id in car_ids:
+            try:
+                self._queue.put_nowait(car_id)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                if self.dropped % 1000 == 1:
+                    logger.warning(f"File d'ingestion pleine, {self.dropped} annonce(s) ignorée(s)")
+
+    async def next_batch(self, max_size: int, max_wait: float) -> List[Any]:
+        """
+        Attend une annonce puis regroupe celles qui arrivent dans le délai imparti
+        """
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max_wait
+        while len(batch) < max_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # Une même annonce peut être publiée par l'API et par le change stream
+        return list(dict.fromkeys(batch))
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+ingest_events = IngestEventQueue(maxsize=settings.ALERT_EVENT_QUEUE_SIZE)
+
+async def alert_dispatch_loop(db: AsyncIOMotorDatabase, alerts_service) -> None:
+    """
+    Consommateur : évalue les alertes sur les seules annonces publiées
+    """
+    while True:
+        car_ids = await ingest_events.next_batch(
+            settings.ALERT_EVENT_BATCH_SIZE,
+            settings.ALERT_EVENT_BATCH_WAIT_SECONDS
+        )
+        try:
+            cars = await db.cars.find({"_id": {"$in": car_ids}}, CAR_PROJECTION).to_list(length=None)
+            matches_count = await alerts_service.match_new_cars(db, cars)
+            if matches_count:
+                logger.info(f"{matches_count} correspondance(s) d'alerte pour {len(cars)} annonce(s) ingérée(s)")
+        except Exception as e:
+            logger.error(f"Erreur lors de la diffusion des annonces aux alertes: {str(e)}")
+
+async def car_change_stream_loop(db: AsyncIOMotorDatabase) -> None:
+    """
+    Suit le change stream de db.cars (replica set requis) et publie les annonces
+    insérées par d'autres processus
+
+    Après une erreur, le flux est rouvert à partir du dernier jeton de reprise,
+    avec un délai croissant entre les tentatives.
+    """
+    pipeline = [{"$match": {"operationType": "insert"}}]
+    resume_token = None
+    delay = settings.ALERT_CHANGE_STREAM_RETRY_SECONDS
+    while True:
+        try:
+            async with db.cars.watch(pipeline, resume_after=resume_token) as stream:
+                logger.info("Change stream des annonces actif")
+                delay = settings.ALERT_CHANGE_STREAM_RETRY_SECONDS
+                async for change in stream:
+                    ingest_events.publish([change["documentKey"]["_id"]])
+                    resume_token = stream.resume_token
+        except OperationFailure as e:
+            if e.code in _CHANGE_STREAM_UNSUPPORTED_CODES:
+                logger.info(f"Change stream indisponible, publication locale et traitement périodique uniquement: {str(e)}")
+                return
+            if e.code in _CHANGE_STREAM_HISTORY_LOST_CODES:
+                # Les insertions manquées seront rattrapées par le traitement périodique
+                logger.warning(f"Jeton de reprise du change stream expiré, reprise au temps présent: {str(e)}")
+                resume_token = None
+            else:
+                logger.error(f"Erreur du change stream des annonces: {str(e)}")
+        except Exception as e:
+            logger.error(f"Erreur du change stream des annonces: {str(e)}")
+
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, settings.ALERT_CHANGE_STREAM_MAX_RETRY_SECONDS)
+
+async def alert_polling_loop(db: AsyncIOMotorDatabase, alerts_service) -> None:
+    """
+    Traitement périodique des alertes, en secours des événements
+    """
+    while True:
+        await asyncio.sleep(settings.ALERT_CHECK_INTERVAL_MINUTES * 60)
+        try:
+            await alerts_service.process_alerts(db)
+        except Exception as e:
+            logger.error(f"Erreur lors du traitement périodique des alertes: {str(e)}")
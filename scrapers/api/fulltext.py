@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Recherche plein texte sur les annonces (index texte MongoDB en français)
+"""
+
+import logging
+from typing import Any, Dict, List, Mapping, Optional, Union
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import TEXT
+
+from .text import tokenize
+
+logger = logging.getLogger(__name__)
+
+TEXT_INDEX_NAME = "cars_text"
+TEXT_SEARCH_LANGUAGE = "french"
+
+# Poids des champs dans le score de pertinence
+TEXT_INDEX_WEIGHTS = {
+    "title": 10,
+    "brand": 5,
+    "model": 5,
+    "description": 1
+}
+
+# Mots vides ignorés par l'index texte et exclus de text_stems
+STOP_WORDS = {
+    "a", "au", "aux", "avec", "ce", "ces", "dans", "de", "des", "du", "en", "et",
+    "il", "la", "le", "les", "leur", "ou", "par", "pas", "pour", "sa", "sans",
+    "se", "son", "sur", "un", "une", "y"
+}
+
+# Projection et tri par score de pertinence ($meta textScore)
+RELEVANCE_PROJECTION = {"score": {"$meta": "textScore"}}
+RELEVANCE_SORT = [("score", {"$meta": "textScore"})]
+
+async def ensure_text_index(db: AsyncIOMotorDatabase) -> None:
+    """
+    Crée l'index texte de la collection cars
+
+    L'index (version 3) racinise les mots selon les règles du français et
+    ignore la casse et les accents ; "language_override" pointe vers un champ
+    inexistant pour qu'un champ "language" d'annonce ne change pas l'analyse.
+    """
+    await db.cars.create_index(
+        [(field, TEXT) for field in TEXT_INDEX_WEIGHTS],
+        name=TEXT_INDEX_NAME,
+        weights=TEXT_INDEX_WEIGHTS,
+        default_language=TEXT_SEARCH_LANGUAGE,
+        language_override="text_language"
+    )
+
+def stem(token: str) -> str:
+    """
+    Racinisation légère d'un mot normalisé (pluriels et finales -e, -er)
+
+    "voitures" et "voiture" donnent "voitur", "chevaux" donne "cheval" ; les
+    mots courts et les nombres sont conservés tels quels.
+    """
+    if len(token) <= 3 or not token.isalpha():
+        return token
+    if token.endswith("aux") and len(token) > 4:
+        token = token[:-3] + "al"
+    elif token[-1] in "sx":
+        token = token[:-1]
+    for suffix in ("r", "e"):
+        if len(token) > 3 and token.endswith(suffix):
+            token = token[:-1]
+    if len(token) > 3 and token[-1] == token[-2]:
+        token = token[:-1]
+    return token
+
+def stems(text: Any) -> List[str]:
+    """
+    Racines des mots d'un texte, sans mots vides ni doublon
+    """
+    return list(dict.fromkeys(
+        stem(token) for token in tokenize(str(text or "")) if token not in STOP_WORDS
+    ))
+
+def text_fields(car: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    Calcule le champ text_stems d'une annonce (racines des champs de l'index texte)
+    """
+    return {
+        "text_stems": stems(" ".join(str(car.get(field) or "") for field in TEXT_INDEX_WEIGHTS))
+    }
+
+def build_text_filter(keywords: Union[str, List[str], None]) -> Optional[Dict[str, Any]]:
+    """
+    Construit les clauses de recherche pour des mots-clés saisis par l'utilisateur
+
+    La clause $text reçoit les mots sans guillemets : l'index les racinise en
+    français et trie par pertinence. Comme $text retient les annonces
+    contenant l'un des mots, la présence de tous les mots (comme les
+    mots-clés des alertes) est exigée sur le champ text_stems avec $all.
+    """
+    if not keywords:
+        return None
+    if isinstance(keywords, str):
+        keywords = [keywords]
+
+    terms = []
+    for keyword in keywords:
+        for term in keyword.split():
+            term = term.replace('"', "").replace("\\", "").lstrip("-")
+            if term and term not in terms:
+                terms.append(term)
+
+    if not terms:
+        return None
+
+    text_filter: Dict[str, Any] = {
+        "$text": {"$search": " ".join(terms), "$language": TEXT_SEARCH_LANGUAGE}
+    }
+    required = stems(" ".join(terms))
+    if required:
+        text_filter["text_stems"] = {"$all": required}
+    return text_filter
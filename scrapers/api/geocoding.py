@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Géocodage hors ligne des localisations (codes postaux et communes françaises)
+
+La table data/communes.csv (code_postal, nom_commune, departement, latitude,
+longitude) est livrée avec le projet ; la première commune de chaque
+département (la préfecture) sert de repli lorsque seul le département est connu.
+La table peut être remplacée par la base complète des codes postaux, au même format.
+
+Chaque résultat porte sa précision : "commune" (code postal ou commune de la
+table) ou "department" (repli sur la préfecture). Seule une position à la
+commune est enregistrée dans location_point et sert de centre de recherche par
+rayon : une annonce localisée au département échappe à la recherche par rayon
+plutôt que d'être placée à la préfecture.
+"""
+
+import csv
+import logging
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+from .text import tokenize
+
+logger = logging.getLogger(__name__)
+
+COMMUNES_PATH = os.path.join(os.path.dirname(__file__), "data", "communes.csv")
+
+# Rayon terrestre moyen, pour convertir un rayon en km en radians ($centerSphere)
+EARTH_RADIUS_KM = 6378.1
+
+# Nombre maximal de mots d'un nom de commune cherché dans une localisation
+MAX_NAME_WORDS = 4
+
+_POSTCODE_RE = re.compile(r"\b(\d{5})\b")
+_DEPARTMENT_RE = re.compile(r"\b(\d{2}|2[ab]|97\d)\b")
+# Département explicite entre parenthèses : "Saint-Denis (93)"
+_DEPARTMENT_IN_PARENTHESES_RE = re.compile(r"\(\s*(\d{2}|2[abAB]|97\d)\s*\)")
+_COORDINATES_RE = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$")
+
+# Précision d'une localisation géocodée
+PRECISION_COMMUNE = "commune"
+PRECISION_DEPARTMENT = "department"
+
+Coordinates = Tuple[float, float]
+Located = Tuple[Coordinates, str]
+
+def _key(value: str) -> str:
+    return " ".join(tokenize(value))
+
+class CommuneTable:
+    """
+    Table des communes indexée par code postal, par nom normalisé et par département
+
+    by_name associe à chaque nom les coordonnées de la commune dans chaque
+    département où il existe (première ligne du fichier en premier).
+    """
+
+    def __init__(self, path: str = COMMUNES_PATH):
+        self.by_postcode: Dict[str, Coordinates] = {}
+        self.by_name: Dict[str, Dict[str, Coordinates]] = {}
+        self.by_department: Dict[str, Coordinates] = {}
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    coordinates = (float(row["latitude"]), float(row["longitude"]))
+                    department = row["departement"].lower()
+                    self.by_postcode.setdefault(row["code_postal"], coordinates)
+                    self.by_name.setdefault(_key(row["nom_commune"]), {}).setdefault(department, coordinates)
+                    self.by_department.setdefault(department, coordinates)
+        except (OSError, KeyError, ValueError) as e:
+            logger.error(f"Erreur lors du chargement de la table des communes {path}: {str(e)}")
+
+    @staticmethod
+    def department_of(postcode: str) -> str:
+        """
+        Département d'un code postal (Corse et outre-mer compris)
+        """
+        if postcode.startswith("97"):
+            return postcode[:3]
+        if postcode.startswith("20"):
+            return "2a" if int(postcode) < 20200 else "2b"
+        return postcode[:2]
+
+    def geocode(self, location: str) -> Optional[Coordinates]:
+        """
+        Coordonnées (latitude, longitude) d'une localisation libre, quelle que soit leur précision
+        """
+        located = self.locate(location)
+        return located[0] if located else None
+
+    def locate(self, location: str) -> Optional[Located]:
+        """
+        Coordonnées (latitude, longitude) et précision d'une localisation libre
+
+        Ordre de résolution : code postal exact, puis nom de commune (groupes de
+        mots les plus longs d'abord) limité au département du code postal ou
+        indiqué entre parenthèses, puis département, puis numéro de département.
+        """
+        postcode_match = _POSTCODE_RE.search(location)
+        if postcode_match and postcode_match.group(1) in self.by_postcode:
+            return self.by_postcode[postcode_match.group(1)], PRECISION_COMMUNE
+
+        department = None
+        if postcode_match:
+            department = self.department_of(postcode_match.group(1))
+        else:
+            department_match = _DEPARTMENT_IN_PARENTHESES_RE.search(location)
+            if department_match:
+                department = department_match.group(1).lower()
+
+        words = _key(location).split()
+        for size in range(min(MAX_NAME_WORDS, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                communes = self.by_name.get(" ".join(words[start:start + size]))
+                if not communes:
+                    continue
+                if department is None:
+                    return next(iter(communes.values())), PRECISION_COMMUNE
+                if department in communes:
+                    return communes[department], PRECISION_COMMUNE
+
+        if department is None:
+            department_match = _DEPARTMENT_RE.search(_key(location))
+            department = department_match.group(1) if department_match else None
+
+        if department in self.by_department:
+            return self.by_department[department], PRECISION_DEPARTMENT
+        return None
+
+@lru_cache(maxsize=1)
+def get_commune_table() -> CommuneTable:
+    """
+    Table des communes, chargée au premier usage
+    """
+    return CommuneTable()
+
+@lru_cache(maxsize=10000)
+def locate(location: Optional[str]) -> Optional[Located]:
+    """
+    Coordonnées (latitude, longitude) et précision d'une localisation, ou None si elle est inconnue
+    """
+    if not location:
+        return None
+    return get_commune_table().locate(str(location))
+
+def geocode(location: Optional[str]) -> Optional[Coordinates]:
+    """
+    Coordonnées (latitude, longitude) d'une localisation à la commune près, ou None
+    """
+    located = locate(location)
+    if located is None or located[1] != PRECISION_COMMUNE:
+        return None
+    return located[0]
+
+def location_precision(location: Any) -> Optional[str]:
+    """
+    Précision du géocodage d'une localisation ("commune", "department" ou None)
+    """
+    located = locate(str(location)) if location else None
+    return located[1] if located else None
+
+def resolve_near(near: str) -> Optional[Coordinates]:
+    """
+    Centre d'une recherche par rayon : "latitude,longitude", code postal ou commune
+
+    Une localisation connue seulement au département n'est pas un centre valable.
+    """
+    coordinates_match = _COORDINATES_RE.match(near)
+    if coordinates_match:
+        latitude, longitude = float(coordinates_match.group(1)), float(coordinates_match.group(2))
+        if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+            return latitude, longitude
+        return None
+    return geocode(near)
+
+def geo_point(location: Any) -> Optional[Dict[str, Any]]:
+    """
+    Point GeoJSON d'une localisation (coordonnées dans l'ordre longitude, latitude)
+    """
+    coordinates = geocode(str(location)) if location else None
+    if coordinates is None:
+        return None
+    latitude, longitude = coordinates
+    return {"type": "Point", "coordinates": [longitude, latitude]}
+
+def radius_filter(center: Coordinates, radius_km: float) -> Dict[str, Any]:
+    """
+    Condition MongoDB sur location_point : annonces situées dans le rayon (index 2dsphere)
+    """
+    latitude, longitude = center
+    return {"$geoWithin": {"$centerSphere": [[longitude, latitude], radius_km / EARTH_RADIUS_KM]}}
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Lecture en flux des lots d'annonces envoyés à l'API (NDJSON ou tableau JSON)
+
+Les éléments sont décodés au fil de la réception du corps de la requête :
+la mémoire utilisée reste bornée par la taille d'un élément, quel que soit
+le nombre d'annonces du lot. Chaque élément est produit avec sa position ;
+un élément illisible est produit sous forme d'exception.
+"""
+
+import codecs
+import json
+from typing import Any, AsyncIterator, Tuple, Union
+
+# Taille maximale d'un élément (une annonce) en caractères
+MAX_ITEM_SIZE = 1024 * 1024
+
+ParsedItem = Tuple[int, Union[Any, ValueError]]
+
+_WHITESPACE = " \t\r\n"
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[ParsedItem]:
+    """
+    Décode un flux NDJSON (un objet JSON par ligne, lignes vides ignorées)
+
+    Une ligne invalide est signalée et la lecture continue à la ligne suivante.
+    """
+    index = 0
+    buffer = b""
+
+    def parse(line: bytes) -> ParsedItem:
+        try:
+            return index, json.loads(line)
+        except ValueError as e:
+            return index, ValueError(f"JSON invalide: {str(e)}")
+
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield parse(line)
+                index += 1
+        if len(buffer) > MAX_ITEM_SIZE:
+            yield index, ValueError("Élément trop volumineux")
+            return
+
+    if buffer.strip():
+        yield parse(buffer)
+
+async def iter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator[ParsedItem]:
+    """
+    Décode un tableau JSON élément par élément
+
+    Les éléments doivent être séparés par exactement une virgule et rien
+    d'autre que des espaces ne peut suivre le crochet fermant. Une erreur de
+    syntaxe ne permet pas de retrouver le début de l'élément suivant : elle
+    est signalée et la lecture s'arrête.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = 0
+    index = 0
+    # Partie attendue : "[" initial, élément (ou "]" si le tableau est vide),
+    # séparateur ("," ou "]") ou fin du corps
+    expected = "start"
+
+    async def chunks_then_end():
+        async for chunk in chunks:
+            yield chunk, False
+        yield b"", True
+
+    async for chunk, final in chunks_then_end():
+        try:
+            buffer = buffer[position:] + utf8.decode(chunk, final=final)
+        except UnicodeDecodeError as e:
+            yield index, ValueError(f"Encodage invalide: {str(e)}")
+            return
+        position = 0
+
+        while True:
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            if position >= len(buffer):
+                break
+            char = buffer[position]
+
+            if expected == "start":
+                if char != "[":
+                    yield index, ValueError("Le corps de la requête doit être un tableau JSON")
+                    return
+                expected = "first"
+                position += 1
+                continue
+
+            if expected == "end":
+                yield index, ValueError("Données après la fin du tableau JSON")
+                return
+
+            if expected == "separator":
+                if char == ",":
+                    expected = "item"
+                elif char == "]":
+                    expected = "end"
+                else:
+                    yield index, ValueError("Virgule attendue entre les éléments du tableau JSON")
+                    return
+                position += 1
+                continue
+
+            if char == "]" and expected == "first":
+                expected = "end"
+                position += 1
+                continue
+            if char in ",]":
+                yield index, ValueError("Élément attendu dans le tableau JSON")
+                return
+
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except ValueError as e:
+                if final:
+                    yield index, ValueError(f"JSON invalide: {str(e)}")
+                    return
+                if len(buffer) - position > MAX_ITEM_SIZE:
+                    yield index, ValueError("Élément trop volumineux")
+                    return
+                break
+
+            # Un nombre en fin de tampon peut être incomplet : attendre la suite
+            if end >= len(buffer) and not final:
+                break
+
+            yield index, item
+            index += 1
+            position = end
+            expected = "separator"
+
+    if expected == "start":
+        yield index, ValueError("Le corps de la requête doit être un tableau JSON")
+    elif expected != "end":
+        yield index, ValueError("Tableau JSON non terminé")
@@ -7,7 +7,10 @@ Application principale de l'API DriveDeal
 
 import os
 import sys
+import asyncio
 import logging
+from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, status
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
@@ -22,6 +25,13 @@ from .routers import (
     favorites_router, alerts_router, admin_router
 )
 from .config import settings
+from .dependencies import connect_to_database, close_database_connection, services
+from .middleware import ResponseCacheMiddleware
+from .events import alert_dispatch_loop, alert_polling_loop, car_change_stream_loop
+from .notifications import notification_dispatch_loop
+from .search_history import search_history_loop, popular_searches_loop
+from .similarity import similarity_index
+from .cache import get_ingest_generation
 
 # Configuration du logging
 logging.basicConfig(
@@ -35,6 +45,92 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+async def market_snapshot_loop(db):
+    """
+    Calcule périodiquement les instantanés quotidiens du marché
+    """
+    while True:
+        try:
+            await services.market_snapshot_service.rollup_recent(db, settings.MARKET_SNAPSHOT_ROLLUP_DAYS)
+        except Exception as e:
+            logger.error(f"Erreur lors du calcul des instantanés du marché: {str(e)}")
+        await asyncio.sleep(settings.MARKET_SNAPSHOT_INTERVAL_HOURS * 3600)
+
+async def autocomplete_refresh_loop(db):
+    """
+    Reconstruit périodiquement l'index d'autocomplétion
+    """
+    while True:
+        try:
+            await services.search_service.refresh_autocomplete(db)
+        except Exception as e:
+            logger.error(f"Erreur lors de la reconstruction de l'index d'autocomplétion: {str(e)}")
+        await asyncio.sleep(settings.AUTOCOMPLETE_REFRESH_MINUTES * 60)
+
+async def similarity_refresh_loop(db):
+    """
+    Reconstruit l'index des annonces similaires après une ingestion, ou
+    lorsqu'il est trop ancien (annonces écrites par d'autres processus)
+    """
+    max_age = timedelta(minutes=settings.SIMILAR_CARS_MAX_AGE_MINUTES)
+    while True:
+        try:
+            stale = (
+                not similarity_index
+                or similarity_index.generation != get_ingest_generation()
+                or datetime.utcnow() - similarity_index.built_at > max_age
+            )
+            if stale:
+                await services.car_service.refresh_similarity_index(db)
+        except Exception as e:
+            logger.error(f"Erreur lors de la reconstruction de l'index des annonces similaires: {str(e)}")
+        await asyncio.sleep(settings.SIMILAR_CARS_CHECK_SECONDS)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Cycle de vie de l'application : connexion MongoDB, index, services et tâches de fond
+    """
+    db = await connect_to_database()
+    app.state.db = db
+    app.state.services = services
+    
+    try:
+        await services.market_snapshot_service.ensure_indexes(db)
+        await services.alerts_service.ensure_indexes(db)
+        await services.notification_service.ensure_indexes(db)
+        await services.favorites_service.ensure_indexes(db)
+        await services.car_service.ensure_indexes(db)
+        await services.search_service.ensure_indexes(db)
+    except Exception as e:
+        logger.error(f"Erreur lors de la création des index: {str(e)}")
+    
+    # Compteurs de non-lus des alertes créées avant leur introduction
+    await services.alerts_service.backfill_unread_counters(db)
+    
+    background_tasks = [
+        asyncio.create_task(services.car_service.normalize_existing_cars(db)),
+        asyncio.create_task(market_snapshot_loop(db)),
+        asyncio.create_task(autocomplete_refresh_loop(db)),
+        asyncio.create_task(similarity_refresh_loop(db)),
+        asyncio.create_task(search_history_loop(db)),
+        asyncio.create_task(popular_searches_loop(db)),
+        asyncio.create_task(alert_dispatch_loop(db, services.alerts_service)),
+        asyncio.create_task(alert_polling_loop(db, services.alerts_service)),
+        asyncio.create_task(notification_dispatch_loop(db, services.notification_service))
+    ]
+    if settings.ALERT_CHANGE_STREAM_ENABLED:
+        background_tasks.append(asyncio.create_task(car_change_stream_loop(db)))
+    
+    try:
+        yield
+    finally:
+        # Arrêt : annulation des tâches de fond puis fermeture du client
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        await close_database_connection()
+
 # Création de l'application FastAPI
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -43,6 +139,7 @@ app = FastAPI(
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     docs_url=f"{settings.API_V1_STR}/docs",
     redoc_url=f"{settings.API_V1_STR}/redoc",
+    lifespan=lifespan
 )
 
 # Configuration des CORS
@@ -64,6 +161,15 @@ else:
         allow_headers=["*"],
     )
 
+# Cache des réponses des routes en lecture seule
+if settings.RESPONSE_CACHE_ENABLED:
+    app.add_middleware(
+        ResponseCacheMiddleware,
+        paths=[f"{settings.API_V1_STR}{path}" for path in settings.RESPONSE_CACHE_PATHS],
+        ttl=settings.RESPONSE_CACHE_TTL_SECONDS,
+        max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES
+    )
+
 # Montage des fichiers statiques
 app.mount("/static", StaticFiles(directory="scrapers/api/static"), name="static")
 
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Middlewares pour l'API
+"""
+
+import hashlib
+import logging
+from typing import Iterable, List, Tuple
+
+from fastapi import Request
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import Response
+
+from .cache import TTLCache, get_ingest_generation, shared_store
+
+logger = logging.getLogger(__name__)
+
+class ResponseCacheMiddleware(BaseHTTPMiddleware):
+    """
+    Cache des réponses des routes en lecture seule
+
+    Les réponses GET des préfixes configurés sont mises en cache par route,
+    paramètres normalisés et génération des données : toute ingestion
+    d'annonces invalide le cache. Les réponses portent ETag et Cache-Control,
+    et If-None-Match est honoré par une réponse 304.
+    """
+
+    def __init__(self, app, paths: Iterable[str], ttl: int = 300, max_entries: int = 1024):
+        super().__init__(app)
+        self.paths = tuple(paths)
+        self.ttl = ttl
+        self.local_cache = TTLCache(maxsize=max_entries, ttl=ttl)
+
+    async def dispatch(self, request: Request, call_next) -> Response:
+        if request.method != "GET" or not request.url.path.startswith(self.paths):
+            return await call_next(request)
+
+        key = (request.url.path, self._normalize_params(request.query_params.multi_items()), get_ingest_generation())
+
+        found, cached = self.local_cache.get(key)
+        if not found and shared_store is not None:
+            found, cached = shared_store.get(key)
+            if found:
+                self.local_cache.set(key, cached)
+
+        if found:
+            return self._build_response(request, cached, "HIT")
+
+        response = await call_next(request)
+        if response.status_code != 200:
+            return response
+
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        headers = {
+            name: value for name, value in response.headers.items()
+            if name.lower() not in ("content-length", "etag", "cache-control")
+        }
+        cached = {
+            "body": body,
+            "headers": headers,
+            "media_type": response.media_type,
+            "etag": f'"{hashlib.sha1(body).hexdigest()}"'
+        }
+
+        self.local_cache.set(key, cached)
+        if shared_store is not None:
+            try:
+                shared_store.set(key, cached, self.ttl)
+            except Exception as e:
+                logger.warning(f"Impossible d'écrire dans le cache partagé: {str(e)}")
+
+        return self._build_response(request, cached, "MISS")
+
+    def _build_response(self, request: Request, cached: dict, cache_status: str) -> Response:
+        """
+        Construit la réponse à partir d'une entrée du cache (ou 304 si l'ETag correspond)
+        """
+        headers = {
+            "ETag": cached["etag"],
+            "Cache-Control": f"public, max-age={self.ttl}",
+            "X-Cache": cache_status
+        }
+
+        if self._etag_matches(request.headers.get("if-none-match"), cached["etag"]):
+            return Response(status_code=304, headers=headers)
+
+        return Response(
+            content=cached["body"],
+            status_code=200,
+            headers={**cached["headers"], **headers},
+            media_type=cached["media_type"]
+        )
+
+    @staticmethod
+    def _normalize_params(items: List[Tuple[str, str]]) -> Tuple[Tuple[str, str], ...]:
+        """
+        Normalise les paramètres de requête (tri, suppression des valeurs vides)
+        """
+        return tuple(sorted((name, value.strip()) for name, value in items if value.strip()))
+
+    @staticmethod
+    def _etag_matches(if_none_match: str, etag: str) -> bool:
+        """
+        Vérifie si l'en-tête If-None-Match correspond à l'ETag
+        """
+        if not if_none_match:
+            return False
+        candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+        return "*" in candidates or any(
+            candidate.removeprefix("W/") == etag for candidate in candidates
+        )
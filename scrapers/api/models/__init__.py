@@ -7,11 +7,12 @@ Package des modèles pour l'API
 
 from .car import (
     Car, CarCreate, CarUpdate, CarResponse, CarsListResponse,
-    PriceAnalysis, SimilarCarsResponse
+    PriceAnalysis, SimilarCarsResponse, BulkItemStatus, BulkIngestResponse
 )
 
 from .search import (
-    SearchQuery, SearchSuggestion
+    SearchQuery, SearchSuggestion, SearchFilters, SearchRequest,
+    SearchHistory, SavedSearch
 )
 
 from .stats import (
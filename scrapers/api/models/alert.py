@@ -74,6 +74,7 @@ class Alert(AlertBase):
     last_run: Optional[datetime] = None
     last_match_count: int = 0
     total_match_count: int = 0
+    unread_match_count: int = 0
     
     class Config:
         from_attributes = True
@@ -59,6 +59,7 @@ class User(UserBase):
     created_at: datetime
     updated_at: datetime
     last_login: Optional[datetime] = None
+    token_version: int = 0
 
     class Config:
         orm_mode = True
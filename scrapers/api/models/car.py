@@ -35,14 +35,25 @@ class Car(BaseModel):
     source: str
     source_id: Optional[str] = None
     is_good_deal: bool = False
+    vehicle_cluster_id: Optional[str] = None
+    
+    # Historique des prix (une entrée par changement) et champs dérivés
+    price_history: List[Dict[str, Any]] = []
+    price_drop: float = 0.0
+    last_price_drop_at: Optional[datetime] = None
+    first_seen_at: Optional[datetime] = None
+    days_on_market: Optional[int] = None
+    
     created_at: datetime
     updated_at: datetime
     
     # Champs supplémentaires pour les favoris
+    is_favorite: bool = False
     favorite_id: Optional[str] = None
     favorite_note: Optional[int] = None
     favorite_comments: Optional[str] = None
     favorite_created_at: Optional[datetime] = None
+    favorite_price_at_add: Optional[float] = None
     
     class Config:
         from_attributes = True
@@ -136,4 +147,27 @@ class CarsListResponse(BaseModel):
     total: int
     page: int
     page_size: int
-    pages: int 
\ No newline at end of file
+    pages: int
+
+
+class BulkItemStatus(BaseModel):
+    """
+    Résultat de l'ingestion d'une annonce d'un lot
+    """
+    index: int
+    status: str  # "created", "updated", "duplicate" ou "error"
+    id: Optional[str] = None
+    source_id: Optional[str] = None
+    is_good_deal: Optional[bool] = None
+    error: Optional[str] = None
+
+
+class BulkIngestResponse(BaseModel):
+    """
+    Modèle de données pour la réponse d'une ingestion en masse
+    """
+    received: int
+    created: int
+    updated: int
+    errors: int
+    items: List[BulkItemStatus]
@@ -19,6 +19,15 @@ class FavoriteBase(BaseModel):
     note: Optional[int] = Field(None, ge=1, le=5)  # Note de 1 à 5
     comments: Optional[str] = None
 
+class FavoriteSnapshot(BaseModel):
+    """
+    Copie dénormalisée de l'annonce conservée sur le favori
+    """
+    title: Optional[str] = None
+    price: Optional[float] = None
+    thumbnail: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
 class FavoriteCreate(FavoriteBase):
     """
     Modèle de données pour la création d'un favori
@@ -33,6 +42,9 @@ class Favorite(FavoriteBase):
     user_id: str
     created_at: datetime
     updated_at: datetime
+    price_at_add: Optional[float] = None
+    snapshot: Optional[FavoriteSnapshot] = None
+    price_drop: Optional[float] = None
     
     class Config:
         from_attributes = True
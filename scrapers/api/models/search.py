@@ -51,7 +51,9 @@ class SearchFilters(BaseModel):
     fuel_types: Optional[List[FuelType]] = None
     transmission_types: Optional[List[TransmissionType]] = None
     location: Optional[str] = None
-    radius: Optional[int] = None  # Rayon en km
+    radius: Optional[int] = Field(None, gt=0, le=1000)  # Rayon en km (ancien nom de radius_km)
+    near: Optional[str] = None  # Centre de la recherche par rayon (commune, code postal ou "lat,lon")
+    radius_km: Optional[float] = Field(None, gt=0, le=1000)
     keywords: Optional[List[str]] = None
     sources: Optional[List[str]] = None
     good_deals_only: bool = False
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Normalisation des marques, modèles et localisations des annonces
+
+Les champs *_norm (minuscules, sans accents ni ponctuation, noms canoniques)
+sont calculés à l'enregistrement : les filtres les interrogent par égalité ou
+par préfixe ancré, ce qui permet d'utiliser les index.
+"""
+
+import re
+from typing import Any, Dict, List, Mapping, Pattern
+
+from .geocoding import geo_point, location_precision
+from .text import tokenize
+
+# Variantes de marques -> marque canonique (clés et valeurs normalisées)
+BRAND_ALIASES = {
+    "vw": "volkswagen",
+    "mercedes": "mercedes benz",
+    "mb": "mercedes benz",
+    "alfa": "alfa romeo",
+    "aston": "aston martin",
+    "rolls": "rolls royce",
+    "landrover": "land rover",
+    "range rover": "land rover",
+    "ds automobiles": "ds",
+    "chevy": "chevrolet",
+    "citroen ds": "ds",
+    "bmw alpina": "alpina",
+    "mini cooper": "mini",
+}
+
+# Variantes de modèles par marque canonique -> modèle canonique
+MODEL_ALIASES: Dict[str, Dict[str, str]] = {
+    "mercedes benz": {
+        **{f"{letter} klasse": f"classe {letter}" for letter in "abcegsv"},
+        **{f"{letter} class": f"classe {letter}" for letter in "abcegsv"},
+        **{f"class {letter}": f"classe {letter}" for letter in "abcegsv"},
+    },
+    "bmw": {
+        **{f"{number} series": f"serie {number}" for number in range(1, 9)},
+        **{f"{number}er": f"serie {number}" for number in range(1, 9)},
+        **{f"series {number}": f"serie {number}" for number in range(1, 9)},
+    },
+    "land rover": {
+        "range": "range rover",
+        "rr evoque": "range rover evoque",
+        "evoque": "range rover evoque",
+        "rr sport": "range rover sport",
+    },
+    "volkswagen": {
+        "coccinelle": "beetle",
+    },
+}
+
+def normalize_key(value: Any) -> str:
+    """
+    Minuscules, sans accents, mots séparés par une espace ("Île-de-France" -> "ile de france")
+    """
+    if value is None:
+        return ""
+    return " ".join(tokenize(str(value)))
+
+def normalize_brand(brand: Any) -> str:
+    """
+    Retourne la marque canonique normalisée ("Citroën" -> "citroen", "VW" -> "volkswagen")
+    """
+    key = normalize_key(brand)
+    return BRAND_ALIASES.get(key, key)
+
+def normalize_model(model: Any, brand: Any = None) -> str:
+    """
+    Retourne le modèle canonique normalisé, sans la marque en tête ("Peugeot 208" -> "208")
+    """
+    key = normalize_key(model)
+    brand_key = normalize_brand(brand) if brand else ""
+    if not key or not brand_key:
+        return key
+
+    prefixes = [brand_key] + [alias for alias, canonical in BRAND_ALIASES.items() if canonical == brand_key]
+    for prefix in sorted(prefixes, key=len, reverse=True):
+        if key.startswith(prefix + " "):
+            key = key[len(prefix) + 1:]
+            break
+
+    return MODEL_ALIASES.get(brand_key, {}).get(key, key)
+
+def location_tokens(location: Any) -> List[str]:
+    """
+    Mots d'une localisation (ville, département, code postal), sans doublon
+    """
+    return list(dict.fromkeys(tokenize(str(location)))) if location else []
+
+def normalized_fields(car: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    Calcule les champs normalisés d'une annonce (brand_norm, model_norm,
+    location_norm, location_tokens), sa position géocodée à la commune près
+    (location_point) et la précision du géocodage (location_precision)
+    """
+    return {
+        "brand_norm": normalize_brand(car.get("brand")) or None,
+        "model_norm": normalize_model(car.get("model"), car.get("brand")) or None,
+        "location_norm": normalize_key(car.get("location")) or None,
+        "location_tokens": location_tokens(car.get("location")),
+        "location_point": geo_point(car.get("location")),
+        "location_precision": location_precision(car.get("location")),
+    }
+
+def prefix_pattern(normalized: str) -> Pattern:
+    """
+    Expression régulière ancrée et sensible à la casse (utilisable par un index)
+    """
+    return re.compile(f"^{re.escape(normalized)}")
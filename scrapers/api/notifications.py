@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Envoi des notifications par email : expéditeurs et pool de workers
+"""
+
+import asyncio
+import logging
+from datetime import timedelta
+from email.message import EmailMessage
+from typing import Any, Dict, List
+
+import aiosmtplib
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+class SMTPEmailSender:
+    """
+    Expéditeur SMTP réutilisant une connexion ouverte entre les envois
+    """
+
+    def __init__(self):
+        self._client = None
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        client = aiosmtplib.SMTP(
+            hostname=settings.SMTP_HOST,
+            port=settings.SMTP_PORT,
+            start_tls=settings.SMTP_TLS
+        )
+        await client.connect()
+        if settings.SMTP_USER:
+            await client.login(settings.SMTP_USER, settings.SMTP_PASSWORD or "")
+        return client
+
+    async def send(self, message: EmailMessage) -> None:
+        """
+        Envoie un message, en rouvrant la connexion une fois si elle a été fermée
+        """
+        for attempt in range(2):
+            if self._client is None or not self._client.is_connected:
+                self._client = await self._connect()
+            try:
+                await self._client.send_message(message)
+                return
+            except aiosmtplib.SMTPServerDisconnected:
+                self._client = None
+                if attempt == 1:
+                    raise
+
+    async def close(self) -> None:
+        """
+        Ferme la connexion SMTP
+        """
+        if self._client is not None and self._client.is_connected:
+            try:
+                await self._client.quit()
+            except aiosmtplib.SMTPException:
+                pass
+        self._client = None
+
+class MemoryEmailSender:
+    """
+    Expéditeur local conservant les messages en mémoire (tests, développement)
+    """
+
+    def __init__(self):
+        self.outbox: List[EmailMessage] = []
+
+    async def send(self, message: EmailMessage) -> None:
+        self.outbox.append(message)
+        logger.info(f"Email non envoyé (backend mémoire) à {message['To']}: {message['Subject']}")
+
+    async def close(self) -> None:
+        pass
+
+def create_email_sender():
+    """
+    Crée l'expéditeur selon EMAIL_BACKEND ("smtp" ou "memory")
+    """
+    if settings.EMAIL_BACKEND == "smtp" and settings.SMTP_HOST:
+        return SMTPEmailSender()
+    return MemoryEmailSender()
+
+def build_digest_message(digest: Dict[str, Any]) -> EmailMessage:
+    """
+    Construit l'email résumant les notifications d'un utilisateur
+    """
+    items = digest["items"]
+    total_matches = sum(item.get("matches_count", 0) for item in items)
+
+    lines = ["Bonjour,", "", "De nouvelles annonces correspondent à vos alertes :", ""]
+    for item in items:
+        lines.append(f"- {item.get('alert_name', 'Sans nom')} : {item.get('matches_count', 0)} nouvelle(s) annonce(s)")
+    lines.extend(["", f"L'équipe {settings.PROJECT_NAME}"])
+
+    message = EmailMessage()
+    message["From"] = f"{settings.EMAILS_FROM_NAME or settings.PROJECT_NAME} <{settings.EMAILS_FROM_EMAIL}>"
+    message["To"] = digest["email"]
+    message["Subject"] = f"{total_matches} nouvelle(s) annonce(s) pour vos alertes"
+    message.set_content("\n".join(lines))
+    return message
+
+async def notification_dispatch_loop(db: AsyncIOMotorDatabase, notification_service) -> None:
+    """
+    Réserve les résumés prêts et les distribue à un pool de workers
+
+    Chaque worker garde sa propre connexion SMTP ; la file bornée évite de
+    réserver plus de résumés que le pool ne peut en envoyer.
+    """
+    workers_count = settings.NOTIFICATION_WORKERS
+    queue: asyncio.Queue = asyncio.Queue(maxsize=workers_count * 2)
+    window = timedelta(minutes=settings.NOTIFICATION_DIGEST_WINDOW_MINUTES)
+
+    async def worker(sender) -> None:
+        while True:
+            digest = await queue.get()
+            try:
+                if digest["email"]:
+                    await sender.send(build_digest_message(digest))
+                await notification_service.mark_sent(db, digest["claim_id"])
+            except Exception as e:
+                logger.error(f"Erreur lors de l'envoi du résumé à l'utilisateur {digest['user_id']}: {str(e)}")
+                try:
+                    await notification_service.mark_failed(
+                        db,
+                        digest["claim_id"],
+                        settings.NOTIFICATION_MAX_ATTEMPTS,
+                        retry_delay=timedelta(seconds=settings.NOTIFICATION_RETRY_BASE_SECONDS),
+                        max_retry_delay=timedelta(seconds=settings.NOTIFICATION_RETRY_MAX_SECONDS)
+                    )
+                except Exception as e:
+                    logger.error(f"Erreur lors de la remise en file du résumé: {str(e)}")
+            finally:
+                queue.task_done()
+
+    senders = [create_email_sender() for _ in range(workers_count)]
+    workers = [asyncio.create_task(worker(sender)) for sender in senders]
+    try:
+        while True:
+            try:
+                digests = await notification_service.claim_digests(db, window, limit=settings.NOTIFICATION_BATCH_SIZE)
+                for digest in digests:
+                    await queue.put(digest)
+                if len(digests) == settings.NOTIFICATION_BATCH_SIZE:
+                    continue
+            except Exception as e:
+                logger.error(f"Erreur lors de la préparation des résumés de notifications: {str(e)}")
+            await asyncio.sleep(settings.NOTIFICATION_POLL_SECONDS)
+    finally:
+        for task in workers:
+            task.cancel()
+        for sender in senders:
+            await sender.close()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Historique des prix des annonces : changements de prix, baisse et ancienneté
+
+L'historique (price_history) ne conserve qu'une entrée {"date", "price"} par
+changement de prix. Les champs dérivés sont mis à jour à chaque enregistrement :
+price_peak (prix le plus haut relevé), price_drop (baisse relative depuis ce
+pic), last_price_drop_at (date de la dernière baisse), first_seen_at et
+days_on_market. L'index (last_price_drop_at, price_drop) sert de présélection
+pour les recherches "baisse de plus de X % depuis N jours", affinées ensuite
+sur l'historique.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Optional
+
+# Nombre maximal d'entrées conservées (la première et les plus récentes)
+PRICE_HISTORY_MAX_ENTRIES = 50
+
+def _as_datetime(value: Any) -> Optional[datetime]:
+    """
+    Convertit une date stockée (datetime ou chaîne ISO) en datetime
+    """
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return None
+
+def _valid_price(price: Any) -> bool:
+    return isinstance(price, (int, float)) and not isinstance(price, bool) and price > 0
+
+def track_price(previous: Optional[Mapping[str, Any]], price: Any, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Calcule les champs d'historique d'une annonce enregistrée au prix `price`
+
+    `previous` est la version déjà stockée de l'annonce (None pour une
+    nouvelle annonce) ; une entrée n'est ajoutée que si le prix a changé.
+    """
+    now = now or datetime.utcnow()
+    previous = previous or {}
+
+    first_seen_at = (
+        _as_datetime(previous.get("first_seen_at"))
+        or _as_datetime(previous.get("created_at"))
+        or now
+    )
+    history: List[Dict[str, Any]] = list(previous.get("price_history") or [])
+    if not history and _valid_price(previous.get("price")):
+        history.append({"date": first_seen_at.isoformat(), "price": previous["price"]})
+
+    peak = previous.get("price_peak")
+    if not _valid_price(peak):
+        peak = max((entry["price"] for entry in history), default=None)
+    last_drop_at = _as_datetime(previous.get("last_price_drop_at"))
+
+    if _valid_price(price):
+        last_price = history[-1]["price"] if history else None
+        if price != last_price:
+            history.append({"date": now.isoformat(), "price": price})
+            if last_price is not None and price < last_price:
+                last_drop_at = now
+        peak = max(peak or price, price)
+
+    if len(history) > PRICE_HISTORY_MAX_ENTRIES:
+        history = history[:1] + history[-(PRICE_HISTORY_MAX_ENTRIES - 1):]
+
+    current = history[-1]["price"] if history else None
+    return {
+        "price_history": history,
+        "price_peak": peak,
+        "price_drop": round((peak - current) / peak, 4) if peak and current else 0.0,
+        "last_price_drop_at": last_drop_at,
+        "first_seen_at": first_seen_at,
+        "days_on_market": max((now - first_seen_at).days, 0),
+    }
+
+def price_drop_since(history: List[Mapping[str, Any]], since: datetime) -> float:
+    """
+    Baisse relative du prix depuis `since` : du prix le plus haut en vigueur
+    sur la période jusqu'au prix actuel (0 si le prix n'a pas baissé)
+    """
+    if not history:
+        return 0.0
+
+    reference = None
+    for entry in history:
+        date = _as_datetime(entry.get("date"))
+        if date is not None and date <= since:
+            reference = entry["price"]
+        elif reference is None or entry["price"] > reference:
+            reference = entry["price"]
+
+    current = history[-1]["price"]
+    if not reference or current >= reference:
+        return 0.0
+    return round((reference - current) / reference, 4)
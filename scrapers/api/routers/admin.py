@@ -11,12 +11,12 @@ from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException, Path, Query, Body, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
-from ..dependencies import get_db, get_admin_user
+from ..config import settings
+from ..dependencies import get_db, get_admin_user, services
 from ..models import (
     AdminStats, UserListResponse, User, UserCreate,
     SystemLogResponse, ScraperJobCreate, ScraperJobResponse, ScraperJobsListResponse
 )
-from ..services.admin_service import AdminService
 
 logger = logging.getLogger(__name__)
 
@@ -26,7 +26,9 @@ router = APIRouter(
     responses={403: {"description": "Accès interdit"}}
 )
 
-admin_service = AdminService()
+admin_service = services.admin_service
+deal_scoring_service = services.deal_scoring_service
+market_snapshot_service = services.market_snapshot_service
 
 @router.get("/stats", response_model=AdminStats)
 async def get_admin_stats(
@@ -316,4 +318,45 @@ async def clean_old_data(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Une erreur est survenue lors du nettoyage des anciennes données"
-        ) 
\ No newline at end of file
+        )
+
+@router.post("/rescore-deals", response_model=Dict[str, int])
+async def rescore_deals(
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user = Depends(get_admin_user)
+):
+    """
+    Recalcule l'indicateur de bonne affaire pour toutes les annonces
+    """
+    try:
+        return await deal_scoring_service.rescore_all(db)
+    
+    except Exception as e:
+        logger.error(f"Erreur lors du recalcul des bonnes affaires: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Une erreur est survenue lors du recalcul des bonnes affaires"
+        )
+
+@router.post("/market-snapshots/rollup", response_model=Dict[str, int])
+async def rollup_market_snapshots(
+    days: int = Query(2, ge=1, le=3650, description="Nombre de jours à recalculer"),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user = Depends(get_admin_user)
+):
+    """
+    Recalcule les instantanés quotidiens du marché
+    
+    Les jours plus anciens que la rétention des annonces (DB_CLEANUP_OLDER_THAN_DAYS)
+    ne sont pas recalculés : leurs instantanés sont conservés tels quels.
+    """
+    try:
+        snapshots = await market_snapshot_service.rollup_recent(db, min(days, settings.DB_CLEANUP_OLDER_THAN_DAYS))
+        return {"snapshots_updated": snapshots}
+    
+    except Exception as e:
+        logger.error(f"Erreur lors du calcul des instantanés du marché: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Une erreur est survenue lors du calcul des instantanés du marché"
+        )
@@ -10,11 +10,10 @@ from typing import Dict, List
 from fastapi import APIRouter, Depends, HTTPException, Path, Query, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
-from ..dependencies import get_db, get_current_user
+from ..dependencies import get_db, get_current_user, services
 from ..models import (
     AlertCreate, AlertUpdate, AlertResponse, AlertMatch, AlertsListResponse
 )
-from ..services.alerts_service import AlertsService
 
 logger = logging.getLogger(__name__)
 
@@ -24,7 +23,7 @@ router = APIRouter(
     responses={404: {"description": "Alerte non trouvée"}}
 )
 
-alerts_service = AlertsService()
+alerts_service = services.alerts_service
 
 @router.get("/", response_model=AlertsListResponse)
 async def get_alerts(
@@ -6,15 +6,20 @@ Routes pour la gestion des annonces de voitures
 """
 
 import logging
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, Path, status
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Path, Request, status
+from fastapi.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
-from ..dependencies import get_db, get_current_user, get_current_user_optional
+from ..config import settings
+from ..dependencies import get_db, get_current_user, get_current_user_optional, services
+from ..geocoding import resolve_near
+from ..ingest import iter_json_array, iter_ndjson
 from ..models import (
-    Car, CarCreate, CarUpdate, CarResponse, CarsListResponse
+    Car, CarCreate, CarUpdate, CarResponse, CarsListResponse, BulkIngestResponse
 )
-from ..services.car_service import CarService
+from ..services.car_service import EXPORT_DEFAULT_FIELDS, EXPORT_FIELDS
 
 logger = logging.getLogger(__name__)
 
@@ -24,14 +29,9 @@ router = APIRouter(
     responses={404: {"description": "Annonce non trouvée"}}
 )
 
-car_service = CarService()
+car_service = services.car_service
 
-@router.get("/", response_model=CarsListResponse)
-async def get_cars(
-    db: AsyncIOMotorDatabase = Depends(get_db),
-    page: int = Query(1, ge=1, description="Numéro de page"),
-    page_size: int = Query(20, ge=1, le=100, description="Nombre d'éléments par page"),
-    sort_by: str = Query("created_at_desc", description="Critère de tri"),
+def car_filters(
     brand: Optional[str] = Query(None, description="Marque"),
     model: Optional[str] = Query(None, description="Modèle"),
     price_min: Optional[float] = Query(None, ge=0, description="Prix minimum"),
@@ -43,50 +43,77 @@ async def get_cars(
     fuel_type: Optional[str] = Query(None, description="Type de carburant"),
     transmission: Optional[str] = Query(None, description="Type de transmission"),
     location: Optional[str] = Query(None, description="Localisation"),
+    near: Optional[str] = Query(None, description="Centre de la recherche par rayon (commune, code postal ou \"latitude,longitude\")"),
+    radius_km: float = Query(50, gt=0, le=1000, description="Rayon de recherche en km autour de near"),
     source: Optional[str] = Query(None, description="Source"),
     good_deals_only: bool = Query(False, description="Uniquement les bonnes affaires"),
     keywords: Optional[str] = Query(None, description="Mots-clés"),
+    distinct_vehicles: bool = Query(False, description="Une seule annonce par véhicule (doublons entre sources regroupés)")
+) -> Dict[str, Any]:
+    """
+    Construit les filtres des annonces à partir des paramètres de la requête
+    """
+    filters = {}
+    if brand:
+        filters["brand"] = brand
+    if model:
+        filters["model"] = model
+    if price_min is not None:
+        filters["price_min"] = price_min
+    if price_max is not None:
+        filters["price_max"] = price_max
+    if year_min is not None:
+        filters["year_min"] = year_min
+    if year_max is not None:
+        filters["year_max"] = year_max
+    if mileage_min is not None:
+        filters["mileage_min"] = mileage_min
+    if mileage_max is not None:
+        filters["mileage_max"] = mileage_max
+    if fuel_type:
+        filters["fuel_type"] = fuel_type
+    if transmission:
+        filters["transmission"] = transmission
+    if location:
+        filters["location"] = location
+    if near:
+        center = resolve_near(near)
+        if center is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Localisation inconnue ou imprécise: {near}"
+            )
+        filters["near"] = center
+        filters["radius_km"] = radius_km
+    if source:
+        filters["source"] = source
+    if good_deals_only:
+        filters["good_deals_only"] = good_deals_only
+    if keywords:
+        filters["keywords"] = keywords
+    if distinct_vehicles:
+        filters["distinct_vehicles"] = distinct_vehicles
+    return filters
+
+@router.get("/", response_model=CarsListResponse)
+async def get_cars(
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    page: int = Query(1, ge=1, description="Numéro de page"),
+    page_size: int = Query(20, ge=1, le=100, description="Nombre d'éléments par page"),
+    sort_by: str = Query("created_at_desc", description="Critère de tri"),
+    filters: Dict[str, Any] = Depends(car_filters),
     current_user = Depends(get_current_user_optional)
 ):
     """
     Récupère une liste d'annonces de voitures avec pagination et filtres
     """
     try:
-        # Construire les filtres
-        filters = {}
-        if brand:
-            filters["brand"] = brand
-        if model:
-            filters["model"] = model
-        if price_min is not None:
-            filters["price_min"] = price_min
-        if price_max is not None:
-            filters["price_max"] = price_max
-        if year_min is not None:
-            filters["year_min"] = year_min
-        if year_max is not None:
-            filters["year_max"] = year_max
-        if mileage_min is not None:
-            filters["mileage_min"] = mileage_min
-        if mileage_max is not None:
-            filters["mileage_max"] = mileage_max
-        if fuel_type:
-            filters["fuel_type"] = fuel_type
-        if transmission:
-            filters["transmission"] = transmission
-        if location:
-            filters["location"] = location
-        if source:
-            filters["source"] = source
-        if good_deals_only:
-            filters["good_deals_only"] = good_deals_only
-        if keywords:
-            filters["keywords"] = keywords
-        
         # Récupérer les annonces
         user_id = str(current_user["id"]) if current_user else None
         return await car_service.get_cars(db, page, page_size, sort_by, filters, user_id)
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erreur lors de la récupération des annonces: {str(e)}")
         raise HTTPException(
@@ -94,6 +121,54 @@ async def get_cars(
             detail="Une erreur est survenue lors de la récupération des annonces"
         )
 
+@router.get("/export")
+async def export_cars(
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="Format d'export (ndjson ou csv)"),
+    fields: Optional[str] = Query(None, description="Champs exportés, séparés par des virgules"),
+    filters: Dict[str, Any] = Depends(car_filters),
+    current_user = Depends(get_current_user)
+):
+    """
+    Exporte en flux les annonces correspondant aux filtres (administrateurs et partenaires)
+    
+    Les annonces sont lues par grands lots depuis un curseur et écrites au fil
+    de l'eau : la mémoire utilisée ne dépend pas du nombre d'annonces exportées.
+    Une erreur en cours d'export interrompt la connexion : le fichier reçu
+    est alors incomplet et signalé comme tel par le client HTTP.
+    """
+    try:
+        # Vérifier si l'utilisateur est administrateur ou partenaire
+        if not current_user.get("is_admin", False) and current_user.get("email") not in settings.EXPORT_PARTNER_EMAILS:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Seuls les administrateurs et les partenaires peuvent exporter les annonces"
+            )
+        
+        selected = [field.strip() for field in fields.split(",") if field.strip()] if fields else list(EXPORT_DEFAULT_FIELDS)
+        unknown = [field for field in selected if field not in EXPORT_FIELDS]
+        if unknown or not selected:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Champs inconnus: {', '.join(unknown)}" if unknown else "Aucun champ demandé"
+            )
+        
+        filename = f"cars_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{format}"
+        return StreamingResponse(
+            car_service.export_cars(db, filters, selected, format, batch_size=settings.EXPORT_BATCH_SIZE),
+            media_type="text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erreur lors de l'export des annonces: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Une erreur est survenue lors de l'export des annonces"
+        )
+
 @router.get("/{car_id}", response_model=CarResponse)
 async def get_car(
     car_id: str = Path(..., description="ID de l'annonce"),
@@ -162,6 +237,46 @@ async def create_car(
             detail="Une erreur est survenue lors de la création de l'annonce"
         )
 
+@router.post("/bulk", response_model=BulkIngestResponse)
+async def bulk_create_cars(
+    request: Request,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    Crée ou met à jour un lot d'annonces (réservé aux administrateurs)
+    
+    Le corps est un tableau JSON ou, avec le type application/x-ndjson, une
+    annonce JSON par ligne. Les annonces sont identifiées par (source,
+    source_id) ; le résultat est détaillé annonce par annonce.
+    """
+    try:
+        # Vérifier si l'utilisateur est administrateur
+        if not current_user.get("is_admin", False):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Seuls les administrateurs peuvent créer des annonces"
+            )
+        
+        content_type = request.headers.get("content-type", "")
+        parse = iter_ndjson if "ndjson" in content_type or "jsonl" in content_type else iter_json_array
+        
+        return await car_service.bulk_upsert_cars(
+            db,
+            parse(request.stream()),
+            chunk_size=settings.BULK_INGEST_CHUNK_SIZE,
+            max_items=settings.BULK_INGEST_MAX_ITEMS
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erreur lors de l'ingestion d'un lot d'annonces: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Une erreur est survenue lors de l'ingestion du lot d'annonces"
+        )
+
 @router.put("/{car_id}", response_model=Car)
 async def update_car(
     car_data: CarUpdate,
@@ -233,6 +348,27 @@ async def delete_car(
             detail="Une erreur est survenue lors de la suppression de l'annonce"
         )
 
+@router.get("/price-drops/", response_model=List[Car])
+async def get_price_drops(
+    min_drop_percent: float = Query(10, gt=0, lt=100, description="Baisse minimale en %"),
+    days: int = Query(7, ge=1, le=365, description="Période en jours"),
+    limit: int = Query(20, ge=1, le=100, description="Nombre maximal d'annonces"),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """
+    Récupère les annonces dont le prix a baissé d'au moins min_drop_percent %
+    au cours des derniers jours
+    """
+    try:
+        return await car_service.get_price_drops(db, min_drop_percent, days, limit)
+    
+    except Exception as e:
+        logger.error(f"Erreur lors de la récupération des baisses de prix: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Une erreur est survenue lors de la récupération des baisses de prix"
+        )
+
 @router.get("/brands/", response_model=List[str])
 async def get_brands(
     db: AsyncIOMotorDatabase = Depends(get_db)
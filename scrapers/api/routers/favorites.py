@@ -9,11 +9,10 @@ import logging
 from fastapi import APIRouter, Depends, HTTPException, Path, Query, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
-from ..dependencies import get_db, get_current_user
+from ..dependencies import get_db, get_current_user, services
 from ..models import (
     FavoriteCreate, FavoriteResponse, CarsListResponse
 )
-from ..services.favorites_service import FavoritesService
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +22,7 @@ router = APIRouter(
     responses={404: {"description": "Favori non trouvé"}}
 )
 
-favorites_service = FavoritesService()
+favorites_service = services.favorites_service
 
 @router.get("/", response_model=CarsListResponse)
 async def get_favorites(
@@ -19,6 +19,7 @@ from ..dependencies import (
     get_search_service, pagination_params
 )
 from ..services.search_service import SearchService
+from ..geocoding import resolve_near
 from ..models.auth import User
 
 # Configuration du logger
@@ -41,6 +42,13 @@ async def search_cars(
     """
     Recherche des annonces de voitures selon les critères spécifiés
     """
+    near = search_request.filters.near
+    if near and resolve_near(near) is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Localisation inconnue ou imprécise: {near}"
+        )
+    
     try:
         result = await search_service.search_cars(
             db=db,
@@ -272,6 +280,24 @@ async def delete_saved_search(
             detail=f"Erreur lors de la suppression de la recherche sauvegardée {saved_search_id}"
         )
 
+@router.get("/popular", response_model=List[SearchSuggestion])
+async def get_popular_searches(
+    limit: int = Query(10, ge=1, le=50, description="Nombre maximum de recherches"),
+    db = Depends(get_db),
+    search_service: SearchService = Depends(get_search_service)
+):
+    """
+    Récupère les recherches les plus populaires
+    """
+    try:
+        return await search_service.get_popular_searches(db=db, limit=limit)
+    except Exception as e:
+        logger.error(f"Erreur lors de la récupération des recherches populaires: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Erreur lors de la récupération des recherches populaires"
+        )
+
 @router.get("/suggestions", response_model=List[SearchSuggestion])
 async def get_search_suggestions(
     query: str = Query(..., description="Terme de recherche"),
@@ -284,9 +310,9 @@ async def get_search_suggestions(
     Récupère des suggestions de recherche basées sur un terme
     """
     try:
-        suggestions = await search_service.get_search_suggestions(
+        suggestions = await search_service.get_suggestions(
             db=db,
-            query=query,
+            prefix=query,
             type=type,
             limit=limit
         )
@@ -10,13 +10,12 @@ from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
-from ..dependencies import get_db
+from ..dependencies import get_db, services
 from ..models import (
     MarketOverview, PriceDistribution, PriceTrend,
     PopularBrand, PopularModel, PriceByAge,
     PriceByMileage, MarketInsight
 )
-from ..services.stats_service import StatsService
 
 logger = logging.getLogger(__name__)
 
@@ -26,19 +25,20 @@ router = APIRouter(
     responses={404: {"description": "Statistiques non trouvées"}}
 )
 
-stats_service = StatsService()
+stats_service = services.stats_service
 
 @router.get("/market-overview", response_model=MarketOverview)
 async def get_market_overview(
     brand: Optional[str] = Query(None, description="Marque"),
     model: Optional[str] = Query(None, description="Modèle"),
+    distinct_vehicles: bool = Query(False, description="Une seule annonce par véhicule (doublons entre sources regroupés)"),
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """
     Récupère une vue d'ensemble du marché
     """
     try:
-        return await stats_service.get_market_overview(db, brand, model)
+        return await stats_service.get_market_overview(db, brand, model, distinct_vehicles)
     
     except Exception as e:
         logger.error(f"Erreur lors de la récupération de la vue d'ensemble du marché: {str(e)}")
@@ -52,13 +52,14 @@ async def get_price_distribution(
     brand: Optional[str] = Query(None, description="Marque"),
     model: Optional[str] = Query(None, description="Modèle"),
     bins: int = Query(10, ge=5, le=50, description="Nombre d'intervalles"),
+    distinct_vehicles: bool = Query(False, description="Une seule annonce par véhicule (doublons entre sources regroupés)"),
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """
     Récupère la distribution des prix
     """
     try:
-        return await stats_service.get_price_distribution(db, brand, model, bins)
+        return await stats_service.get_price_distribution(db, brand, model, bins, distinct_vehicles)
     
     except Exception as e:
         logger.error(f"Erreur lors de la récupération de la distribution des prix: {str(e)}")
@@ -148,13 +149,14 @@ async def get_price_by_mileage(
     brand: Optional[str] = Query(None, description="Marque"),
     model: Optional[str] = Query(None, description="Modèle"),
     bins: int = Query(10, ge=5, le=50, description="Nombre d'intervalles"),
+    distinct_vehicles: bool = Query(False, description="Une seule annonce par véhicule (doublons entre sources regroupés)"),
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """
     Récupère les prix moyens par kilométrage
     """
     try:
-        return await stats_service.get_price_by_mileage(db, brand, model, bins)
+        return await stats_service.get_price_by_mileage(db, brand, model, bins, distinct_vehicles)
     
     except Exception as e:
         logger.error(f"Erreur lors de la récupération des prix par kilométrage: {str(e)}")
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Historique de recherche : enregistrement par lots et compteurs des recherches populaires
+"""
+
+import asyncio
+import heapq
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, UpdateOne
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+def bucket_start(timestamp: datetime) -> datetime:
+    """
+    Début de la tranche horaire d'un instant
+    """
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+class SearchHistoryRecorder:
+    """
+    Tampon des recherches à enregistrer, vidé par lots hors du chemin des requêtes
+
+    Les enregistrements sont écrits avec insert_many dès que le lot est plein
+    ou à intervalle régulier ; les compteurs par tranche horaire
+    (collection search_counts) sont incrémentés au même moment. Si le tampon
+    est plein, les enregistrements sont abandonnés plutôt que de ralentir
+    les recherches.
+    """
+
+    def __init__(self, batch_size: int = 200, max_buffer: int = 10000):
+        self.batch_size = batch_size
+        self.max_buffer = max_buffer
+        self._records: List[Dict[str, Any]] = []
+        self._ready = asyncio.Event()
+        self.dropped = 0
+
+    def record(self, record: Dict[str, Any]) -> None:
+        """
+        Ajoute une recherche au tampon (sans attente)
+        """
+        if len(self._records) >= self.max_buffer:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"Tampon de l'historique plein, {self.dropped} recherche(s) ignorée(s)")
+            return
+
+        self._records.append(record)
+        if len(self._records) >= self.batch_size:
+            self._ready.set()
+
+    async def wait(self, timeout: float) -> None:
+        """
+        Attend qu'un lot soit plein ou que le délai soit écoulé
+        """
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._ready.clear()
+
+    async def flush(self, db: AsyncIOMotorDatabase) -> List[Dict[str, Any]]:
+        """
+        Écrit les recherches en attente, incrémente les compteurs horaires et
+        retourne les recherches écrites
+        """
+        if not self._records:
+            return []
+        records, self._records = self._records, []
+
+        counts: Counter = Counter(
+            (bucket_start(record["timestamp"]), record["query_text"]) for record in records
+        )
+
+        await db.search_history.insert_many(records, ordered=False)
+        await db.search_counts.bulk_write([
+            UpdateOne(
+                {"bucket": bucket, "query_text": query_text},
+                {"$inc": {"count": count}},
+                upsert=True
+            )
+            for (bucket, query_text), count in counts.items()
+        ], ordered=False)
+        return records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+class PopularSearches:
+    """
+    Top des recherches sur une fenêtre glissante, précalculé à partir des compteurs horaires
+    """
+
+    def __init__(self, top_k: int = 50):
+        self.top_k = top_k
+        self._top: List[Tuple[str, int]] = []
+        self.refreshed_at = None
+
+    async def refresh(self, db: AsyncIOMotorDatabase, window: timedelta) -> None:
+        """
+        Recalcule le top à partir des tranches horaires de la fenêtre
+        """
+        since = bucket_start(datetime.utcnow() - window)
+        cursor = db.search_counts.aggregate([
+            {"$match": {"bucket": {"$gte": since}}},
+            {"$group": {"_id": "$query_text", "count": {"$sum": "$count"}}},
+            {"$sort": {"count": -1}},
+            {"$limit": self.top_k}
+        ])
+        self._top = [(doc["_id"], doc["count"]) async for doc in cursor]
+        self.refreshed_at = datetime.utcnow()
+
+    def add(self, counts: Counter) -> None:
+        """
+        Ajoute au top les recherches qui viennent d'être enregistrées par ce processus
+        """
+        merged = Counter(dict(self._top))
+        merged.update(counts)
+        self._top = heapq.nlargest(self.top_k, merged.items(), key=lambda item: item[1])
+
+    def top(self, limit: int) -> List[Tuple[str, int]]:
+        return self._top[:limit]
+
+search_history_recorder = SearchHistoryRecorder(
+    batch_size=settings.SEARCH_HISTORY_BATCH_SIZE,
+    max_buffer=settings.SEARCH_HISTORY_BUFFER_SIZE
+)
+popular_searches = PopularSearches(top_k=settings.POPULAR_SEARCHES_TOP_K)
+
+async def ensure_indexes(db: AsyncIOMotorDatabase) -> None:
+    """
+    Crée les index de l'historique et des compteurs (expiration des tranches hors fenêtre)
+    """
+    await db.search_history.create_index([("user_id", ASCENDING), ("timestamp", ASCENDING)])
+    await db.search_counts.create_index([("bucket", ASCENDING), ("query_text", ASCENDING)], unique=True)
+    await db.search_counts.create_index(
+        [("bucket", ASCENDING)],
+        expireAfterSeconds=(settings.POPULAR_SEARCHES_WINDOW_HOURS + 1) * 3600
+    )
+
+async def search_history_loop(db: AsyncIOMotorDatabase) -> None:
+    """
+    Vide le tampon de l'historique par lots, puis une dernière fois à l'arrêt
+    """
+    try:
+        while True:
+            await search_history_recorder.wait(settings.SEARCH_HISTORY_FLUSH_SECONDS)
+            try:
+                records = await search_history_recorder.flush(db)
+                if records:
+                    popular_searches.add(Counter(record["query_text"] for record in records))
+            except Exception as e:
+                logger.error(f"Erreur lors de l'enregistrement de l'historique de recherche: {str(e)}")
+    finally:
+        try:
+            await search_history_recorder.flush(db)
+        except Exception as e:
+            logger.error(f"Erreur lors du dernier enregistrement de l'historique de recherche: {str(e)}")
+
+async def popular_searches_loop(db: AsyncIOMotorDatabase) -> None:
+    """
+    Recalcule périodiquement le top des recherches (tous processus confondus)
+    """
+    window = timedelta(hours=settings.POPULAR_SEARCHES_WINDOW_HOURS)
+    while True:
+        try:
+            await popular_searches.refresh(db, window)
+        except Exception as e:
+            logger.error(f"Erreur lors du calcul des recherches populaires: {str(e)}")
+        await asyncio.sleep(settings.POPULAR_SEARCHES_REFRESH_SECONDS)
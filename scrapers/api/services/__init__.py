@@ -12,5 +12,8 @@ __all__ = [
     'auth_service',
     'favorites_service',
     'alerts_service',
-    'admin_service'
+    'admin_service',
+    'deal_scoring_service',
+    'market_snapshot_service',
+    'notification_service'
 ] 
\ No newline at end of file
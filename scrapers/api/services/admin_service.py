@@ -17,6 +17,8 @@ from ..models import (
     ScraperJobCreate, ScraperJobResponse, ScraperJobsListResponse
 )
 from ..config import settings
+from ..cache import bump_ingest_generation, invalidate_user_cache
+from .auth_service import AuthService
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +27,12 @@ class AdminService:
     Service pour les fonctionnalités d'administration
     """
     
+    def __init__(self, auth_service: AuthService):
+        """
+        Reçoit l'instance partagée du service d'authentification (ServiceContainer)
+        """
+        self.auth_service = auth_service
+    
     async def get_admin_stats(
         self,
         db: AsyncIOMotorDatabase
@@ -190,9 +198,7 @@ class AdminService:
                 return None
             
             # Hacher le mot de passe
-            from ..services.auth_service import AuthService
-            auth_service = AuthService()
-            hashed_password = auth_service._hash_password(user_data.password)
+            hashed_password = await self.auth_service.get_password_hash_async(user_data.password)
             
             # Préparer les données utilisateur
             user_dict = {
@@ -243,11 +249,12 @@ class AdminService:
             if is_admin is not None:
                 update_data["is_admin"] = is_admin
             
-            # Mettre à jour l'utilisateur
+            # Mettre à jour l'utilisateur et révoquer les tokens déjà émis
             result = await db.users.update_one(
                 {"_id": ObjectId(user_id)},
-                {"$set": update_data}
+                {"$set": update_data, "$inc": {"token_version": 1}}
             )
+            invalidate_user_cache(user_id)
             
             return result.modified_count > 0
         
@@ -504,6 +511,8 @@ class AdminService:
                     "is_good_deal": False  # Conserver les bonnes affaires
                 })
                 results["old_cars_deleted"] = old_cars_result.deleted_count
+                if old_cars_result.deleted_count > 0:
+                    bump_ingest_generation()
             
             # Supprimer les anciens logs système
             if settings.system_logs_retention_days > 0:
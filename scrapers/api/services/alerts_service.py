@@ -5,10 +5,13 @@
 Service pour la gestion des alertes sur les annonces
 """
 
+import asyncio
 import logging
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime, timedelta
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
 from bson import ObjectId
 import re
 
@@ -17,14 +20,31 @@ from ..models import (
     AlertMatch, AlertsListResponse, SearchQuery
 )
 from ..config import settings
+from ..cache import TTLCache
+from ..alert_index import AlertIndex, CAR_PROJECTION
+from ..normalization import normalize_brand, normalize_model, location_tokens, prefix_pattern
+from .notification_service import NotificationService
 
 logger = logging.getLogger(__name__)
 
+# Code d'erreur MongoDB d'une clé en double
+DUPLICATE_KEY_ERROR = 11000
+
+# Index des alertes actives partagé par les instances du service
+_alert_index_cache = TTLCache(maxsize=1, ttl=settings.ALERT_INDEX_REFRESH_SECONDS)
+
+
 class AlertsService:
     """
     Service pour la gestion des alertes sur les annonces
     """
     
+    def __init__(self, notification_service: NotificationService):
+        """
+        Reçoit l'instance partagée du service des notifications (ServiceContainer)
+        """
+        self.notification_service = notification_service
+    
     async def create_alert(
         self,
         db: AsyncIOMotorDatabase,
@@ -38,7 +58,7 @@ class AlertsService:
             # Vérifier le nombre d'alertes existantes pour l'utilisateur
             existing_alerts_count = await db.alerts.count_documents({"user_id": ObjectId(user_id)})
             
-            if existing_alerts_count >= settings.max_alerts_per_user:
+            if existing_alerts_count >= settings.MAX_ALERTS_PER_USER:
                 logger.warning(f"L'utilisateur {user_id} a atteint le nombre maximum d'alertes")
                 return None
             
@@ -50,9 +70,11 @@ class AlertsService:
             alert_dict["last_run"] = None
             alert_dict["last_match_count"] = 0
             alert_dict["total_match_count"] = 0
+            alert_dict["unread_match_count"] = 0
             
             # Insérer l'alerte dans la base de données
             result = await db.alerts.insert_one(alert_dict)
+            _alert_index_cache.clear()
             
             # Récupérer l'alerte créée
             created_alert = await db.alerts.find_one({"_id": result.inserted_id})
@@ -165,6 +187,7 @@ class AlertsService:
                 {"_id": ObjectId(alert_id)},
                 {"$set": update_data}
             )
+            _alert_index_cache.clear()
             
             # Récupérer l'alerte mise à jour
             updated_alert = await db.alerts.find_one({"_id": ObjectId(alert_id)})
@@ -190,6 +213,8 @@ class AlertsService:
             })
             
             if result.deleted_count > 0:
+                _alert_index_cache.clear()
+                
                 # Supprimer également les correspondances d'alerte associées
                 await db.alert_matches.delete_many({"alert_id": ObjectId(alert_id)})
                 return True
@@ -303,11 +328,18 @@ class AlertsService:
                 return False
             
             # Marquer comme vue
-            await db.alert_matches.update_one(
-                {"_id": ObjectId(match_id)},
+            result = await db.alert_matches.update_one(
+                {"_id": ObjectId(match_id), "seen": False},
                 {"$set": {"seen": True}}
             )
             
+            # Décrémenter le compteur de non lues si la correspondance ne l'était pas déjà
+            if result.modified_count > 0:
+                await db.alerts.update_one(
+                    {"_id": match["alert_id"], "unread_match_count": {"$exists": True}},
+                    {"$inc": {"unread_match_count": -result.modified_count}}
+                )
+            
             return True
         
         except Exception as e:
@@ -334,29 +366,53 @@ class AlertsService:
                 return False
             
             # Marquer toutes les correspondances comme vues
-            await db.alert_matches.update_many(
+            result = await db.alert_matches.update_many(
                 {"alert_id": ObjectId(alert_id), "seen": False},
                 {"$set": {"seen": True}}
             )
             
+            # Décrémenter du nombre réellement marqué : les correspondances insérées
+            # entre-temps restent comptées
+            if result.modified_count > 0:
+                await db.alerts.update_one(
+                    {"_id": ObjectId(alert_id), "unread_match_count": {"$exists": True}},
+                    {"$inc": {"unread_match_count": -result.modified_count}}
+                )
+            
             return True
         
         except Exception as e:
             logger.error(f"Erreur lors du marquage de toutes les correspondances de l'alerte {alert_id} comme vues: {str(e)}")
             return False
     
+    async def ensure_indexes(self, db: AsyncIOMotorDatabase) -> None:
+        """
+        Crée les index utilisés par le traitement des alertes
+        """
+        await db.alert_matches.create_index(
+            [("alert_id", ASCENDING), ("car_id", ASCENDING)],
+            unique=True
+        )
+        await db.alert_matches.create_index([("alert_id", ASCENDING), ("seen", ASCENDING)])
+        await db.alerts.create_index([("is_active", ASCENDING), ("last_run", ASCENDING)])
+    
     async def process_alerts(
         self,
         db: AsyncIOMotorDatabase,
-        max_alerts: int = 100
+        max_alerts: int = 100,
+        concurrency: int = 20
     ) -> int:
         """
         Traite les alertes pour trouver de nouvelles correspondances
+        
+        Les alertes déjà exécutées sont évaluées en mémoire sur les annonces
+        publiées depuis leur dernière exécution ; seules les nouvelles alertes
+        interrogent db.cars pour leur premier remplissage.
         """
         try:
             # Récupérer les alertes à traiter
             now = datetime.utcnow()
-            min_interval = timedelta(minutes=settings.alert_check_interval_minutes)
+            min_interval = timedelta(minutes=settings.ALERT_CHECK_INTERVAL_MINUTES)
             
             # Trouver les alertes qui n'ont pas été exécutées récemment
             query = {
@@ -367,74 +423,197 @@ class AlertsService:
                 "is_active": True
             }
             
-            cursor = db.alerts.find(query).sort("last_run", 1).limit(max_alerts)
+            alerts = await db.alerts.find(query).sort("last_run", 1).limit(max_alerts).to_list(length=max_alerts)
+            new_alerts = [alert for alert in alerts if not alert.get("last_run")]
+            known_alerts = [alert for alert in alerts if alert.get("last_run")]
+            
+            matched_car_ids: Dict[ObjectId, List[ObjectId]] = {}
+            
+            # Premier remplissage des nouvelles alertes, en parallèle
+            semaphore = asyncio.Semaphore(concurrency)
+            
+            async def backfill_alert(alert: Dict[str, Any]) -> List[ObjectId]:
+                async with semaphore:
+                    return await self._find_alert_car_ids(db, alert)
+            
+            car_ids_lists = await asyncio.gather(*(backfill_alert(alert) for alert in new_alerts))
+            for alert, car_ids in zip(new_alerts, car_ids_lists):
+                if car_ids:
+                    matched_car_ids[alert["_id"]] = car_ids
+            
+            # Alertes déjà exécutées : une seule lecture des annonces récentes
+            if known_alerts:
+                index = AlertIndex(known_alerts)
+                since = min(alert["last_run"] for alert in known_alerts)
+                cursor = db.cars.find({"created_at": {"$gt": since}}, CAR_PROJECTION).batch_size(1000)
+                async for car in cursor:
+                    for alert in index.match(car):
+                        if not car.get("created_at") or car["created_at"] <= alert["last_run"]:
+                            continue
+                        car_ids = matched_car_ids.setdefault(alert["_id"], [])
+                        if len(car_ids) < settings.MAX_ALERT_MATCHES_PER_RUN:
+                            car_ids.append(car["_id"])
+            
+            matches_counts = await self._record_matches(db, matched_car_ids, now)
+            await self._update_alert_counters(db, alerts, matches_counts, now)
+            
+            total_matches = sum(matches_counts.values())
+            logger.info(f"Traitement des alertes terminé: {len(alerts)} alertes traitées, {total_matches} nouvelles correspondances trouvées")
+            return len(alerts)
+        
+        except Exception as e:
+            logger.error(f"Erreur lors du traitement des alertes: {str(e)}")
+            return 0
+    
+    async def match_new_cars(
+        self,
+        db: AsyncIOMotorDatabase,
+        cars: List[Dict[str, Any]]
+    ) -> int:
+        """
+        Évalue des annonces nouvellement ingérées contre toutes les alertes actives
+        """
+        try:
+            index = await self._get_alert_index(db)
+            if not cars or len(index) == 0:
+                return 0
             
-            alerts_processed = 0
-            total_matches = 0
+            now = datetime.utcnow()
+            matched_car_ids: Dict[ObjectId, List[ObjectId]] = {}
+            matched_alerts: Dict[ObjectId, Dict[str, Any]] = {}
+            for car in cars:
+                for alert in index.match(car):
+                    matched_car_ids.setdefault(alert["_id"], []).append(car["_id"])
+                    matched_alerts[alert["_id"]] = alert
             
-            async for alert in cursor:
-                # Déterminer la date de dernière exécution
-                last_run = alert.get("last_run")
-                
-                # Construire la requête pour trouver de nouvelles annonces
-                search_query = self._build_search_query_from_alert(alert)
-                
-                # Ajouter un filtre sur la date de création si l'alerte a déjà été exécutée
-                if last_run:
-                    search_query["created_at"] = {"$gt": last_run}
-                
-                # Rechercher les nouvelles annonces
-                cars_cursor = db.cars.find(search_query).limit(settings.max_alert_matches_per_run)
-                
-                # Traiter les correspondances
-                matches_count = 0
-                async for car in cars_cursor:
-                    # Vérifier si cette correspondance existe déjà
-                    existing_match = await db.alert_matches.find_one({
-                        "alert_id": alert["_id"],
-                        "car_id": car["_id"]
-                    })
-                    
-                    if not existing_match:
-                        # Créer une nouvelle correspondance
-                        match_data = {
-                            "alert_id": alert["_id"],
-                            "car_id": car["_id"],
-                            "created_at": now,
-                            "seen": False
-                        }
-                        
-                        await db.alert_matches.insert_one(match_data)
-                        matches_count += 1
-                
-                # Mettre à jour l'alerte
-                await db.alerts.update_one(
-                    {"_id": alert["_id"]},
-                    {
-                        "$set": {
-                            "last_run": now,
-                            "last_match_count": matches_count
-                        },
-                        "$inc": {
-                            "total_match_count": matches_count
-                        }
-                    }
-                )
-                
-                # Envoyer des notifications si nécessaire
-                if matches_count > 0:
-                    await self._send_alert_notification(db, alert, matches_count)
-                
-                alerts_processed += 1
-                total_matches += matches_count
+            matches_counts = await self._record_matches(db, matched_car_ids, now)
+            await self._update_alert_counters(db, list(matched_alerts.values()), matches_counts)
             
-            logger.info(f"Traitement des alertes terminé: {alerts_processed} alertes traitées, {total_matches} nouvelles correspondances trouvées")
-            return alerts_processed
+            return sum(matches_counts.values())
         
         except Exception as e:
-            logger.error(f"Erreur lors du traitement des alertes: {str(e)}")
+            logger.error(f"Erreur lors de l'évaluation des alertes sur les nouvelles annonces: {str(e)}")
             return 0
     
+    async def _get_alert_index(self, db: AsyncIOMotorDatabase) -> AlertIndex:
+        """
+        Retourne l'index des alertes actives (reconstruit périodiquement)
+        """
+        found, index = _alert_index_cache.get("active")
+        if found:
+            return index
+        
+        alerts = await db.alerts.find({"is_active": True}).to_list(length=None)
+        index = AlertIndex(alerts)
+        _alert_index_cache.set("active", index)
+        return index
+    
+    async def _find_alert_car_ids(
+        self,
+        db: AsyncIOMotorDatabase,
+        alert: Dict[str, Any]
+    ) -> List[ObjectId]:
+        """
+        Recherche dans db.cars les annonces correspondant à une alerte
+        """
+        # Construire la requête pour trouver de nouvelles annonces
+        search_query = self._build_search_query_from_alert(alert)
+        
+        # Ajouter un filtre sur la date de création si l'alerte a déjà été exécutée
+        if alert.get("last_run"):
+            search_query["created_at"] = {"$gt": alert["last_run"]}
+        
+        # Rechercher les nouvelles annonces (identifiants uniquement)
+        cars = await db.cars.find(search_query, {"_id": 1}).limit(
+            settings.MAX_ALERT_MATCHES_PER_RUN
+        ).to_list(length=settings.MAX_ALERT_MATCHES_PER_RUN)
+        
+        return [car["_id"] for car in cars]
+    
+    async def _record_matches(
+        self,
+        db: AsyncIOMotorDatabase,
+        matched_car_ids: Dict[ObjectId, List[ObjectId]],
+        now: datetime
+    ) -> Dict[ObjectId, int]:
+        """
+        Enregistre les correspondances et retourne le nombre de nouvelles par alerte
+        
+        Les doublons sont écartés par l'index unique (alert_id, car_id) ; une
+        autre erreur d'écriture est propagée à l'appelant.
+        """
+        documents = []
+        owners = []
+        for alert_id, car_ids in matched_car_ids.items():
+            for car_id in car_ids:
+                documents.append({
+                    "alert_id": alert_id,
+                    "car_id": car_id,
+                    "created_at": now,
+                    "seen": False
+                })
+                owners.append(alert_id)
+        
+        matches_counts = {alert_id: len(car_ids) for alert_id, car_ids in matched_car_ids.items()}
+        if not documents:
+            return matches_counts
+        
+        try:
+            await db.alert_matches.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # Correspondances déjà existantes : seules les nouvelles sont comptées ;
+            # toute autre erreur d'écriture est propagée
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+            for error in errors:
+                matches_counts[owners[error["index"]]] -= 1
+        
+        return matches_counts
+    
+    async def _update_alert_counters(
+        self,
+        db: AsyncIOMotorDatabase,
+        alerts: List[Dict[str, Any]],
+        matches_counts: Dict[ObjectId, int],
+        last_run: Optional[datetime] = None
+    ) -> None:
+        """
+        Met à jour les compteurs des alertes en une seule écriture groupée et notifie
+        """
+        operations = []
+        for alert in alerts:
+            matches_count = matches_counts.get(alert["_id"], 0)
+            update: Dict[str, Any] = {
+                "$set": {"last_match_count": matches_count},
+                "$inc": {"total_match_count": matches_count}
+            }
+            if last_run is not None:
+                update["$set"]["last_run"] = last_run
+            elif matches_count == 0:
+                continue
+            operations.append(UpdateOne({"_id": alert["_id"]}, update))
+            
+            # Le compteur de non-lus n'est incrémenté que s'il a déjà été initialisé :
+            # créé par $inc, il ignorerait les correspondances non lues existantes
+            if matches_count > 0:
+                operations.append(UpdateOne(
+                    {"_id": alert["_id"], "unread_match_count": {"$exists": True}},
+                    {"$inc": {"unread_match_count": matches_count}}
+                ))
+        
+        if operations:
+            await db.alerts.bulk_write(operations, ordered=False)
+        
+        # Envoyer des notifications si nécessaire
+        matched_alerts = [
+            (alert, matches_counts[alert["_id"]])
+            for alert in alerts
+            if matches_counts.get(alert["_id"], 0) > 0
+        ]
+        if matched_alerts:
+            await self._send_alert_notifications(db, matched_alerts)
+    
     async def get_unread_matches_count(
         self,
         db: AsyncIOMotorDatabase,
@@ -442,23 +621,31 @@ class AlertsService:
     ) -> Dict[str, int]:
         """
         Récupère le nombre de correspondances non lues pour chaque alerte d'un utilisateur
+        
+        Lit le compteur maintenu sur chaque alerte ; les alertes qui n'en ont pas
+        encore sont comptées en une seule agrégation puis initialisées.
         """
         try:
-            # Récupérer les alertes de l'utilisateur
-            alerts_cursor = db.alerts.find({"user_id": ObjectId(user_id)})
+            # Récupérer les compteurs des alertes de l'utilisateur
+            alerts = await db.alerts.find(
+                {"user_id": ObjectId(user_id)},
+                {"unread_match_count": 1}
+            ).to_list(length=None)
             
             result = {}
+            missing_ids = []
             
-            async for alert in alerts_cursor:
-                alert_id = str(alert["_id"])
-                
-                # Compter les correspondances non lues
-                unread_count = await db.alert_matches.count_documents({
-                    "alert_id": alert["_id"],
-                    "seen": False
-                })
-                
-                result[alert_id] = unread_count
+            for alert in alerts:
+                if alert.get("unread_match_count") is None:
+                    missing_ids.append(alert["_id"])
+                    result[str(alert["_id"])] = 0
+                else:
+                    result[str(alert["_id"])] = max(alert["unread_match_count"], 0)
+            
+            if missing_ids:
+                counts = await self._initialize_unread_counters(db, missing_ids)
+                for alert_id, count in counts.items():
+                    result[str(alert_id)] = count
             
             return result
         
@@ -466,18 +653,63 @@ class AlertsService:
             logger.error(f"Erreur lors de la récupération du nombre de correspondances non lues: {str(e)}")
             return {}
     
+    async def backfill_unread_counters(self, db: AsyncIOMotorDatabase) -> int:
+        """
+        Initialise au démarrage le compteur de non-lus des alertes qui n'en ont pas
+        """
+        try:
+            missing_ids = await db.alerts.distinct("_id", {"unread_match_count": {"$exists": False}})
+            if not missing_ids:
+                return 0
+            
+            await self._initialize_unread_counters(db, missing_ids)
+            logger.info(f"Compteur de non-lus initialisé pour {len(missing_ids)} alerte(s)")
+            return len(missing_ids)
+        
+        except Exception as e:
+            logger.error(f"Erreur lors de l'initialisation des compteurs de non-lus: {str(e)}")
+            return 0
+    
+    async def _initialize_unread_counters(
+        self,
+        db: AsyncIOMotorDatabase,
+        alert_ids: List[ObjectId]
+    ) -> Dict[ObjectId, int]:
+        """
+        Compte en une seule agrégation les correspondances non lues d'alertes sans compteur
+        et initialise ce dernier
+        """
+        pipeline = [
+            {"$match": {"alert_id": {"$in": alert_ids}, "seen": False}},
+            {"$group": {"_id": "$alert_id", "count": {"$sum": 1}}}
+        ]
+        counts = {
+            doc["_id"]: doc["count"]
+            async for doc in db.alert_matches.aggregate(pipeline)
+        }
+        
+        await db.alerts.bulk_write([
+            UpdateOne(
+                {"_id": alert_id, "unread_match_count": None},
+                {"$set": {"unread_match_count": counts.get(alert_id, 0)}}
+            )
+            for alert_id in alert_ids
+        ], ordered=False)
+        
+        return counts
+    
     def _build_search_query_from_alert(self, alert: Dict[str, Any]) -> Dict[str, Any]:
         """
         Construit une requête MongoDB à partir d'une alerte
         """
         search_query = {}
         
-        # Ajouter les filtres de base
+        # Ajouter les filtres de base (marque et modèle sur les champs normalisés)
         if alert.get("brand"):
-            search_query["brand"] = {"$regex": f"^{re.escape(alert['brand'])}", "$options": "i"}
+            search_query["brand_norm"] = prefix_pattern(normalize_brand(alert["brand"]))
         
         if alert.get("model"):
-            search_query["model"] = {"$regex": f"^{re.escape(alert['model'])}", "$options": "i"}
+            search_query["model_norm"] = prefix_pattern(normalize_model(alert["model"], alert.get("brand")))
         
         if alert.get("price_min") is not None:
             search_query.setdefault("price", {})
@@ -509,8 +741,8 @@ class AlertsService:
         if alert.get("transmission"):
             search_query["transmission"] = alert["transmission"]
         
-        if alert.get("location"):
-            search_query["location"] = {"$regex": f".*{re.escape(alert['location'])}.*", "$options": "i"}
+        if alert.get("location") and location_tokens(alert["location"]):
+            search_query["location_tokens"] = {"$all": location_tokens(alert["location"])}
         
         if alert.get("source"):
             search_query["source"] = alert["source"]
@@ -544,47 +776,61 @@ class AlertsService:
         
         return AlertResponse(**doc_copy)
     
-    async def _send_alert_notification(
+    async def _send_alert_notifications(
         self,
         db: AsyncIOMotorDatabase,
-        alert: Dict[str, Any],
-        matches_count: int
+        matched_alerts: List[Tuple[Dict[str, Any], int]]
     ) -> None:
         """
-        Envoie une notification pour une alerte
+        Envoie les notifications d'un lot d'alertes
         """
         try:
-            # Récupérer l'utilisateur
-            user = await db.users.find_one({"_id": alert["user_id"]})
-            
-            if not user:
-                return
-            
             # Vérifier les préférences de notification
-            if not alert.get("notify_by_email", True):
+            matched_alerts = [
+                (alert, matches_count) for alert, matches_count in matched_alerts
+                if alert.get("notify_by_email", True)
+            ]
+            if not matched_alerts:
                 return
             
-            # Préparer les données pour la notification
-            notification_data = {
-                "user_id": alert["user_id"],
-                "alert_id": alert["_id"],
-                "type": "alert_match",
-                "title": f"Nouvelles annonces pour votre alerte '{alert.get('name', 'Sans nom')}'",
-                "message": f"Nous avons trouvé {matches_count} nouvelle(s) annonce(s) correspondant à vos critères.",
-                "created_at": datetime.utcnow(),
-                "read": False,
-                "data": {
-                    "matches_count": matches_count,
-                    "alert_name": alert.get("name", "Sans nom")
-                }
-            }
+            # Récupérer les utilisateurs existants en une seule requête
+            user_ids = list({alert["user_id"] for alert, _ in matched_alerts})
+            existing_user_ids = set(await db.users.distinct("_id", {"_id": {"$in": user_ids}}))
             
-            # Enregistrer la notification
-            await db.notifications.insert_one(notification_data)
-            
-            # Envoyer un email si nécessaire (à implémenter)
-            # if alert.get("notify_by_email", True):
-            #     await self._send_alert_email(user, alert, matches_count)
+            # Préparer les données pour les notifications
+            now = datetime.utcnow()
+            notifications = [
+                {
+                    "user_id": alert["user_id"],
+                    "alert_id": alert["_id"],
+                    "type": "alert_match",
+                    "title": f"Nouvelles annonces pour votre alerte '{alert.get('name', 'Sans nom')}'",
+                    "message": f"Nous avons trouvé {matches_count} nouvelle(s) annonce(s) correspondant à vos critères.",
+                    "created_at": now,
+                    "read": False,
+                    "data": {
+                        "matches_count": matches_count,
+                        "alert_name": alert.get("name", "Sans nom")
+                    }
+                }
+                for alert, matches_count in matched_alerts
+                if alert["user_id"] in existing_user_ids
+            ]
+            
+            # Enregistrer les notifications
+            if notifications:
+                await db.notifications.insert_many(notifications, ordered=False)
+            
+            # Déposer les emails dans la file : ils seront regroupés par utilisateur
+            await self.notification_service.enqueue(db, [
+                {
+                    "user_id": notification["user_id"],
+                    "alert_id": notification["alert_id"],
+                    "alert_name": notification["data"]["alert_name"],
+                    "matches_count": notification["data"]["matches_count"]
+                }
+                for notification in notifications
+            ])
         
         except Exception as e:
-            logger.error(f"Erreur lors de l'envoi de la notification d'alerte: {str(e)}") 
\ No newline at end of file
+            logger.error(f"Erreur lors de l'envoi des notifications d'alerte: {str(e)}")
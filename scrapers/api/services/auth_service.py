@@ -5,8 +5,10 @@
 Service d'authentification pour l'API
 """
 
+import asyncio
 import logging
 import secrets
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, Union
 
@@ -17,10 +19,20 @@ from passlib.context import CryptContext
 from pydantic import EmailStr
 
 from ..config import settings
+from ..cache import invalidate_user_cache
 from ..models.auth import User, UserCreate, UserUpdate, TokenData
 
 logger = logging.getLogger(__name__)
 
+# bcrypt coûte 100 à 300 ms de CPU par appel : les hachages sont exécutés dans
+# un pool de threads borné. Le sémaphore fait attendre les demandes en excès
+# dans la boucle (annulables) plutôt que dans la file du pool.
+_password_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_MAX_CONCURRENCY,
+    thread_name_prefix="password-hash"
+)
+_password_semaphore = asyncio.Semaphore(settings.PASSWORD_HASH_MAX_CONCURRENCY)
+
 class AuthService:
     """
     Service pour gérer l'authentification des utilisateurs
@@ -48,6 +60,26 @@ class AuthService:
         """
         return self.pwd_context.hash(password)
     
+    async def verify_password_async(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        Vérifie un mot de passe sans bloquer la boucle d'événements
+        """
+        return await self._run_password_job(self.verify_password, plain_password, hashed_password)
+    
+    async def get_password_hash_async(self, password: str) -> str:
+        """
+        Génère un hash de mot de passe sans bloquer la boucle d'événements
+        """
+        return await self._run_password_job(self.get_password_hash, password)
+    
+    async def _run_password_job(self, func, *args):
+        """
+        Exécute un calcul bcrypt dans le pool dédié, dans la limite de concurrence
+        """
+        async with _password_semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(_password_executor, func, *args)
+    
     async def get_user_by_email(self, db: AsyncIOMotorDatabase, email: EmailStr) -> Optional[User]:
         """
         Récupère un utilisateur par son email
@@ -73,7 +105,7 @@ class AuthService:
         user = await self.get_user_by_email(db, email)
         if not user:
             return None
-        if not self.verify_password(password, user.hashed_password):
+        if not await self.verify_password_async(password, user.hashed_password):
             return None
         return user
     
@@ -121,7 +153,10 @@ class AuthService:
         data = {
             "sub": user.id,
             "email": user.email,
-            "is_admin": user.is_admin
+            "full_name": user.full_name,
+            "is_active": user.is_active,
+            "is_admin": user.is_admin,
+            "ver": user.token_version
         }
         return self.create_token(data, "access")
     
@@ -130,7 +165,8 @@ class AuthService:
         Crée un token de rafraîchissement pour un utilisateur
         """
         data = {
-            "sub": user.id
+            "sub": user.id,
+            "ver": user.token_version
         }
         return self.create_token(data, "refresh")
     
@@ -149,7 +185,7 @@ class AuthService:
         # Créer l'utilisateur
         user_dict = user_create.dict()
         user_dict.pop("password")
-        user_dict["hashed_password"] = self.get_password_hash(user_create.password)
+        user_dict["hashed_password"] = await self.get_password_hash_async(user_create.password)
         user_dict["created_at"] = datetime.utcnow()
         user_dict["updated_at"] = datetime.utcnow()
         user_dict["is_active"] = True
@@ -175,17 +211,22 @@ class AuthService:
         update_data = user_update.dict(exclude_unset=True)
         
         # Hasher le mot de passe si nécessaire
+        update = {}
         if "password" in update_data:
-            update_data["hashed_password"] = self.get_password_hash(update_data.pop("password"))
+            update_data["hashed_password"] = await self.get_password_hash_async(update_data.pop("password"))
+            # Un changement de mot de passe révoque les tokens déjà émis
+            update["$inc"] = {"token_version": 1}
         
         # Mettre à jour la date de modification
         update_data["updated_at"] = datetime.utcnow()
+        update["$set"] = update_data
         
         # Mettre à jour l'utilisateur dans la base de données
         await db.users.update_one(
             {"_id": user_id},
-            {"$set": update_data}
+            update
         )
+        invalidate_user_cache(user_id)
         
         # Récupérer l'utilisateur mis à jour
         return await self.get_user_by_id(db, user_id)
@@ -196,6 +237,7 @@ class AuthService:
         """
         # Supprimer l'utilisateur
         result = await db.users.delete_one({"_id": user_id})
+        invalidate_user_cache(user_id)
         
         # Vérifier si l'utilisateur a été supprimé
         return result.deleted_count > 0
@@ -259,6 +301,14 @@ class AuthService:
                 headers={"WWW-Authenticate": "Bearer"}
             )
         
+        # Vérifier que le token n'a pas été révoqué (mot de passe ou statut modifié)
+        if payload.get("ver", 0) < user.token_version:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token révoqué",
+                headers={"WWW-Authenticate": "Bearer"}
+            )
+        
         # Créer un nouveau token d'accès
         access_token = self.create_access_token(user)
         
@@ -5,25 +5,188 @@
 Service pour la gestion des annonces de voitures
 """
 
+import asyncio
+import csv
+import io
+import json
 import logging
-from typing import List, Dict, Any, Optional, Union
-from datetime import datetime
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple, Union
+from datetime import datetime, timedelta
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
 from bson import ObjectId
-import re
+from pydantic import ValidationError
 
 from ..models import (
     Car, CarCreate, CarUpdate, CarResponse, CarsListResponse,
-    PriceAnalysis, SimilarCarsResponse
+    PriceAnalysis, SimilarCarsResponse, BulkItemStatus, BulkIngestResponse
 )
+from ..cache import bump_ingest_generation, get_ingest_generation
+from ..events import ingest_events
+from ..fulltext import build_text_filter, text_fields, RELEVANCE_PROJECTION, RELEVANCE_SORT
+from ..normalization import (
+    normalize_brand, normalize_model, location_tokens, normalized_fields, prefix_pattern
+)
+from ..geocoding import radius_filter
+from ..price_history import price_drop_since, track_price
+from ..dedup import DuplicateDetector, block_key, distinct_vehicle_stages, price_range
+from ..similarity import SimilarityIndex, SIMILARITY_PROJECTION, similarity_index
+from .market_snapshot_service import MarketSnapshotService
+from .favorites_service import FavoritesService
+from .deal_scoring_service import DealScoringService
 
 logger = logging.getLogger(__name__)
 
+_similarity_lock = asyncio.Lock()
+
+# Champs exportables (nom exporté -> champ du document) et champs exportés par défaut
+EXPORT_FIELDS = {
+    "id": "_id",
+    **{field: field for field in [
+        "source", "source_id", "title", "brand", "model", "year", "price", "mileage",
+        "fuel_type", "transmission", "power", "engine_size", "doors", "color", "location",
+        "description", "features", "images", "url", "is_good_deal", "vehicle_cluster_id",
+        "price_history", "price_drop", "last_price_drop_at", "first_seen_at", "days_on_market",
+        "created_at", "updated_at"
+    ]}
+}
+# Champs lus sur les candidats doublons d'une annonce
+DEDUP_CANDIDATE_PROJECTION = {
+    field: 1 for field in [
+        "brand_norm", "model_norm", "year", "price", "mileage", "location_point",
+        "vehicle_cluster_id", "text_simhash", "image_hashes", "title", "description"
+    ]
+}
+
+# Champs dont la modification peut changer le cluster de doublons d'une annonce
+DEDUP_FIELDS = ["title", "description", "brand", "model", "year", "price", "mileage", "location", "images"]
+
+# Index unique (source, source_id) et ancien index non unique qu'il remplace
+SOURCE_INDEX_NAME = "source_source_id_unique"
+LEGACY_SOURCE_INDEX_NAME = "source_1_source_id_1"
+
+# Code d'erreur MongoDB d'une clé en double
+DUPLICATE_KEY_ERROR = 11000
+
+EXPORT_DEFAULT_FIELDS = [
+    "id", "source", "source_id", "title", "brand", "model", "year", "price", "mileage",
+    "fuel_type", "transmission", "location", "url", "is_good_deal", "created_at", "updated_at"
+]
+
+def _export_value(value: Any) -> Any:
+    """
+    Valeur exportable en JSON (identifiants et dates en texte)
+    """
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, list):
+        return [_export_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _export_value(item) for key, item in value.items()}
+    return value
+
 class CarService:
     """
     Service pour la gestion des annonces de voitures
     """
     
+    def __init__(
+        self,
+        market_snapshot_service: MarketSnapshotService,
+        favorites_service: FavoritesService,
+        deal_scoring_service: DealScoringService
+    ):
+        """
+        Reçoit les instances partagées des services utilisés (ServiceContainer)
+        """
+        self.market_snapshot_service = market_snapshot_service
+        self.favorites_service = favorites_service
+        self.deal_scoring_service = deal_scoring_service
+    
+    async def ensure_indexes(self, db: AsyncIOMotorDatabase) -> None:
+        """
+        Crée les index des champs normalisés, de la position, des doublons et des baisses de prix de la collection cars
+        """
+        await db.cars.create_index([("brand_norm", ASCENDING), ("model_norm", ASCENDING)])
+        # Candidats doublons : même bloc (marque, modèle, année) et prix proche
+        await db.cars.create_index([
+            ("brand_norm", ASCENDING), ("model_norm", ASCENDING), ("year", ASCENDING), ("price", ASCENDING)
+        ])
+        await db.cars.create_index([("vehicle_cluster_id", ASCENDING)])
+        await db.cars.create_index([("location_tokens", ASCENDING)])
+        await db.cars.create_index([("location_point", GEOSPHERE)])
+        await db.cars.create_index([("last_price_drop_at", DESCENDING), ("price_drop", DESCENDING)])
+        await self._ensure_source_index(db)
+    
+    async def _ensure_source_index(self, db: AsyncIOMotorDatabase) -> None:
+        """
+        Crée l'index unique (source, source_id) des annonces ingérées
+        
+        L'ancien index non unique n'est supprimé qu'une fois l'index unique
+        créé : si des doublons sont déjà stockés, il est conservé et l'erreur
+        est journalisée jusqu'à leur suppression.
+        """
+        try:
+            await db.cars.create_index(
+                [("source", ASCENDING), ("source_id", ASCENDING)],
+                name=SOURCE_INDEX_NAME,
+                unique=True,
+                # Seules les annonces avec un source_id sont concernées ; une égalité
+                # sur un texte non vide reste utilisable par le planificateur
+                partialFilterExpression={"source_id": {"$gt": ""}}
+            )
+        except OperationFailure as e:
+            logger.error(f"Erreur lors de la création de l'index unique (source, source_id), doublons à supprimer: {str(e)}")
+            return
+        
+        if LEGACY_SOURCE_INDEX_NAME in await db.cars.index_information():
+            await db.cars.drop_index(LEGACY_SOURCE_INDEX_NAME)
+    
+    async def normalize_existing_cars(
+        self,
+        db: AsyncIOMotorDatabase,
+        batch_size: int = 1000
+    ) -> int:
+        """
+        Calcule les champs normalisés et la position des annonces enregistrées sans eux
+        """
+        updated = 0
+        try:
+            cursor = db.cars.find(
+                {"$or": [
+                    {"brand_norm": {"$exists": False}},
+                    {"location_point": {"$exists": False}},
+                    {"location_precision": {"$exists": False}},
+                    {"text_stems": {"$exists": False}}
+                ]},
+                {"brand": 1, "model": 1, "location": 1, "title": 1, "description": 1}
+            ).batch_size(batch_size)
+            
+            operations = []
+            async for car_doc in cursor:
+                operations.append(UpdateOne(
+                    {"_id": car_doc["_id"]},
+                    {"$set": {**normalized_fields(car_doc), **text_fields(car_doc)}}
+                ))
+                if len(operations) >= batch_size:
+                    result = await db.cars.bulk_write(operations, ordered=False)
+                    updated += result.modified_count
+                    operations = []
+            
+            if operations:
+                result = await db.cars.bulk_write(operations, ordered=False)
+                updated += result.modified_count
+            
+            if updated:
+                logger.info(f"{updated} annonces normalisées")
+            return updated
+        except Exception as e:
+            logger.error(f"Erreur lors de la normalisation des annonces: {str(e)}")
+            return updated
+    
     async def get_cars(
         self,
         db: AsyncIOMotorDatabase,
@@ -35,17 +198,119 @@ class CarService:
     ) -> CarsListResponse:
         """
         Récupère une liste d'annonces de voitures avec pagination et filtres
+        
+        Avec le filtre distinct_vehicles, les doublons entre sources sont
+        regroupés : seule la première annonce de chaque véhicule (selon le tri)
+        est retournée et le total compte les véhicules.
         """
         skip = (page - 1) * page_size
+        query = self._build_cars_query(filters)
+        distinct_vehicles = bool(filters and filters.get("distinct_vehicles"))
+        
+        # Déterminer le tri
+        sort_parts = sort_by.split("_")
+        sort_field = "_".join(sort_parts[:-1]) if len(sort_parts) > 1 else sort_parts[0]
+        sort_direction = 1 if sort_by.endswith("_asc") else -1
+        
+        # Mapper les champs de tri
+        sort_field_map = {
+            "created": "created_at",
+            "price": "price",
+            "year": "year",
+            "mileage": "mileage"
+        }
+        
+        # Tri par pertinence : score de l'index texte, puis les plus récentes
+        projection = None
+        if sort_field == "relevance":
+            if "$text" in query:
+                projection = RELEVANCE_PROJECTION
+                sort_criteria = RELEVANCE_SORT + [("created_at", -1)]
+            else:
+                sort_criteria = [("created_at", -1)]
+        else:
+            sort_field = sort_field_map.get(sort_field, "created_at")
+            sort_criteria = [(sort_field, sort_direction)]
+        
+        # Exécuter la requête
+        if distinct_vehicles:
+            total, car_docs = await self._find_distinct_vehicles(db, query, projection, sort_criteria, skip, page_size)
+        else:
+            total = await db.cars.count_documents(query)
+            car_docs = await db.cars.find(query, projection).sort(sort_criteria).skip(skip).limit(page_size).to_list(length=page_size)
+        
+        # Convertir les résultats en objets Car
+        cars = []
+        for car_doc in car_docs:
+            car = await self._document_to_car(car_doc)
+            cars.append(car)
         
-        # Construction du filtre
+        # Marquer les favoris de l'utilisateur en une seule requête
+        if user_id and cars:
+            favorite_ids = await self.favorites_service.get_favorite_ids_by_car(
+                db, user_id, [car.id for car in cars]
+            )
+            for car in cars:
+                if car.id in favorite_ids:
+                    car.is_favorite = True
+                    car.favorite_id = favorite_ids[car.id]
+        
+        # Calculer le nombre total de pages
+        total_pages = (total + page_size - 1) // page_size if total > 0 else 0
+        
+        # Retourner la réponse
+        return CarsListResponse(
+            items=cars,
+            total=total,
+            page=page,
+            page_size=page_size,
+            pages=total_pages
+        )
+    
+    async def _find_distinct_vehicles(
+        self,
+        db: AsyncIOMotorDatabase,
+        query: Dict[str, Any],
+        projection: Optional[Dict[str, Any]],
+        sort_criteria: List[Tuple[str, Any]],
+        skip: int,
+        limit: int
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        Page d'annonces avec une seule annonce par véhicule, et nombre de véhicules
+        """
+        # Le score de pertinence est conservé dans le document pour trier après le regroupement
+        sort_spec = {field: -1 if isinstance(direction, dict) else direction for field, direction in sort_criteria}
+        pipeline: List[Dict[str, Any]] = [{"$match": query}]
+        if projection:
+            pipeline.append({"$addFields": projection})
+        pipeline += [
+            {"$sort": sort_spec},
+            *distinct_vehicle_stages(),
+            {"$sort": sort_spec},
+            {"$facet": {
+                "total": [{"$count": "count"}],
+                "items": [{"$skip": skip}, {"$limit": limit}]
+            }}
+        ]
+        
+        result = await db.cars.aggregate(pipeline, allowDiskUse=True).to_list(length=1)
+        facet = result[0] if result else {"total": [], "items": []}
+        total = facet["total"][0]["count"] if facet["total"] else 0
+        return total, facet["items"]
+    
+    def _build_cars_query(self, filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Construit la requête MongoDB correspondant aux filtres des annonces
+        """
         query = {}
         if filters:
+            # Marque et modèle : préfixe sur les champs normalisés (indexés)
             if "brand" in filters and filters["brand"]:
-                query["brand"] = {"$regex": f"^{re.escape(filters['brand'])}", "$options": "i"}
+                query["brand_norm"] = prefix_pattern(normalize_brand(filters["brand"]))
             
             if "model" in filters and filters["model"]:
-                query["model"] = {"$regex": f"^{re.escape(filters['model'])}", "$options": "i"}
+                query["model_norm"] = prefix_pattern(normalize_model(filters["model"], filters.get("brand")))
             
             if "price_min" in filters and filters["price_min"] is not None:
                 query.setdefault("price", {})
@@ -78,7 +343,13 @@ class CarService:
                 query["transmission"] = filters["transmission"]
             
             if "location" in filters and filters["location"]:
-                query["location"] = {"$regex": f".*{re.escape(filters['location'])}.*", "$options": "i"}
+                tokens = location_tokens(filters["location"])
+                if tokens:
+                    query["location_tokens"] = {"$all": tokens}
+            
+            # Recherche par rayon autour d'un point (latitude, longitude)
+            if "near" in filters and filters["near"]:
+                query["location_point"] = radius_filter(filters["near"], filters.get("radius_km") or 50)
             
             if "source" in filters and filters["source"]:
                 query["source"] = filters["source"]
@@ -87,56 +358,75 @@ class CarService:
                 query["is_good_deal"] = True
             
             if "keywords" in filters and filters["keywords"]:
-                keywords = filters["keywords"].split()
-                keyword_conditions = []
-                for keyword in keywords:
-                    keyword_conditions.append({
-                        "$or": [
-                            {"title": {"$regex": f".*{re.escape(keyword)}.*", "$options": "i"}},
-                            {"description": {"$regex": f".*{re.escape(keyword)}.*", "$options": "i"}}
-                        ]
-                    })
-                if keyword_conditions:
-                    query["$and"] = keyword_conditions
-        
-        # Déterminer le tri
-        sort_parts = sort_by.split("_")
-        sort_field = "_".join(sort_parts[:-1]) if len(sort_parts) > 1 else sort_parts[0]
-        sort_direction = 1 if sort_by.endswith("_asc") else -1
+                text_filter = build_text_filter(filters["keywords"])
+                if text_filter:
+                    query.update(text_filter)
         
-        # Mapper les champs de tri
-        sort_field_map = {
-            "created": "created_at",
-            "price": "price",
-            "year": "year",
-            "mileage": "mileage",
-            "relevance": "score"  # Pour la recherche par pertinence
-        }
-        
-        sort_field = sort_field_map.get(sort_field, "created_at")
-        sort_criteria = [(sort_field, sort_direction)]
-        
-        # Exécuter la requête
-        total = await db.cars.count_documents(query)
-        cursor = db.cars.find(query).sort(sort_criteria).skip(skip).limit(page_size)
+        return query
+    
+    async def export_cars(
+        self,
+        db: AsyncIOMotorDatabase,
+        filters: Optional[Dict[str, Any]],
+        fields: List[str],
+        format: str = "ndjson",
+        batch_size: int = 5000
+    ) -> AsyncIterator[str]:
+        """
+        Produit en flux les annonces correspondant aux filtres, en NDJSON ou en CSV
         
-        # Convertir les résultats en objets Car
-        cars = []
-        async for car_doc in cursor:
-            car = await self._document_to_car(car_doc)
-            cars.append(car)
+        Seuls les champs demandés sont lus (projection) ; les lignes sont
+        regroupées par lot du curseur avant d'être envoyées. Une erreur en
+        cours d'export est propagée : le flux est interrompu et le client
+        reçoit un transfert incomplet plutôt qu'un fichier tronqué.
+        """
+        projection = {EXPORT_FIELDS[field]: 1 for field in fields}
+        if "id" not in fields:
+            projection["_id"] = 0
         
-        # Calculer le nombre total de pages
-        total_pages = (total + page_size - 1) // page_size if total > 0 else 0
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if format == "csv" else None
+        if writer:
+            writer.writerow(fields)
         
-        # Retourner la réponse
-        return CarsListResponse(
-            items=cars,
-            total=total,
-            page=page,
-            page_size=page_size,
-            pages=total_pages
-        )
+        exported = 0
+        try:
+            query = self._build_cars_query(filters)
+            if filters and filters.get("distinct_vehicles"):
+                cursor = db.cars.aggregate([
+                    {"$match": query},
+                    {"$sort": {"_id": ASCENDING}},
+                    *distinct_vehicle_stages(),
+                    {"$sort": {"_id": ASCENDING}},
+                    {"$project": projection}
+                ], allowDiskUse=True, batchSize=batch_size)
+            else:
+                cursor = db.cars.find(query, projection).sort("_id", ASCENDING).batch_size(batch_size)
+            async for car_doc in cursor:
+                values = [_export_value(car_doc.get(EXPORT_FIELDS[field])) for field in fields]
+                if writer:
+                    writer.writerow([
+                        json.dumps(value, ensure_ascii=False) if isinstance(value, (list, dict)) else value
+                        for value in values
+                    ])
+                else:
+                    buffer.write(json.dumps(dict(zip(fields, values)), ensure_ascii=False))
+                    buffer.write("\n")
+                
+                exported += 1
+                if exported % batch_size == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            
+            if buffer.tell():
+                yield buffer.getvalue()
+            logger.info(f"{exported} annonces exportées ({format})")
+        except Exception as e:
+            # L'en-tête de la réponse est déjà envoyé : l'erreur est propagée pour que
+            # la réponse soit interrompue sans son bloc final et ne passe pas pour complète
+            logger.error(f"Erreur lors de l'export des annonces après {exported} annonces: {str(e)}")
+            raise
     
     async def get_car_by_id(
         self,
@@ -199,12 +489,21 @@ class CarService:
             car_dict = car_data.model_dump(exclude_unset=True)
             car_dict["created_at"] = datetime.utcnow()
             car_dict["updated_at"] = car_dict["created_at"]
+            car_dict.update(normalized_fields(car_dict))
+            car_dict.update(text_fields(car_dict))
+            car_dict.update(track_price(None, car_dict.get("price"), car_dict["created_at"]))
+            await self._assign_vehicle_clusters(db, [(car_dict, None)])
             
             # Déterminer si c'est une bonne affaire
             car_dict["is_good_deal"] = await self._is_good_deal(db, car_data)
             
             # Insérer dans la base de données
             result = await db.cars.insert_one(car_dict)
+            bump_ingest_generation()
+            ingest_events.publish([result.inserted_id])
+            
+            # Mettre à jour l'instantané quotidien du marché
+            await self.market_snapshot_service.rollup_for_car(db, car_dict)
             
             # Récupérer l'annonce créée
             car_doc = await db.cars.find_one({"_id": result.inserted_id})
@@ -213,6 +512,287 @@ class CarService:
             logger.error(f"Erreur lors de la création de l'annonce: {str(e)}")
             return None
     
+    async def bulk_upsert_cars(
+        self,
+        db: AsyncIOMotorDatabase,
+        items: AsyncIterator[Tuple[int, Any]],
+        chunk_size: int = 1000,
+        max_items: int = 50000
+    ) -> BulkIngestResponse:
+        """
+        Ingère un lot d'annonces lu en flux, validé et écrit par paquets
+        
+        Chaque annonce est insérée ou mise à jour selon (source, source_id) ;
+        le résultat est retourné annonce par annonce, dans l'ordre du lot.
+        """
+        statuses: List[BulkItemStatus] = []
+        chunk: List[Tuple[int, CarCreate]] = []
+        changed_ids: List[Any] = []
+        created_ids: List[Any] = []
+        received = 0
+        
+        async for index, item in items:
+            if received >= max_items:
+                statuses.append(BulkItemStatus(
+                    index=index, status="error", error=f"Lot limité à {max_items} annonces"
+                ))
+                break
+            received += 1
+            
+            if isinstance(item, ValueError):
+                statuses.append(BulkItemStatus(index=index, status="error", error=str(item)))
+                continue
+            
+            try:
+                car_data = CarCreate.model_validate(item)
+            except ValidationError as e:
+                statuses.append(BulkItemStatus(index=index, status="error", error=self._validation_message(e)))
+                continue
+            
+            if not car_data.source_id:
+                statuses.append(BulkItemStatus(index=index, status="error", error="source_id requis"))
+                continue
+            
+            chunk.append((index, car_data))
+            if len(chunk) >= chunk_size:
+                statuses.extend(await self._upsert_chunk(db, chunk, changed_ids, created_ids))
+                chunk = []
+        
+        if chunk:
+            statuses.extend(await self._upsert_chunk(db, chunk, changed_ids, created_ids))
+        
+        if changed_ids:
+            bump_ingest_generation()
+            # Seules les nouvelles annonces sont diffusées aux alertes
+            ingest_events.publish(created_ids)
+            # Mettre à jour l'instantané du marché une seule fois pour le lot
+            await self.market_snapshot_service.rollup_recent(db, days=1)
+        
+        statuses.sort(key=lambda item_status: item_status.index)
+        return BulkIngestResponse(
+            received=received,
+            created=sum(1 for item_status in statuses if item_status.status == "created"),
+            updated=sum(1 for item_status in statuses if item_status.status == "updated"),
+            errors=sum(1 for item_status in statuses if item_status.status == "error"),
+            items=statuses
+        )
+    
+    async def _upsert_chunk(
+        self,
+        db: AsyncIOMotorDatabase,
+        chunk: List[Tuple[int, CarCreate]],
+        changed_ids: List[Any],
+        created_ids: List[Any]
+    ) -> List[BulkItemStatus]:
+        """
+        Écrit un paquet d'annonces validées avec un seul bulk_write
+        
+        Les versions déjà stockées et les comparables des bonnes affaires sont
+        chargés en une requête chacun pour tout le paquet ; les copies dans les
+        favoris sont mises à jour en une seule écriture. Une clé (source,
+        source_id) écrite en même temps par un autre lot est signalée sur
+        l'annonce concernée.
+        """
+        statuses: List[BulkItemStatus] = []
+        
+        # Seule la dernière occurrence d'une même annonce dans le paquet est écrite
+        latest = {(car_data.source, car_data.source_id): position for position, (_, car_data) in enumerate(chunk)}
+        cars: List[Tuple[int, Dict[str, Any]]] = []
+        for position, (index, car_data) in enumerate(chunk):
+            if latest[(car_data.source, car_data.source_id)] != position:
+                statuses.append(BulkItemStatus(
+                    index=index, status="duplicate", source_id=car_data.source_id,
+                    error="Remplacée par une occurrence suivante du lot"
+                ))
+            else:
+                cars.append((index, car_data.model_dump(mode="json", exclude_unset=True)))
+        
+        try:
+            # Versions déjà stockées, pour l'historique des prix
+            source_ids: Dict[str, List[str]] = {}
+            for _, car_dict in cars:
+                source_ids.setdefault(car_dict["source"], []).append(car_dict["source_id"])
+            existing: Dict[Tuple[str, str], Dict[str, Any]] = {}
+            cursor = db.cars.find(
+                {"$or": [{"source": source, "source_id": {"$in": ids}} for source, ids in source_ids.items()]},
+                {
+                    "source": 1, "source_id": 1, "title": 1, "price": 1, "images": 1, "created_at": 1,
+                    "price_history": 1, "price_peak": 1, "last_price_drop_at": 1, "first_seen_at": 1,
+                    "vehicle_cluster_id": 1, "image_hashes": 1
+                }
+            )
+            async for car_doc in cursor:
+                existing[(car_doc["source"], car_doc["source_id"])] = car_doc
+            
+            reference = await self.deal_scoring_service.build_reference(db, [car_dict for _, car_dict in cars])
+            
+            now = datetime.utcnow()
+            for _, car_dict in cars:
+                previous = existing.get((car_dict["source"], car_dict["source_id"]))
+                car_dict["updated_at"] = now
+                car_dict.update(normalized_fields(car_dict))
+                car_dict.update(text_fields(car_dict))
+                car_dict.update(track_price(previous, car_dict.get("price"), now))
+                car_dict["is_good_deal"] = bool(reference.is_good_deal(car_dict))
+            
+            # Clusters de doublons du paquet (candidats chargés en une requête)
+            await self._assign_vehicle_clusters(db, [
+                (car_dict, existing.get((car_dict["source"], car_dict["source_id"])))
+                for _, car_dict in cars
+            ])
+            
+            operations = []
+            for _, car_dict in cars:
+                operations.append(UpdateOne(
+                    {"source": car_dict["source"], "source_id": car_dict["source_id"]},
+                    {"$set": car_dict, "$setOnInsert": {"created_at": now}},
+                    upsert=True
+                ))
+            
+            write_errors: Dict[int, str] = {}
+            try:
+                result = await db.cars.bulk_write(operations, ordered=False)
+                upserted_ids = result.upserted_ids
+            except BulkWriteError as e:
+                upserted_ids = {upsert["index"]: upsert["_id"] for upsert in e.details.get("upserted", [])}
+                write_errors = {
+                    error["index"]: (
+                        "Annonce écrite en même temps par un autre lot (source, source_id en double)"
+                        if error.get("code") == DUPLICATE_KEY_ERROR
+                        else error.get("errmsg", "Erreur d'écriture")
+                    )
+                    for error in e.details.get("writeErrors", [])
+                }
+            
+            refreshed: List[Dict[str, Any]] = []
+            for position, (index, car_dict) in enumerate(cars):
+                previous = existing.get((car_dict["source"], car_dict["source_id"]))
+                if position in write_errors:
+                    statuses.append(BulkItemStatus(
+                        index=index, status="error", source_id=car_dict["source_id"], error=write_errors[position]
+                    ))
+                    continue
+                
+                car_id = upserted_ids.get(position) or (previous or {}).get("_id")
+                changed_ids.append(car_id)
+                if position in upserted_ids:
+                    created_ids.append(car_id)
+                statuses.append(BulkItemStatus(
+                    index=index,
+                    status="created" if position in upserted_ids else "updated",
+                    id=str(car_id) if car_id is not None else None,
+                    source_id=car_dict["source_id"],
+                    is_good_deal=car_dict["is_good_deal"]
+                ))
+                
+                if previous and any(previous.get(field) != car_dict.get(field) for field in ["title", "price", "images"]):
+                    refreshed.append({**previous, **car_dict})
+            
+            # Mettre à jour la copie des annonces modifiées dans les favoris, en une écriture
+            if refreshed:
+                await self.favorites_service.refresh_snapshots_many(db, refreshed)
+        
+        except Exception as e:
+            logger.error(f"Erreur lors de l'ingestion d'un paquet d'annonces: {str(e)}")
+            written = {item_status.index for item_status in statuses}
+            statuses.extend(
+                BulkItemStatus(index=index, status="error", source_id=car_dict["source_id"], error="Erreur lors de l'écriture")
+                for index, car_dict in cars
+                if index not in written
+            )
+        
+        return statuses
+    
+    async def _assign_vehicle_clusters(
+        self,
+        db: AsyncIOMotorDatabase,
+        cars: List[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]
+    ) -> None:
+        """
+        Attribue le vehicle_cluster_id d'annonces sur le point d'être écrites
+        
+        `cars` associe chaque annonce à sa version stockée (None si nouvelle).
+        Les candidats de tous les blocs (marque, modèle, année, prix à ±10 %)
+        sont lus en une requête sur l'index dédié ; les annonces déjà stockées
+        rattachées ou dont le cluster est fusionné sont mises à jour en une
+        écriture groupée. Une erreur laisse les annonces sans cluster.
+        """
+        try:
+            # Plages de prix des candidats par bloc (None : bloc entier)
+            blocks: Dict[Tuple[str, str, int], Optional[List[float]]] = {}
+            for car, _ in cars:
+                key = block_key(car)
+                if key is None:
+                    continue
+                bounds = price_range(car.get("price"))
+                if key in blocks and blocks[key] is None:
+                    continue
+                if bounds is None:
+                    blocks[key] = None
+                elif key in blocks:
+                    blocks[key] = [min(blocks[key][0], bounds[0]), max(blocks[key][1], bounds[1])]
+                else:
+                    blocks[key] = list(bounds)
+            
+            candidates: Dict[Tuple[str, str, int], List[Dict[str, Any]]] = {}
+            if blocks:
+                conditions = []
+                for (brand_norm, model_norm, year), bounds in blocks.items():
+                    condition: Dict[str, Any] = {"brand_norm": brand_norm, "model_norm": model_norm, "year": year}
+                    if bounds is not None:
+                        condition["price"] = {"$gte": bounds[0], "$lte": bounds[1]}
+                    conditions.append(condition)
+                async for doc in db.cars.find({"$or": conditions}, DEDUP_CANDIDATE_PROJECTION):
+                    doc["id"] = doc.pop("_id")
+                    candidates.setdefault(block_key(doc), []).append(doc)
+            
+            detector = DuplicateDetector(lambda car: candidates.get(block_key(car), []))
+            probes = []
+            for car, previous in cars:
+                probe = {
+                    **car,
+                    "id": (previous or {}).get("_id"),
+                    "vehicle_cluster_id": (previous or {}).get("vehicle_cluster_id"),
+                    "image_hashes": car.get("image_hashes") or (previous or {}).get("image_hashes")
+                }
+                detector.assign(probe)
+                probes.append((car, probe))
+            
+            # Cluster final de chaque annonce, après les fusions du lot
+            for car, probe in probes:
+                car["text_simhash"] = probe["text_simhash"]
+                car["image_hashes"] = probe["image_hashes"]
+                car["vehicle_cluster_id"] = detector.resolve(probe["vehicle_cluster_id"])
+            
+            operations = [
+                UpdateOne(
+                    {"_id": car_id, "vehicle_cluster_id": None},
+                    {"$set": {"vehicle_cluster_id": detector.resolve(cluster_id)}}
+                )
+                for car_id, cluster_id in detector.updates.items()
+            ] + [
+                UpdateMany(
+                    {"vehicle_cluster_id": cluster_id},
+                    {"$set": {"vehicle_cluster_id": detector.resolve(cluster_id)}}
+                )
+                for cluster_id in detector.merges
+            ]
+            if operations:
+                await db.cars.bulk_write(operations, ordered=False)
+        
+        except Exception as e:
+            logger.error(f"Erreur lors de la détection des doublons: {str(e)}")
+    
+    @staticmethod
+    def _validation_message(error: ValidationError) -> str:
+        """
+        Résumé d'une erreur de validation ("champ: message; ...")
+        """
+        return "; ".join(
+            f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}"
+            for detail in error.errors()
+        )
+    
     async def update_car(
         self,
         db: AsyncIOMotorDatabase,
@@ -232,6 +812,23 @@ class CarService:
             update_data = car_data.model_dump(exclude_unset=True)
             update_data["updated_at"] = datetime.utcnow()
             
+            # Recalculer les champs normalisés si la marque, le modèle ou la localisation changent
+            if any(field in update_data for field in ["brand", "model", "location"]):
+                update_data.update(normalized_fields({**car_doc, **update_data}))
+            if any(field in update_data for field in ["title", "brand", "model", "description"]):
+                update_data.update(text_fields({**car_doc, **update_data}))
+            
+            # Historique des prix : une entrée seulement si le prix change
+            if "price" in update_data:
+                update_data.update(track_price(car_doc, update_data["price"], update_data["updated_at"]))
+            
+            # Recalculer le cluster de doublons si l'annonce a changé
+            if any(field in update_data for field in DEDUP_FIELDS):
+                updated_doc = {**car_doc, **update_data}
+                await self._assign_vehicle_clusters(db, [(updated_doc, car_doc)])
+                for field in ("vehicle_cluster_id", "text_simhash", "image_hashes"):
+                    update_data[field] = updated_doc.get(field)
+            
             # Mettre à jour l'indicateur de bonne affaire si nécessaire
             if any(field in update_data for field in ["price", "year", "mileage"]):
                 # Récupérer les données complètes de l'annonce
@@ -246,14 +843,57 @@ class CarService:
                 {"_id": ObjectId(car_id)},
                 {"$set": update_data}
             )
+            bump_ingest_generation()
             
             # Récupérer l'annonce mise à jour
             updated_car_doc = await db.cars.find_one({"_id": ObjectId(car_id)})
+            
+            # Mettre à jour la copie de l'annonce dans les favoris
+            if any(field in update_data for field in ["title", "price", "images"]):
+                await self.favorites_service.refresh_snapshots(db, updated_car_doc)
+            
             return await self._document_to_car(updated_car_doc)
         except Exception as e:
             logger.error(f"Erreur lors de la mise à jour de l'annonce {car_id}: {str(e)}")
             return None
     
+    async def get_price_drops(
+        self,
+        db: AsyncIOMotorDatabase,
+        min_drop_percent: float,
+        days: int,
+        limit: int = 20
+    ) -> List[Car]:
+        """
+        Récupère les annonces dont le prix a baissé d'au moins min_drop_percent %
+        au cours des `days` derniers jours, de la plus forte baisse à la plus faible
+        
+        L'index (last_price_drop_at, price_drop) présélectionne les annonces
+        baissées sur la période avec une baisse depuis leur pic suffisante ;
+        la baisse sur la période est ensuite vérifiée sur l'historique.
+        """
+        try:
+            since = datetime.utcnow() - timedelta(days=days)
+            min_drop = min_drop_percent / 100
+            cursor = db.cars.find({
+                "last_price_drop_at": {"$gte": since},
+                "price_drop": {"$gte": min_drop}
+            }).batch_size(max(limit * 2, 100))
+            
+            matches = []
+            async for car_doc in cursor:
+                drop = price_drop_since(car_doc.get("price_history") or [], since)
+                if drop >= min_drop:
+                    # Baisse sur la période demandée (et non depuis le pic)
+                    car_doc["price_drop"] = drop
+                    matches.append(car_doc)
+            
+            matches.sort(key=lambda car_doc: car_doc["price_drop"], reverse=True)
+            return [await self._document_to_car(car_doc) for car_doc in matches[:limit]]
+        except Exception as e:
+            logger.error(f"Erreur lors de la récupération des baisses de prix: {str(e)}")
+            return []
+    
     async def delete_car(
         self,
         db: AsyncIOMotorDatabase,
@@ -264,6 +904,8 @@ class CarService:
         """
         try:
             result = await db.cars.delete_one({"_id": ObjectId(car_id)})
+            if result.deleted_count > 0:
+                bump_ingest_generation()
             
             # Supprimer également les références dans les favoris
             await db.favorites.delete_many({"car_id": ObjectId(car_id)})
@@ -298,7 +940,7 @@ class CarService:
         try:
             query = {}
             if brand:
-                query["brand"] = {"$regex": f"^{re.escape(brand)}", "$options": "i"}
+                query["brand_norm"] = prefix_pattern(normalize_brand(brand))
             
             models = await db.cars.distinct("model", query)
             return sorted(models)
@@ -311,47 +953,51 @@ class CarService:
         Convertit un document MongoDB en objet Car
         """
         doc["id"] = str(doc.pop("_id"))
+        if isinstance(doc.get("first_seen_at"), datetime):
+            doc["days_on_market"] = (datetime.utcnow() - doc["first_seen_at"]).days
         return Car(**doc)
     
+    async def refresh_similarity_index(self, db: AsyncIOMotorDatabase) -> None:
+        """
+        Reconstruit l'index des annonces similaires (calcul des vecteurs hors de la boucle d'événements)
+        
+        Appelée uniquement par la tâche de fond : une requête ne construit jamais l'index.
+        """
+        async with _similarity_lock:
+            generation = get_ingest_generation()
+            cars = await db.cars.find({}, SIMILARITY_PROJECTION).batch_size(5000).to_list(length=None)
+            data = await asyncio.to_thread(SimilarityIndex.build, cars)
+            similarity_index.load(data, generation=generation, built_at=datetime.utcnow())
+            logger.info(f"Index des annonces similaires reconstruit: {len(cars)} annonces")
+    
     async def _get_similar_cars(
         self,
         db: AsyncIOMotorDatabase,
-        car: Car
+        car: Car,
+        limit: int = 5
     ) -> SimilarCarsResponse:
         """
         Récupère des annonces similaires à une annonce donnée
+        
+        Les plus proches voisins sont calculés en mémoire ; seules les annonces
+        retenues sont lues en base. Un modèle rare est complété par des
+        annonces proches d'autres modèles, puis d'autres marques. Tant que
+        l'index n'est pas construit (démarrage), une requête par plages
+        (même marque et modèle, année, prix et kilométrage proches) le remplace.
         """
         try:
-            # Construire la requête pour trouver des annonces similaires
-            query = {
-                "brand": car.brand,
-                "model": car.model,
-                "id": {"$ne": car.id},  # Exclure l'annonce actuelle
-                "year": {"$gte": car.year - 2, "$lte": car.year + 2}  # Années similaires
-            }
-            
-            # Ajouter des filtres sur le prix et le kilométrage
-            price_range = 0.2  # 20% de variation
-            query["price"] = {
-                "$gte": car.price * (1 - price_range),
-                "$lte": car.price * (1 + price_range)
-            }
+            if not similarity_index:
+                return await self._get_similar_cars_by_range(db, car, limit)
             
-            if car.mileage:
-                mileage_range = 0.3  # 30% de variation
-                query["mileage"] = {
-                    "$gte": car.mileage * (1 - mileage_range),
-                    "$lte": car.mileage * (1 + mileage_range)
-                }
+            neighbours = similarity_index.similar(car.model_dump(), k=limit, exclude_id=ObjectId(car.id))
+            car_ids = [car_id for car_id, _ in neighbours]
             
-            # Exécuter la requête
-            cursor = db.cars.find(query).sort("price", 1).limit(5)
-            
-            # Convertir les résultats en objets Car
-            similar_cars = []
-            async for doc in cursor:
-                similar_car = await self._document_to_car(doc)
-                similar_cars.append(similar_car)
+            # Récupérer les annonces dans l'ordre de proximité (les annonces supprimées depuis sont ignorées)
+            docs = {}
+            if car_ids:
+                async for doc in db.cars.find({"_id": {"$in": car_ids}}):
+                    docs[doc["_id"]] = doc
+            similar_cars = [await self._document_to_car(docs[car_id]) for car_id in car_ids if car_id in docs]
             
             # Calculer le prix moyen
             avg_price = sum(c.price for c in similar_cars) / len(similar_cars) if similar_cars else car.price
@@ -365,6 +1011,48 @@ class CarService:
             logger.error(f"Erreur lors de la récupération des annonces similaires: {str(e)}")
             return SimilarCarsResponse(cars=[], count=0, avg_price=car.price)
     
+    async def _get_similar_cars_by_range(
+        self,
+        db: AsyncIOMotorDatabase,
+        car: Car,
+        limit: int = 5
+    ) -> SimilarCarsResponse:
+        """
+        Annonces similaires par plages de valeurs, en attendant l'index en mémoire
+        """
+        query: Dict[str, Any] = {
+            "_id": {"$ne": ObjectId(car.id)},  # Exclure l'annonce actuelle
+            "brand_norm": normalize_brand(car.brand),
+            "model_norm": normalize_model(car.model, car.brand),
+            "year": {"$gte": car.year - 2, "$lte": car.year + 2}  # Années similaires
+        }
+        
+        # Ajouter des filtres sur le prix et le kilométrage
+        price_range = 0.2  # 20% de variation
+        query["price"] = {
+            "$gte": car.price * (1 - price_range),
+            "$lte": car.price * (1 + price_range)
+        }
+        
+        if car.mileage:
+            mileage_range = 0.3  # 30% de variation
+            query["mileage"] = {
+                "$gte": car.mileage * (1 - mileage_range),
+                "$lte": car.mileage * (1 + mileage_range)
+            }
+        
+        similar_cars = [
+            await self._document_to_car(doc)
+            async for doc in db.cars.find(query).sort("price", 1).limit(limit)
+        ]
+        avg_price = sum(c.price for c in similar_cars) / len(similar_cars) if similar_cars else car.price
+        
+        return SimilarCarsResponse(
+            cars=similar_cars,
+            count=len(similar_cars),
+            avg_price=avg_price
+        )
+    
     async def _get_price_analysis(
         self,
         db: AsyncIOMotorDatabase,
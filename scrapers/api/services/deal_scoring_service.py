@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Service pour le recalcul en masse de l'indicateur de bonne affaire
+"""
+
+import asyncio
+import logging
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from ..cache import bump_ingest_generation
+
+logger = logging.getLogger(__name__)
+
+# Mêmes critères que CarService._is_good_deal
+GOOD_DEAL_THRESHOLD_PERCENTAGE = 5
+YEAR_WINDOW = 3
+MILEAGE_FACTOR = 1.5
+
+class DealReference:
+    """
+    Prix des annonces comparables, chargés une fois pour un lot d'annonces
+
+    Les comparables sont regroupés par (marque, modèle) ; une annonce est
+    évaluée en mémoire selon les critères de CarService._is_good_deal.
+    """
+
+    def __init__(self, docs: Iterable[Dict[str, Any]]):
+        rows: Dict[Tuple[Any, Any], List[Dict[str, Any]]] = {}
+        for doc in docs:
+            if isinstance(doc.get("price"), (int, float)):
+                rows.setdefault((doc.get("brand"), doc.get("model")), []).append(doc)
+
+        self._groups: Dict[Tuple[Any, Any], Dict[str, np.ndarray]] = {}
+        for key, group in rows.items():
+            self._groups[key] = {
+                "years": self._numbers(group, "year"),
+                "mileage": self._numbers(group, "mileage"),
+                "prices": np.array([doc["price"] for doc in group], dtype=np.float64),
+                "keys": np.array([f"{doc.get('source')}:{doc.get('source_id')}" for doc in group], dtype=object)
+            }
+
+    @staticmethod
+    def _numbers(docs: List[Dict[str, Any]], field: str) -> np.ndarray:
+        return np.array(
+            [doc.get(field) if isinstance(doc.get(field), (int, float)) else np.nan for doc in docs],
+            dtype=np.float64
+        )
+
+    def is_good_deal(self, car: Dict[str, Any]) -> bool:
+        """
+        Détermine si une annonce est une bonne affaire (la version déjà stockée
+        de l'annonce, même source et source_id, est exclue des comparables)
+        """
+        group = self._groups.get((car.get("brand"), car.get("model")))
+        price = car.get("price")
+        if group is None or not isinstance(price, (int, float)):
+            return False
+
+        mask = group["keys"] != f"{car.get('source')}:{car.get('source_id')}"
+        if car.get("year"):
+            with np.errstate(invalid="ignore"):
+                mask &= np.abs(group["years"] - car["year"]) <= YEAR_WINDOW
+        if car.get("mileage"):
+            with np.errstate(invalid="ignore"):
+                mask &= (group["mileage"] >= 0) & (group["mileage"] <= car["mileage"] * MILEAGE_FACTOR)
+
+        if not mask.any():
+            return False
+
+        market_avg_price = float(group["prices"][mask].mean())
+        if market_avg_price <= 0:
+            return False
+        return (market_avg_price - price) / market_avg_price * 100 >= GOOD_DEAL_THRESHOLD_PERCENTAGE
+
+class DealScoringService:
+    """
+    Service pour le recalcul en masse de l'indicateur de bonne affaire
+    """
+
+    async def rescore_all(
+        self,
+        db: AsyncIOMotorDatabase,
+        batch_size: int = 1000,
+        cursor_batch_size: int = 10000
+    ) -> Dict[str, int]:
+        """
+        Recalcule is_good_deal pour toutes les annonces en une seule passe vectorisée
+        """
+        try:
+            # Charger uniquement les colonnes nécessaires
+            cursor = db.cars.find(
+                {},
+                {"_id": 1, "brand": 1, "model": 1, "year": 1, "price": 1, "mileage": 1, "is_good_deal": 1}
+            ).batch_size(cursor_batch_size)
+            docs = await cursor.to_list(length=None)
+
+            if not docs:
+                return {"scored": 0, "updated": 0, "good_deals": 0}
+
+            # Calcul vectorisé hors de la boucle d'événements
+            scored = await asyncio.to_thread(self._score_documents, docs)
+            if scored is None:
+                return {"scored": 0, "updated": 0, "good_deals": 0}
+            ids, flags, changed = scored
+            now = datetime.utcnow()
+
+            updated = 0
+            operations: List[UpdateOne] = []
+            for index in changed:
+                operations.append(UpdateOne(
+                    {"_id": ids[index]},
+                    {"$set": {"is_good_deal": bool(flags[index]), "updated_at": now}}
+                ))
+
+                if len(operations) >= batch_size:
+                    result = await db.cars.bulk_write(operations, ordered=False)
+                    updated += result.modified_count
+                    operations = []
+
+            if operations:
+                result = await db.cars.bulk_write(operations, ordered=False)
+                updated += result.modified_count
+
+            if updated > 0:
+                bump_ingest_generation()
+
+            stats = {
+                "scored": int(len(ids)),
+                "updated": int(updated),
+                "good_deals": int(flags.sum())
+            }
+            logger.info(f"Recalcul des bonnes affaires terminé: {stats}")
+            return stats
+
+        except Exception as e:
+            # Propagée : la route d'administration signale l'échec au lieu d'un recalcul vide
+            logger.error(f"Erreur lors du recalcul des bonnes affaires: {str(e)}")
+            raise
+
+    async def build_reference(
+        self,
+        db: AsyncIOMotorDatabase,
+        cars: List[Dict[str, Any]],
+        cursor_batch_size: int = 10000
+    ) -> DealReference:
+        """
+        Charge en une requête les comparables de toutes les (marque, modèle) d'un lot d'annonces
+        """
+        pairs = {(car.get("brand"), car.get("model")) for car in cars if car.get("brand") and car.get("model")}
+        if not pairs:
+            return DealReference([])
+
+        cursor = db.cars.find(
+            {"$or": [{"brand": brand, "model": model} for brand, model in pairs]},
+            {"_id": 0, "brand": 1, "model": 1, "year": 1, "price": 1, "mileage": 1, "source": 1, "source_id": 1}
+        ).batch_size(cursor_batch_size)
+        return DealReference(await cursor.to_list(length=None))
+
+    def _score_documents(
+        self,
+        docs: List[Dict[str, Any]]
+    ) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Calcule les indicateurs d'un ensemble d'annonces : (identifiants,
+        indicateurs, positions des indicateurs modifiés), ou None si aucune
+        annonce n'est complète
+        """
+        df = pd.DataFrame(docs)
+        for column in ["brand", "model", "year", "price", "mileage", "is_good_deal"]:
+            if column not in df.columns:
+                df[column] = None
+
+        # Ignorer les annonces incomplètes
+        df = df.dropna(subset=["brand", "model", "year", "price"])
+        if df.empty:
+            return None
+
+        flags = self.compute_good_deal_flags(df)
+
+        # N'écrire que les indicateurs qui ont changé
+        previous = df["is_good_deal"].fillna(False).astype(bool).to_numpy()
+        changed = np.flatnonzero(flags != previous)
+        return df["_id"].to_numpy(), flags, changed
+
+    def compute_good_deal_flags(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Calcule l'indicateur de bonne affaire pour chaque ligne du DataFrame
+
+        Pour chaque annonce, les comparables sont les annonces de même marque et
+        modèle, à plus ou moins 3 ans, avec un kilométrage au plus 1,5 fois celui de
+        l'annonce (sans filtre si le kilométrage est inconnu), l'annonce elle-même exclue.
+        """
+        groups = df.groupby(["brand", "model"], sort=False).ngroup().to_numpy(dtype=np.int64)
+        years = df["year"].to_numpy(dtype=np.int64)
+        prices = df["price"].to_numpy(dtype=np.float64)
+        mileage = pd.to_numeric(df["mileage"], errors="coerce").to_numpy(dtype=np.float64)
+        has_mileage = ~np.isnan(mileage) & (mileage > 0)
+
+        # Clé composite (groupe, année, kilométrage) triée une seule fois
+        min_year = years.min() - YEAR_WINDOW
+        year_span = int(years.max() + YEAR_WINDOW - min_year + 1)
+        keys = groups * year_span + (years - min_year)
+
+        # Les annonces sans kilométrage sont placées en fin de clé : elles ne sont
+        # retenues que par les requêtes sans filtre de kilométrage
+        mileage_span = np.int64(np.nanmax(np.where(has_mileage, mileage, 0)) * MILEAGE_FACTOR) + 2
+        mileage_keys = np.where(has_mileage, np.nan_to_num(mileage), 0).astype(np.int64)
+        mileage_keys = np.where(~np.isnan(mileage) & (mileage >= 0), mileage_keys, mileage_span - 1)
+        composite = keys * mileage_span + mileage_keys
+
+        order = np.argsort(composite, kind="stable")
+        sorted_composite = composite[order]
+        price_cumsum = np.concatenate(([0.0], np.cumsum(prices[order])))
+
+        upper_mileage = np.where(
+            has_mileage,
+            np.floor(np.nan_to_num(mileage) * MILEAGE_FACTOR).astype(np.int64),
+            mileage_span - 1
+        )
+
+        total_price = np.zeros(len(df), dtype=np.float64)
+        total_count = np.zeros(len(df), dtype=np.int64)
+
+        for offset in range(-YEAR_WINDOW, YEAR_WINDOW + 1):
+            target = (keys + offset) * mileage_span
+            low = np.searchsorted(sorted_composite, target, side="left")
+            high = np.searchsorted(sorted_composite, target + upper_mileage, side="right")
+            total_price += price_cumsum[high] - price_cumsum[low]
+            total_count += high - low
+
+        # Exclure l'annonce elle-même (toujours dans sa propre fenêtre)
+        total_price -= prices
+        total_count -= 1
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            market_avg = np.where(total_count > 0, total_price / np.maximum(total_count, 1), 0.0)
+            difference_percentage = np.where(
+                market_avg > 0,
+                (market_avg - prices) / market_avg * 100,
+                0.0
+            )
+
+        return (total_count > 0) & (difference_percentage >= GOOD_DEAL_THRESHOLD_PERCENTAGE)
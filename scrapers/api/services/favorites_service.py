@@ -6,20 +6,33 @@ Service pour la gestion des annonces favorites
 """
 
 import logging
-from typing import List, Optional
+from typing import List, Optional, Dict, Any
 from datetime import datetime
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, UpdateMany
 from bson import ObjectId
 
-from ..models import Favorite, FavoriteCreate, FavoriteResponse, CarsListResponse
+from ..models import Car, Favorite, FavoriteCreate, FavoriteResponse, CarsListResponse
 
 logger = logging.getLogger(__name__)
 
 class FavoritesService:
     """
     Service pour la gestion des annonces favorites
+    
+    Chaque favori conserve une copie (snapshot) du titre, du prix et de la
+    vignette de l'annonce, mise à jour avec l'annonce, ainsi que le prix au
+    moment de l'ajout : la baisse de prix s'affiche sans jointure.
     """
     
+    async def ensure_indexes(self, db: AsyncIOMotorDatabase) -> None:
+        """
+        Crée les index de la collection favorites
+        """
+        await db.favorites.create_index([("user_id", ASCENDING), ("created_at", DESCENDING)])
+        await db.favorites.create_index([("user_id", ASCENDING), ("car_id", ASCENDING)])
+        await db.favorites.create_index([("car_id", ASCENDING)])
+    
     async def add_favorite(
         self,
         db: AsyncIOMotorDatabase,
@@ -50,16 +63,17 @@ class FavoritesService:
                 if favorite_data.comments:
                     update_data["comments"] = favorite_data.comments
                 
-                if update_data:
-                    update_data["updated_at"] = datetime.utcnow()
-                    await db.favorites.update_one(
-                        {"_id": existing_favorite["_id"]},
-                        {"$set": update_data}
-                    )
+                # Rafraîchir la copie de l'annonce
+                update_data["snapshot"] = self._build_snapshot(car)
+                update_data["updated_at"] = datetime.utcnow()
+                await db.favorites.update_one(
+                    {"_id": existing_favorite["_id"]},
+                    {"$set": update_data}
+                )
                 
-                # Récupérer le favori mis à jour
+                # Récupérer le favori mis à jour (l'annonce est déjà chargée)
                 updated_favorite = await db.favorites.find_one({"_id": existing_favorite["_id"]})
-                return await self._document_to_favorite_response(db, updated_favorite)
+                return self._document_to_favorite_response(updated_favorite, car)
             
             # Créer un nouveau favori
             favorite_dict = {
@@ -67,6 +81,8 @@ class FavoritesService:
                 "car_id": ObjectId(favorite_data.car_id),
                 "note": favorite_data.note,
                 "comments": favorite_data.comments,
+                "price_at_add": car.get("price"),
+                "snapshot": self._build_snapshot(car),
                 "created_at": datetime.utcnow(),
                 "updated_at": datetime.utcnow()
             }
@@ -75,8 +91,8 @@ class FavoritesService:
             result = await db.favorites.insert_one(favorite_dict)
             
             # Récupérer le favori créé
-            created_favorite = await db.favorites.find_one({"_id": result.inserted_id})
-            return await self._document_to_favorite_response(db, created_favorite)
+            favorite_dict["_id"] = result.inserted_id
+            return self._document_to_favorite_response(favorite_dict, car)
         
         except Exception as e:
             logger.error(f"Erreur lors de l'ajout d'un favori: {str(e)}")
@@ -91,61 +107,48 @@ class FavoritesService:
     ) -> CarsListResponse:
         """
         Récupère les annonces favorites d'un utilisateur
+        
+        Le total et la page (jointe aux annonces) sont obtenus en une seule agrégation.
         """
         try:
             skip = (page - 1) * page_size
             
-            # Récupérer les IDs des annonces favorites
-            favorites_cursor = db.favorites.find(
-                {"user_id": ObjectId(user_id)}
-            ).sort("created_at", -1).skip(skip).limit(page_size)
-            
-            # Compter le nombre total de favoris
-            total = await db.favorites.count_documents({"user_id": ObjectId(user_id)})
-            
-            # Récupérer les annonces correspondantes
-            favorites = []
-            car_ids = []
-            favorites_map = {}
+            pipeline = [
+                {"$match": {"user_id": ObjectId(user_id)}},
+                {"$facet": {
+                    "total": [{"$count": "count"}],
+                    "items": [
+                        {"$sort": {"created_at": -1}},
+                        {"$skip": skip},
+                        {"$limit": page_size},
+                        {"$lookup": {
+                            "from": "cars",
+                            "localField": "car_id",
+                            "foreignField": "_id",
+                            "as": "car"
+                        }},
+                        # Les favoris dont l'annonce a été supprimée sont ignorés
+                        {"$unwind": "$car"}
+                    ]
+                }}
+            ]
             
-            async for favorite in favorites_cursor:
-                car_ids.append(favorite["car_id"])
-                favorites_map[str(favorite["car_id"])] = favorite
+            result = await db.favorites.aggregate(pipeline).to_list(length=1)
+            facet = result[0] if result else {"total": [], "items": []}
+            total = facet["total"][0]["count"] if facet["total"] else 0
             
-            # Si aucun favori, retourner une liste vide
-            if not car_ids:
-                return CarsListResponse(
-                    items=[],
-                    total=0,
-                    page=page,
-                    page_size=page_size,
-                    pages=0
-                )
-            
-            # Récupérer les annonces
-            cars_cursor = db.cars.find({"_id": {"$in": car_ids}})
-            
-            # Convertir les résultats en objets Car avec les informations de favoris
+            # Convertir les résultats en objets Car avec les informations de favoris,
+            # dans l'ordre des favoris
             cars = []
-            async for car_doc in cars_cursor:
-                car_id = str(car_doc["_id"])
-                car_doc["id"] = car_id
-                del car_doc["_id"]
-                
-                # Ajouter les informations de favoris
-                favorite = favorites_map.get(car_id)
-                if favorite:
-                    car_doc["favorite_id"] = str(favorite["_id"])
-                    car_doc["favorite_note"] = favorite.get("note")
-                    car_doc["favorite_comments"] = favorite.get("comments")
-                    car_doc["favorite_created_at"] = favorite.get("created_at")
-                
-                from ..models import Car
-                car = Car(**car_doc)
-                cars.append(car)
-            
-            # Trier les voitures dans le même ordre que les favoris
-            cars.sort(key=lambda car: car_ids.index(ObjectId(car.id)))
+            for favorite in facet["items"]:
+                car_doc = favorite.pop("car")
+                car_doc["id"] = str(car_doc.pop("_id"))
+                car_doc["favorite_id"] = str(favorite["_id"])
+                car_doc["favorite_note"] = favorite.get("note")
+                car_doc["favorite_comments"] = favorite.get("comments")
+                car_doc["favorite_created_at"] = favorite.get("created_at")
+                car_doc["favorite_price_at_add"] = favorite.get("price_at_add")
+                cars.append(Car(**car_doc))
             
             # Calculer le nombre total de pages
             total_pages = (total + page_size - 1) // page_size if total > 0 else 0
@@ -178,8 +181,8 @@ class FavoritesService:
         Récupère un favori spécifique
         """
         try:
-            # Récupérer le favori
-            favorite = await db.favorites.find_one({
+            # Récupérer le favori et son annonce
+            favorite = await self._find_favorite_with_car(db, {
                 "_id": ObjectId(favorite_id),
                 "user_id": ObjectId(user_id)
             })
@@ -187,7 +190,7 @@ class FavoritesService:
             if not favorite:
                 return None
             
-            return await self._document_to_favorite_response(db, favorite)
+            return self._document_to_favorite_response(favorite, favorite.pop("car"))
         
         except Exception as e:
             logger.error(f"Erreur lors de la récupération du favori {favorite_id}: {str(e)}")
@@ -228,6 +231,8 @@ class FavoritesService:
                     return None
                 
                 update_data["car_id"] = ObjectId(favorite_data.car_id)
+                update_data["price_at_add"] = car.get("price")
+                update_data["snapshot"] = self._build_snapshot(car)
             
             # Mettre à jour le favori
             await db.favorites.update_one(
@@ -235,9 +240,11 @@ class FavoritesService:
                 {"$set": update_data}
             )
             
-            # Récupérer le favori mis à jour
-            updated_favorite = await db.favorites.find_one({"_id": ObjectId(favorite_id)})
-            return await self._document_to_favorite_response(db, updated_favorite)
+            # Récupérer le favori mis à jour et son annonce
+            updated_favorite = await self._find_favorite_with_car(db, {"_id": ObjectId(favorite_id)})
+            if not updated_favorite:
+                return None
+            return self._document_to_favorite_response(updated_favorite, updated_favorite.pop("car"))
         
         except Exception as e:
             logger.error(f"Erreur lors de la mise à jour du favori {favorite_id}: {str(e)}")
@@ -285,24 +292,83 @@ class FavoritesService:
             logger.error(f"Erreur lors de la vérification du favori: {str(e)}")
             return False
     
-    async def _document_to_favorite_response(
+    async def get_favorite_ids_by_car(
+        self,
+        db: AsyncIOMotorDatabase,
+        user_id: str,
+        car_ids: List[str]
+    ) -> Dict[str, str]:
+        """
+        Retourne, pour les annonces d'une page, l'ID du favori de l'utilisateur (une seule requête)
+        """
+        try:
+            if not car_ids:
+                return {}
+            
+            cursor = db.favorites.find(
+                {
+                    "user_id": ObjectId(user_id),
+                    "car_id": {"$in": [ObjectId(car_id) for car_id in car_ids]}
+                },
+                {"car_id": 1}
+            )
+            
+            return {
+                str(favorite["car_id"]): str(favorite["_id"])
+                async for favorite in cursor
+            }
+        
+        except Exception as e:
+            logger.error(f"Erreur lors de la vérification des favoris: {str(e)}")
+            return {}
+    
+    async def _find_favorite_with_car(
         self,
         db: AsyncIOMotorDatabase,
-        doc: dict
+        query: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Récupère un favori et son annonce (champ "car", None si supprimée) en une seule agrégation
+        """
+        result = await db.favorites.aggregate([
+            {"$match": query},
+            {"$limit": 1},
+            {"$lookup": {
+                "from": "cars",
+                "localField": "car_id",
+                "foreignField": "_id",
+                "as": "car"
+            }}
+        ]).to_list(length=1)
+        
+        if not result:
+            return None
+        favorite = result[0]
+        favorite["car"] = favorite["car"][0] if favorite["car"] else None
+        return favorite
+    
+    def _document_to_favorite_response(
+        self,
+        doc: dict,
+        car: Optional[Dict[str, Any]]
     ) -> FavoriteResponse:
         """
         Convertit un document MongoDB en objet FavoriteResponse
-        """
-        # Récupérer l'annonce associée
-        car = await db.cars.find_one({"_id": doc["car_id"]})
         
+        L'annonce associée est fournie par l'appelant (déjà chargée ou jointe),
+        sans requête supplémentaire.
+        """
         car_data = None
         if car:
-            car["id"] = str(car["_id"])
-            del car["_id"]
-            from ..models import Car
+            car = dict(car)
+            car["id"] = str(car.pop("_id"))
             car_data = Car(**car)
         
+        snapshot = doc.get("snapshot")
+        price_drop = None
+        if snapshot and snapshot.get("price") is not None and doc.get("price_at_add") is not None:
+            price_drop = max(doc["price_at_add"] - snapshot["price"], 0)
+        
         return FavoriteResponse(
             id=str(doc["_id"]),
             user_id=str(doc["user_id"]),
@@ -311,5 +377,65 @@ class FavoritesService:
             comments=doc.get("comments"),
             created_at=doc["created_at"],
             updated_at=doc["updated_at"],
+            price_at_add=doc.get("price_at_add"),
+            snapshot=snapshot,
+            price_drop=price_drop,
             car=car_data
-        ) 
\ No newline at end of file
+        )
+    
+    async def refresh_snapshots(
+        self,
+        db: AsyncIOMotorDatabase,
+        car: Dict[str, Any]
+    ) -> int:
+        """
+        Met à jour la copie de l'annonce sur tous les favoris qui la référencent
+        """
+        try:
+            result = await db.favorites.update_many(
+                {"car_id": car["_id"]},
+                {"$set": {"snapshot": self._build_snapshot(car)}}
+            )
+            return result.modified_count
+        
+        except Exception as e:
+            logger.error(f"Erreur lors de la mise à jour des favoris de l'annonce {car.get('_id')}: {str(e)}")
+            return 0
+    
+    async def refresh_snapshots_many(
+        self,
+        db: AsyncIOMotorDatabase,
+        cars: List[Dict[str, Any]]
+    ) -> int:
+        """
+        Met à jour la copie de plusieurs annonces sur leurs favoris avec un seul bulk_write
+        """
+        if not cars:
+            return 0
+        
+        try:
+            result = await db.favorites.bulk_write(
+                [
+                    UpdateMany({"car_id": car["_id"]}, {"$set": {"snapshot": self._build_snapshot(car)}})
+                    for car in cars
+                ],
+                ordered=False
+            )
+            return result.modified_count
+        
+        except Exception as e:
+            logger.error(f"Erreur lors de la mise à jour des favoris de {len(cars)} annonces: {str(e)}")
+            return 0
+    
+    @staticmethod
+    def _build_snapshot(car: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Construit la copie dénormalisée d'une annonce (titre, prix, vignette)
+        """
+        images = car.get("images") or []
+        return {
+            "title": car.get("title"),
+            "price": car.get("price"),
+            "thumbnail": str(images[0]) if images else None,
+            "updated_at": datetime.utcnow()
+        } 
\ No newline at end of file
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Service pour les instantanés quotidiens du marché
+"""
+
+import logging
+from typing import Dict, List, Any, Optional
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, UpdateOne
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+class MarketSnapshotService:
+    """
+    Service pour les instantanés quotidiens du marché
+
+    La collection market_daily contient un document par (date, marque, modèle,
+    carburant) avec le nombre d'annonces publiées ce jour-là et les statistiques
+    de prix. Elle survit à la suppression des annonces par la rétention.
+    """
+
+    async def ensure_indexes(self, db: AsyncIOMotorDatabase) -> None:
+        """
+        Crée les index de la collection market_daily
+        """
+        await db.market_daily.create_index(
+            [("date", ASCENDING), ("brand", ASCENDING), ("model", ASCENDING), ("fuel_type", ASCENDING)],
+            unique=True
+        )
+        await db.market_daily.create_index([("brand", ASCENDING), ("model", ASCENDING), ("date", ASCENDING)])
+
+    async def rollup(
+        self,
+        db: AsyncIOMotorDatabase,
+        start_date: datetime,
+        end_date: datetime,
+        brand: Optional[str] = None,
+        model: Optional[str] = None,
+        include_expired: bool = False
+    ) -> int:
+        """
+        Recalcule les instantanés des annonces publiées entre deux dates
+        
+        Les jours antérieurs à la rétention des annonces sont ignorés : leurs
+        annonces ont pu être supprimées par le nettoyage et le recalcul
+        écraserait l'instantané d'origine (sauf include_expired, pour la
+        première construction de la collection).
+        """
+        try:
+            if not include_expired:
+                start_date = max(start_date, self.retention_cutoff())
+            if start_date >= end_date:
+                return 0
+
+            query: Dict[str, Any] = {"created_at": {"$gte": start_date, "$lt": end_date}}
+            if brand:
+                query["brand"] = brand
+            if model:
+                query["model"] = model
+
+            cursor = db.cars.aggregate([
+                {"$match": query},
+                {"$group": {
+                    "_id": {
+                        "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+                        "brand": "$brand",
+                        "model": "$model",
+                        "fuel_type": "$fuel_type"
+                    },
+                    "count": {"$sum": 1},
+                    "avg_price": {"$avg": "$price"},
+                    "prices": {"$push": "$price"}
+                }}
+            ], allowDiskUse=True)
+
+            now = datetime.utcnow()
+            operations: List[UpdateOne] = []
+            async for doc in cursor:
+                prices = sorted(p for p in doc["prices"] if p is not None)
+                key = {
+                    "date": doc["_id"]["date"],
+                    "brand": doc["_id"].get("brand"),
+                    "model": doc["_id"].get("model"),
+                    "fuel_type": doc["_id"].get("fuel_type")
+                }
+                operations.append(UpdateOne(
+                    key,
+                    {"$set": {
+                        "count": doc["count"],
+                        "avg_price": round(doc["avg_price"], 2) if doc["avg_price"] is not None else 0,
+                        "median_price": self._percentile(prices, 0.5),
+                        "p10_price": self._percentile(prices, 0.1),
+                        "p90_price": self._percentile(prices, 0.9),
+                        "updated_at": now
+                    }},
+                    upsert=True
+                ))
+
+            if operations:
+                await db.market_daily.bulk_write(operations, ordered=False)
+
+            return len(operations)
+
+        except Exception as e:
+            logger.error(f"Erreur lors du calcul des instantanés du marché: {str(e)}")
+            return 0
+
+    async def rollup_recent(
+        self,
+        db: AsyncIOMotorDatabase,
+        days: int = 2
+    ) -> int:
+        """
+        Recalcule les instantanés des derniers jours (tâche quotidienne)
+
+        Si la collection est vide, l'historique encore présent dans db.cars est
+        d'abord reconstruit.
+        """
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        if await db.market_daily.count_documents({}, limit=1) == 0:
+            return await self.rollup(db, datetime.min, today + timedelta(days=1), include_expired=True)
+
+        return await self.rollup(db, today - timedelta(days=days - 1), today + timedelta(days=1))
+
+    async def rollup_for_car(
+        self,
+        db: AsyncIOMotorDatabase,
+        car: Dict[str, Any]
+    ) -> int:
+        """
+        Met à jour l'instantané du jour de publication d'une annonce ingérée
+        """
+        created_at = car.get("created_at")
+        if not created_at:
+            return 0
+
+        day = created_at.replace(hour=0, minute=0, second=0, microsecond=0)
+        return await self.rollup(db, day, day + timedelta(days=1), car.get("brand"), car.get("model"))
+
+    @staticmethod
+    def retention_cutoff() -> datetime:
+        """
+        Premier jour dont toutes les annonces sont encore conservées
+        (le nettoyage supprime celles de plus de DB_CLEANUP_OLDER_THAN_DAYS jours)
+        """
+        expired_before = datetime.utcnow() - timedelta(days=settings.DB_CLEANUP_OLDER_THAN_DAYS)
+        return expired_before.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+    async def get_daily_series(
+        self,
+        db: AsyncIOMotorDatabase,
+        start_date: datetime,
+        brand: Optional[str] = None,
+        model: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Récupère la série quotidienne (date, prix moyen, volume) depuis les instantanés
+        """
+        query: Dict[str, Any] = {"date": {"$gte": start_date.strftime("%Y-%m-%d")}}
+        if brand:
+            query["brand"] = brand
+        if model:
+            query["model"] = model
+
+        cursor = db.market_daily.aggregate([
+            {"$match": query},
+            {"$group": {
+                "_id": "$date",
+                "total_price": {"$sum": {"$multiply": ["$avg_price", "$count"]}},
+                "count": {"$sum": "$count"}
+            }},
+            {"$sort": {"_id": 1}}
+        ])
+
+        series = []
+        async for doc in cursor:
+            if doc["count"] > 0:
+                series.append({
+                    "date": doc["_id"],
+                    "avg_price": doc["total_price"] / doc["count"],
+                    "count": doc["count"]
+                })
+        return series
+
+    @staticmethod
+    def _percentile(sorted_values: List[float], q: float) -> float:
+        """
+        Percentile par interpolation linéaire sur une liste triée
+        """
+        if not sorted_values:
+            return 0
+        position = (len(sorted_values) - 1) * q
+        lower = int(position)
+        upper = min(lower + 1, len(sorted_values) - 1)
+        fraction = position - lower
+        value = sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * fraction
+        return round(value, 2)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Service pour la file des notifications par email
+"""
+
+import logging
+from typing import Dict, List, Any
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, UpdateMany
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+class NotificationService:
+    """
+    Service pour la file des notifications par email
+
+    Les notifications sont déposées en masse dans la collection
+    notification_queue, puis regroupées par utilisateur en un résumé dès que la
+    plus ancienne attend depuis la fenêtre de regroupement. Un résumé est
+    réservé (statut "sending") avant l'envoi pour qu'un seul worker le traite.
+    Après un échec, les notifications ne sont reproposées qu'à partir de
+    next_attempt_at, avec un délai qui double à chaque essai.
+    """
+
+    async def ensure_indexes(self, db: AsyncIOMotorDatabase) -> None:
+        """
+        Crée les index de la collection notification_queue
+        """
+        await db.notification_queue.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+        await db.notification_queue.create_index([("claim_id", ASCENDING)])
+        # Les notifications envoyées sont conservées une semaine
+        await db.notification_queue.create_index("sent_at", expireAfterSeconds=7 * 24 * 3600)
+
+    async def enqueue(
+        self,
+        db: AsyncIOMotorDatabase,
+        notifications: List[Dict[str, Any]]
+    ) -> int:
+        """
+        Dépose un lot de notifications dans la file
+        """
+        if not notifications:
+            return 0
+
+        now = datetime.utcnow()
+        documents = [
+            {
+                **notification,
+                "status": "pending",
+                "attempts": 0,
+                "created_at": now
+            }
+            for notification in notifications
+        ]
+        result = await db.notification_queue.insert_many(documents, ordered=False)
+        return len(result.inserted_ids)
+
+    async def claim_digests(
+        self,
+        db: AsyncIOMotorDatabase,
+        window: timedelta,
+        limit: int = 100,
+        stale_after: timedelta = timedelta(minutes=10)
+    ) -> List[Dict[str, Any]]:
+        """
+        Réserve les résumés prêts à être envoyés
+
+        Retourne un résumé par utilisateur : {"user_id", "email", "items"}.
+        """
+        now = datetime.utcnow()
+
+        # Remettre en file les résumés réservés par un worker interrompu. Le jeton
+        # de réservation est conservé : un envoi qui se termine tardivement les
+        # marque encore comme envoyés tant qu'ils n'ont pas été réservés à nouveau
+        await db.notification_queue.update_many(
+            {"status": "sending", "claimed_at": {"$lt": now - stale_after}},
+            {"$set": {"status": "pending"}, "$unset": {"claimed_at": ""}}
+        )
+
+        # Utilisateurs dont la plus ancienne notification a dépassé la fenêtre
+        ready = await db.notification_queue.aggregate([
+            {"$match": {
+                "status": "pending",
+                "$or": [{"next_attempt_at": None}, {"next_attempt_at": {"$lte": now}}]
+            }},
+            {"$group": {
+                "_id": "$user_id",
+                "oldest": {"$min": "$created_at"},
+                "ids": {"$push": "$_id"}
+            }},
+            {"$match": {"oldest": {"$lte": now - window}}},
+            {"$sort": {"oldest": 1}},
+            {"$limit": limit}
+        ]).to_list(length=limit)
+
+        if not ready:
+            return []
+
+        # Réserver chaque résumé sous un identifiant propre
+        claims = {ObjectId(): group for group in ready}
+        await db.notification_queue.bulk_write([
+            UpdateMany(
+                {"_id": {"$in": group["ids"]}, "status": "pending"},
+                {"$set": {"status": "sending", "claim_id": claim_id, "claimed_at": now}}
+            )
+            for claim_id, group in claims.items()
+        ], ordered=False)
+
+        items_by_claim: Dict[ObjectId, List[Dict[str, Any]]] = {}
+        async for item in db.notification_queue.find({"claim_id": {"$in": list(claims)}}):
+            items_by_claim.setdefault(item["claim_id"], []).append(item)
+
+        # Adresses des destinataires en une seule requête
+        user_ids = [group["_id"] for group in ready]
+        emails = {
+            user["_id"]: user.get("email")
+            async for user in db.users.find({"_id": {"$in": user_ids}}, {"email": 1})
+        }
+
+        digests = []
+        for claim_id, items in items_by_claim.items():
+            user_id = items[0]["user_id"]
+            digests.append({
+                "claim_id": claim_id,
+                "user_id": user_id,
+                "email": emails.get(user_id),
+                "items": sorted(items, key=lambda item: item["created_at"])
+            })
+        return digests
+
+    async def mark_sent(self, db: AsyncIOMotorDatabase, claim_id: ObjectId) -> None:
+        """
+        Marque un résumé comme envoyé
+
+        Le filtre sur le jeton de réservation couvre aussi les notifications
+        remises en file entre-temps, tant qu'un autre worker ne les a pas réservées.
+        """
+        await db.notification_queue.update_many(
+            {"claim_id": claim_id, "status": {"$in": ["sending", "pending"]}},
+            {"$set": {"status": "sent", "sent_at": datetime.utcnow()}}
+        )
+
+    async def mark_failed(
+        self,
+        db: AsyncIOMotorDatabase,
+        claim_id: ObjectId,
+        max_attempts: int,
+        retry_delay: timedelta = timedelta(minutes=1),
+        max_retry_delay: timedelta = timedelta(hours=1)
+    ) -> None:
+        """
+        Remet un résumé en file après un échec, ou l'abandonne après trop d'essais
+
+        Le prochain essai est reporté de retry_delay * 2^(essais - 1), plafonné à
+        max_retry_delay. Une seule écriture, limitée aux notifications encore
+        réservées sous ce jeton.
+        """
+        now = datetime.utcnow()
+        base_ms = retry_delay.total_seconds() * 1000
+        max_ms = max_retry_delay.total_seconds() * 1000
+        await db.notification_queue.update_many(
+            {"claim_id": claim_id, "status": "sending"},
+            [
+                {"$set": {"attempts": {"$add": [{"$ifNull": ["$attempts", 0]}, 1]}}},
+                {"$set": {
+                    "status": {"$cond": [{"$gte": ["$attempts", max_attempts]}, "failed", "pending"]},
+                    "next_attempt_at": {"$add": [
+                        now,
+                        {"$min": [max_ms, {"$multiply": [base_ms, {"$pow": [2, {"$subtract": ["$attempts", 1]}]}]}]}
+                    ]}
+                }},
+                {"$unset": ["claim_id", "claimed_at"]}
+            ]
+        )
@@ -5,23 +5,46 @@
 Service pour la recherche d'annonces de voitures
 """
 
+import asyncio
 import logging
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 from motor.motor_asyncio import AsyncIOMotorDatabase
-import re
 
 from ..models import (
-    Car, CarsListResponse, SearchQuery, SearchSuggestion
+    Car, CarsListResponse, SearchQuery, SearchSuggestion, SearchRequest
+)
+from ..autocomplete import AutocompleteIndex
+from ..fulltext import (
+    build_text_filter, ensure_text_index, RELEVANCE_PROJECTION, RELEVANCE_SORT
+)
+from ..normalization import (
+    normalize_brand, normalize_model, location_tokens, prefix_pattern
+)
+from ..geocoding import resolve_near, radius_filter
+from ..text import fold, tokenize
+from ..search_history import (
+    search_history_recorder, popular_searches, ensure_indexes as ensure_search_history_indexes
 )
 
 logger = logging.getLogger(__name__)
 
+# Index d'autocomplétion du processus, reconstruit périodiquement
+autocomplete_index = AutocompleteIndex()
+_autocomplete_lock = asyncio.Lock()
+
 class SearchService:
     """
     Service pour la recherche d'annonces de voitures
     """
     
+    async def ensure_indexes(self, db: AsyncIOMotorDatabase) -> None:
+        """
+        Crée l'index texte des annonces et les index de l'historique de recherche
+        """
+        await ensure_text_index(db)
+        await ensure_search_history_indexes(db)
+    
     async def search(
         self,
         db: AsyncIOMotorDatabase,
@@ -43,10 +66,11 @@ class SearchService:
             total = await db.cars.count_documents(search_query)
             
             # Déterminer le tri
-            sort_criteria = self._get_sort_criteria(query.sort_by)
+            sort_criteria = self._get_sort_criteria(query.sort_by, "$text" in search_query)
+            projection = RELEVANCE_PROJECTION if "$text" in search_query else None
             
             # Récupérer les résultats
-            cursor = db.cars.find(search_query).sort(sort_criteria).skip(skip).limit(page_size)
+            cursor = db.cars.find(search_query, projection).sort(sort_criteria).skip(skip).limit(page_size)
             
             # Convertir les résultats en objets Car
             cars = []
@@ -58,9 +82,10 @@ class SearchService:
             # Calculer le nombre total de pages
             total_pages = (total + page_size - 1) // page_size if total > 0 else 0
             
-            # Enregistrer la recherche si un utilisateur est spécifié
+            # Enregistrer la recherche si un utilisateur est spécifié (écriture différée)
             if user_id:
-                await self._record_search(db, query, user_id, total)
+                query_parts = [part for part in (query.keywords, query.brand, query.model) if part]
+                self._record_search(query_parts, query.model_dump(), user_id, total)
             
             # Retourner la réponse
             return CarsListResponse(
@@ -80,157 +105,151 @@ class SearchService:
                 pages=0
             )
     
-    async def get_suggestions(
+    async def search_cars(
         self,
         db: AsyncIOMotorDatabase,
-        prefix: str,
-        type: str = "brand",
-        limit: int = 10
-    ) -> List[SearchSuggestion]:
+        search_request: SearchRequest,
+        user_id: Optional[str] = None
+    ) -> CarsListResponse:
         """
-        Récupère des suggestions pour l'autocomplétion
+        Recherche des annonces à partir d'une requête de recherche (filtres multiples)
+        
+        Les mots-clés passent par l'index texte ; le tri par pertinence
+        (par défaut) classe les annonces selon leur score.
         """
+        page = search_request.page
+        page_size = search_request.page_size
         try:
-            suggestions = []
-            
-            if not prefix or len(prefix) < 2:
-                return suggestions
+            skip = (page - 1) * page_size
             
-            # Échapper les caractères spéciaux dans le préfixe
-            escaped_prefix = re.escape(prefix)
+            # Construction de la requête de recherche
+            search_query = self._build_filters_query(search_request.filters)
+            has_text = "$text" in search_query
             
-            if type == "brand":
-                # Rechercher des marques
-                cursor = db.cars.aggregate([
-                    {"$match": {"brand": {"$regex": f"^{escaped_prefix}", "$options": "i"}}},
-                    {"$group": {"_id": "$brand", "count": {"$sum": 1}}},
-                    {"$sort": {"count": -1}},
-                    {"$limit": limit}
-                ])
-                
-                async for doc in cursor:
-                    suggestions.append(SearchSuggestion(
-                        text=doc["_id"],
-                        type="brand",
-                        count=doc["count"]
-                    ))
+            # Exécuter la requête
+            total = await db.cars.count_documents(search_query)
             
-            elif type == "model":
-                # Rechercher des modèles
-                cursor = db.cars.aggregate([
-                    {"$match": {"model": {"$regex": f"^{escaped_prefix}", "$options": "i"}}},
-                    {"$group": {"_id": "$model", "count": {"$sum": 1}}},
-                    {"$sort": {"count": -1}},
-                    {"$limit": limit}
-                ])
-                
-                async for doc in cursor:
-                    suggestions.append(SearchSuggestion(
-                        text=doc["_id"],
-                        type="model",
-                        count=doc["count"]
-                    ))
+            # Récupérer les résultats
+            sort_criteria = self._get_sort_criteria(search_request.sort_by.value, has_text)
+            projection = RELEVANCE_PROJECTION if has_text else None
+            cursor = db.cars.find(search_query, projection).sort(sort_criteria).skip(skip).limit(page_size)
             
-            elif type == "location":
-                # Rechercher des localisations
-                cursor = db.cars.aggregate([
-                    {"$match": {"location": {"$regex": f".*{escaped_prefix}.*", "$options": "i"}}},
-                    {"$group": {"_id": "$location", "count": {"$sum": 1}}},
-                    {"$sort": {"count": -1}},
-                    {"$limit": limit}
-                ])
-                
-                async for doc in cursor:
-                    suggestions.append(SearchSuggestion(
-                        text=doc["_id"],
-                        type="location",
-                        count=doc["count"]
-                    ))
+            # Convertir les résultats en objets Car
+            cars = []
+            async for car_doc in cursor:
+                car_doc["id"] = str(car_doc.pop("_id"))
+                cars.append(Car(**car_doc))
             
-            elif type == "keyword":
-                # Rechercher dans les titres et descriptions
-                title_cursor = db.cars.aggregate([
-                    {"$match": {"title": {"$regex": f".*{escaped_prefix}.*", "$options": "i"}}},
-                    {"$group": {"_id": "$title", "count": {"$sum": 1}}},
-                    {"$sort": {"count": -1}},
-                    {"$limit": limit // 2}
-                ])
-                
-                async for doc in title_cursor:
-                    # Extraire les mots-clés pertinents du titre
-                    words = doc["_id"].split()
-                    for word in words:
-                        if len(word) > 3 and word.lower().startswith(prefix.lower()):
-                            suggestions.append(SearchSuggestion(
-                                text=word,
-                                type="keyword",
-                                count=doc["count"]
-                            ))
-                            break
-                
-                # Compléter avec des mots-clés de la description si nécessaire
-                if len(suggestions) < limit:
-                    desc_cursor = db.cars.aggregate([
-                        {"$match": {"description": {"$regex": f".*{escaped_prefix}.*", "$options": "i"}}},
-                        {"$group": {"_id": "$description", "count": {"$sum": 1}}},
-                        {"$sort": {"count": -1}},
-                        {"$limit": limit - len(suggestions)}
-                    ])
-                    
-                    async for doc in desc_cursor:
-                        # Extraire les mots-clés pertinents de la description
-                        words = doc["_id"].split()
-                        for word in words:
-                            if len(word) > 3 and word.lower().startswith(prefix.lower()):
-                                suggestions.append(SearchSuggestion(
-                                    text=word,
-                                    type="keyword",
-                                    count=doc["count"]
-                                ))
-                                break
+            # Calculer le nombre total de pages
+            total_pages = (total + page_size - 1) // page_size if total > 0 else 0
             
-            # Dédupliquer les suggestions
-            unique_suggestions = {}
-            for suggestion in suggestions:
-                if suggestion.text.lower() not in unique_suggestions:
-                    unique_suggestions[suggestion.text.lower()] = suggestion
+            # Enregistrer la recherche si un utilisateur est spécifié (écriture différée)
+            if user_id:
+                filters = search_request.filters
+                query_parts = (filters.keywords or []) + (filters.brands or []) + (filters.models or [])
+                self._record_search(query_parts, search_request.model_dump(mode="json"), user_id, total)
             
-            return list(unique_suggestions.values())[:limit]
-        
+            return CarsListResponse(
+                items=cars,
+                total=total,
+                page=page,
+                page_size=page_size,
+                pages=total_pages
+            )
         except Exception as e:
-            logger.error(f"Erreur lors de la récupération des suggestions: {str(e)}")
-            return []
+            logger.error(f"Erreur lors de la recherche: {str(e)}")
+            return CarsListResponse(
+                items=[],
+                total=0,
+                page=page,
+                page_size=page_size,
+                pages=0
+            )
     
-    async def get_popular_searches(
+    async def get_suggestions(
         self,
         db: AsyncIOMotorDatabase,
+        prefix: str,
+        type: Optional[str] = "brand",
         limit: int = 10
     ) -> List[SearchSuggestion]:
         """
-        Récupère les recherches populaires
+        Récupère des suggestions pour l'autocomplétion
+        
+        Les suggestions sont servies par l'index en mémoire, sans lire la base :
+        tant que la tâche de fond ne l'a pas construit, aucune suggestion.
         """
         try:
-            popular_searches = []
+            if not prefix or len(prefix) < 2 or not autocomplete_index:
+                return []
+            
+            return [
+                SearchSuggestion(type=suggestion_type, value=value, count=count)
+                for suggestion_type, value, count in autocomplete_index.suggest(prefix, type, limit)
+            ]
+        
+        except Exception as e:
+            logger.error(f"Erreur lors de la récupération des suggestions: {str(e)}")
+            return []
+    
+    async def refresh_autocomplete(self, db: AsyncIOMotorDatabase) -> None:
+        """
+        Reconstruit l'index d'autocomplétion (marques, modèles, localisations, mots des titres)
+        
+        Appelée uniquement par la tâche de fond : une requête ne construit jamais l'index.
+        """
+        async with _autocomplete_lock:
+            counts: Dict[str, Dict[str, int]] = {}
             
-            # Récupérer les recherches les plus fréquentes
-            cursor = db.search_history.aggregate([
-                {"$group": {"_id": "$query_text", "count": {"$sum": 1}}},
-                {"$sort": {"count": -1}},
-                {"$limit": limit}
-            ])
+            for suggestion_type, field in [("brand", "brand"), ("model", "model"), ("location", "location")]:
+                cursor = db.cars.aggregate([
+                    {"$match": {field: {"$type": "string", "$ne": ""}}},
+                    {"$group": {"_id": f"${field}", "count": {"$sum": 1}}}
+                ], allowDiskUse=True)
+                
+                # Fusionner les variantes de casse et d'accents sous la plus fréquente
+                merged: Dict[str, List] = {}
+                async for doc in cursor:
+                    key = fold(doc["_id"])
+                    if key not in merged:
+                        merged[key] = [doc["_id"], doc["count"], doc["count"]]
+                    else:
+                        entry = merged[key]
+                        entry[2] += doc["count"]
+                        if doc["count"] > entry[1]:
+                            entry[0], entry[1] = doc["_id"], doc["count"]
+                counts[suggestion_type] = {value: total for value, _, total in merged.values()}
             
+            # Mots des titres (plus de 3 lettres), comptés par annonce
+            keywords: Dict[str, int] = {}
+            cursor = db.cars.aggregate([
+                {"$match": {"title": {"$type": "string"}}},
+                {"$group": {"_id": "$title", "count": {"$sum": 1}}}
+            ], allowDiskUse=True)
             async for doc in cursor:
-                popular_searches.append(SearchSuggestion(
-                    text=doc["_id"],
-                    type="popular_search",
-                    count=doc["count"]
-                ))
+                for word in set(tokenize(doc["_id"])):
+                    if len(word) > 3 and not word.isdigit():
+                        keywords[word] = keywords.get(word, 0) + doc["count"]
+            counts["keyword"] = keywords
             
-            return popular_searches
+            autocomplete_index.load(counts, built_at=datetime.utcnow())
+            logger.info(f"Index d'autocomplétion reconstruit: {sum(len(values) for values in counts.values())} entrées")
+    
+    async def get_popular_searches(
+        self,
+        db: AsyncIOMotorDatabase,
+        limit: int = 10
+    ) -> List[SearchSuggestion]:
+        """
+        Récupère les recherches populaires
         
-        except Exception as e:
-            logger.error(f"Erreur lors de la récupération des recherches populaires: {str(e)}")
-            return []
+        Le top est précalculé à partir des compteurs horaires de la fenêtre
+        glissante : la lecture ne touche pas la base.
+        """
+        return [
+            SearchSuggestion(type="popular_search", value=query_text, count=count)
+            for query_text, count in popular_searches.top(limit)
+        ]
     
     async def get_recent_searches(
         self,
@@ -251,7 +270,7 @@ class SearchService:
             
             async for doc in cursor:
                 recent_searches.append(SearchSuggestion(
-                    text=doc["query_text"],
+                    value=doc["query_text"],
                     type="recent_search",
                     count=1
                 ))
@@ -259,8 +278,8 @@ class SearchService:
             # Dédupliquer les recherches
             unique_searches = {}
             for search in recent_searches:
-                if search.text not in unique_searches:
-                    unique_searches[search.text] = search
+                if search.value not in unique_searches:
+                    unique_searches[search.value] = search
             
             return list(unique_searches.values())
         
@@ -289,12 +308,12 @@ class SearchService:
         """
         search_query = {}
         
-        # Ajouter les filtres de base
+        # Ajouter les filtres de base (marque et modèle sur les champs normalisés)
         if query.brand:
-            search_query["brand"] = {"$regex": f"^{re.escape(query.brand)}", "$options": "i"}
+            search_query["brand_norm"] = prefix_pattern(normalize_brand(query.brand))
         
         if query.model:
-            search_query["model"] = {"$regex": f"^{re.escape(query.model)}", "$options": "i"}
+            search_query["model_norm"] = prefix_pattern(normalize_model(query.model, query.brand))
         
         if query.price_min is not None:
             search_query.setdefault("price", {})
@@ -326,8 +345,8 @@ class SearchService:
         if query.transmission:
             search_query["transmission"] = query.transmission
         
-        if query.location:
-            search_query["location"] = {"$regex": f".*{re.escape(query.location)}.*", "$options": "i"}
+        if query.location and location_tokens(query.location):
+            search_query["location_tokens"] = {"$all": location_tokens(query.location)}
         
         if query.source:
             search_query["source"] = query.source
@@ -335,73 +354,119 @@ class SearchService:
         if query.good_deals_only:
             search_query["is_good_deal"] = True
         
-        # Recherche par mots-clés
-        if query.keywords:
-            keywords = query.keywords.split()
-            keyword_conditions = []
-            for keyword in keywords:
-                keyword_conditions.append({
-                    "$or": [
-                        {"title": {"$regex": f".*{re.escape(keyword)}.*", "$options": "i"}},
-                        {"description": {"$regex": f".*{re.escape(keyword)}.*", "$options": "i"}}
-                    ]
-                })
-            if keyword_conditions:
-                search_query["$and"] = keyword_conditions
+        # Recherche par mots-clés (index texte)
+        text_filter = build_text_filter(query.keywords)
+        if text_filter:
+            search_query.update(text_filter)
         
         return search_query
     
-    def _get_sort_criteria(self, sort_by: str) -> List[tuple]:
+    def _build_filters_query(self, filters) -> Dict[str, Any]:
+        """
+        Construit une requête MongoDB à partir des filtres d'une SearchRequest
+        """
+        search_query = {}
+        
+        # Marques et modèles : préfixes sur les champs normalisés (indexés)
+        if filters.brands:
+            search_query["brand_norm"] = {"$in": [
+                prefix_pattern(normalize_brand(brand)) for brand in filters.brands
+            ]}
+        
+        if filters.models:
+            brand = filters.brands[0] if filters.brands and len(filters.brands) == 1 else None
+            search_query["model_norm"] = {"$in": [
+                prefix_pattern(normalize_model(model, brand)) for model in filters.models
+            ]}
+        
+        for field in ("price", "year", "mileage"):
+            minimum = getattr(filters, f"{field}_min")
+            maximum = getattr(filters, f"{field}_max")
+            if minimum is not None:
+                search_query.setdefault(field, {})["$gte"] = minimum
+            if maximum is not None:
+                search_query.setdefault(field, {})["$lte"] = maximum
+        
+        if filters.fuel_types:
+            search_query["fuel_type"] = {"$in": [fuel_type.value for fuel_type in filters.fuel_types]}
+        
+        if filters.transmission_types:
+            search_query["transmission"] = {"$in": [transmission.value for transmission in filters.transmission_types]}
+        
+        if filters.location and location_tokens(filters.location):
+            search_query["location_tokens"] = {"$all": location_tokens(filters.location)}
+        
+        # Recherche par rayon (index 2dsphere) ; une localisation inconnue ne renvoie rien
+        if filters.near:
+            center = resolve_near(filters.near)
+            if center is None:
+                raise ValueError(f"Localisation inconnue ou imprécise: {filters.near}")
+            search_query["location_point"] = radius_filter(center, filters.radius_km or filters.radius or 50)
+        
+        if filters.sources:
+            search_query["source"] = {"$in": filters.sources}
+        
+        if filters.seller_type:
+            search_query["seller_type"] = filters.seller_type
+        
+        if filters.good_deals_only:
+            search_query["is_good_deal"] = True
+        
+        # Recherche par mots-clés (index texte)
+        text_filter = build_text_filter(filters.keywords)
+        if text_filter:
+            search_query.update(text_filter)
+        
+        return search_query
+    
+    def _get_sort_criteria(self, sort_by: Optional[str], has_text: bool = False) -> List[tuple]:
         """
         Détermine les critères de tri
+        
+        La pertinence n'a de sens qu'avec des mots-clés : sans recherche
+        texte, les annonces les plus récentes sont affichées en premier.
         """
+        sort_by = sort_by or "relevance"
         sort_parts = sort_by.split("_")
         sort_field = "_".join(sort_parts[:-1]) if len(sort_parts) > 1 else sort_parts[0]
         sort_direction = 1 if sort_by.endswith("_asc") else -1
         
+        if sort_field == "relevance":
+            if has_text:
+                return RELEVANCE_SORT + [("created_at", -1)]
+            return [("created_at", -1)]
+        
         # Mapper les champs de tri
         sort_field_map = {
             "created": "created_at",
             "price": "price",
             "year": "year",
-            "mileage": "mileage",
-            "relevance": "score"  # Pour la recherche par pertinence
+            "mileage": "mileage"
         }
         
         sort_field = sort_field_map.get(sort_field, "created_at")
         return [(sort_field, sort_direction)]
     
-    async def _record_search(
+    def _record_search(
         self,
-        db: AsyncIOMotorDatabase,
-        query: SearchQuery,
+        query_parts: List[str],
+        query_data: Dict[str, Any],
         user_id: str,
         results_count: int
     ) -> None:
         """
-        Enregistre une recherche dans l'historique
+        Ajoute une recherche au tampon de l'historique (écrit par lots en arrière-plan)
         """
         try:
             # Construire une représentation textuelle de la recherche
-            query_parts = []
-            if query.keywords:
-                query_parts.append(query.keywords)
-            if query.brand:
-                query_parts.append(query.brand)
-            if query.model:
-                query_parts.append(query.model)
-            
             query_text = " ".join(query_parts) if query_parts else "Recherche sans critères"
             
-            # Enregistrer la recherche
-            search_record = {
+            search_history_recorder.record({
                 "user_id": user_id,
                 "query_text": query_text,
-                "query": query.model_dump(),
+                "query": query_data,
                 "results_count": results_count,
                 "timestamp": datetime.utcnow()
-            }
-            
-            await db.search_history.insert_one(search_record)
+            })
         except Exception as e:
-            logger.error(f"Erreur lors de l'enregistrement de la recherche: {str(e)}") 
\ No newline at end of file
+            logger.error(f"Erreur lors de l'enregistrement de la recherche: {str(e)}")
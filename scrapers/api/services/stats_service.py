@@ -5,8 +5,9 @@
 Service pour les statistiques et analyses de marché
 """
 
+import math
 import logging
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
@@ -15,22 +16,39 @@ from ..models import (
     PopularBrand, PopularModel, PriceByAge,
     PriceByMileage, MarketInsight
 )
+from ..cache import TTLCache, get_ingest_generation
+from ..config import settings
+from .market_snapshot_service import MarketSnapshotService
+from ..dedup import distinct_vehicle_stages
 
 logger = logging.getLogger(__name__)
 
+# Cache des statistiques, invalidé par la génération des données
+_stats_cache = TTLCache(maxsize=256, ttl=settings.STATS_CACHE_TTL_SECONDS)
+
+
 class StatsService:
     """
     Service pour les statistiques et analyses de marché
     """
     
+    def __init__(self, market_snapshot_service: MarketSnapshotService):
+        """
+        Reçoit l'instance partagée du service des instantanés du marché (ServiceContainer)
+        """
+        self.market_snapshot_service = market_snapshot_service
+    
     async def get_market_overview(
         self,
         db: AsyncIOMotorDatabase,
         brand: Optional[str] = None,
-        model: Optional[str] = None
+        model: Optional[str] = None,
+        distinct_vehicles: bool = False
     ) -> MarketOverview:
         """
         Récupère une vue d'ensemble du marché
+        
+        Avec distinct_vehicles, un véhicule publié sur plusieurs sources n'est compté qu'une fois.
         """
         try:
             # Construire la requête de base
@@ -40,77 +58,79 @@ class StatsService:
             if model:
                 query["model"] = model
             
-            # Récupérer le nombre total d'annonces
-            total_listings = await db.cars.count_documents(query)
-            
-            # Récupérer le prix moyen
-            avg_price_cursor = db.cars.aggregate([
-                {"$match": query},
-                {"$group": {"_id": None, "avg_price": {"$avg": "$price"}}}
-            ])
-            avg_price_doc = await avg_price_cursor.to_list(length=1)
-            avg_price = avg_price_doc[0]["avg_price"] if avg_price_doc else 0
-            
-            # Récupérer le kilométrage moyen
-            avg_mileage_cursor = db.cars.aggregate([
-                {"$match": query},
-                {"$group": {"_id": None, "avg_mileage": {"$avg": "$mileage"}}}
-            ])
-            avg_mileage_doc = await avg_mileage_cursor.to_list(length=1)
-            avg_mileage = avg_mileage_doc[0]["avg_mileage"] if avg_mileage_doc else 0
-            
-            # Récupérer l'âge moyen
-            current_year = datetime.now().year
-            avg_age_cursor = db.cars.aggregate([
-                {"$match": query},
-                {"$group": {"_id": None, "avg_year": {"$avg": "$year"}}}
-            ])
-            avg_age_doc = await avg_age_cursor.to_list(length=1)
-            avg_age = current_year - avg_age_doc[0]["avg_year"] if avg_age_doc else 0
-            
-            # Récupérer le nombre de bonnes affaires
-            good_deals_count = await db.cars.count_documents({**query, "is_good_deal": True})
-            
-            # Récupérer le nombre d'annonces par source
-            sources_cursor = db.cars.aggregate([
-                {"$match": query},
-                {"$group": {"_id": "$source", "count": {"$sum": 1}}},
-                {"$sort": {"count": -1}}
-            ])
-            sources = {}
-            async for doc in sources_cursor:
-                sources[doc["_id"]] = doc["count"]
-            
-            # Récupérer le nombre d'annonces par type de carburant
-            fuel_types_cursor = db.cars.aggregate([
-                {"$match": query},
-                {"$group": {"_id": "$fuel_type", "count": {"$sum": 1}}},
-                {"$sort": {"count": -1}}
-            ])
-            fuel_types = {}
-            async for doc in fuel_types_cursor:
-                if doc["_id"]:  # Ignorer les valeurs nulles
-                    fuel_types[doc["_id"]] = doc["count"]
+            # Vue d'ensemble en cache pour la génération courante des données
+            cache_key = ("market_overview", get_ingest_generation(), brand, model, distinct_vehicles)
+            found, cached = _stats_cache.get(cache_key)
+            if found:
+                return cached
             
-            # Récupérer le nombre d'annonces par type de transmission
-            transmission_types_cursor = db.cars.aggregate([
+            # Toutes les statistiques en une seule passe sur la collection
+            seven_days_ago = datetime.utcnow() - timedelta(days=7)
+            vehicle_stages = []
+            if distinct_vehicles:
+                vehicle_stages = [
+                    {"$project": {field: 1 for field in [
+                        "vehicle_cluster_id", "price", "mileage", "year", "is_good_deal",
+                        "created_at", "source", "fuel_type", "transmission"
+                    ]}},
+                    *distinct_vehicle_stages()
+                ]
+            overview_cursor = db.cars.aggregate([
                 {"$match": query},
-                {"$group": {"_id": "$transmission", "count": {"$sum": 1}}},
-                {"$sort": {"count": -1}}
+                *vehicle_stages,
+                {"$facet": {
+                    "totals": [
+                        {"$group": {
+                            "_id": None,
+                            "total_listings": {"$sum": 1},
+                            "avg_price": {"$avg": "$price"},
+                            "avg_mileage": {"$avg": "$mileage"},
+                            "avg_year": {"$avg": "$year"},
+                            "good_deals_count": {
+                                "$sum": {"$cond": [{"$eq": ["$is_good_deal", True]}, 1, 0]}
+                            },
+                            "new_listings_count": {
+                                "$sum": {"$cond": [{"$gte": ["$created_at", seven_days_ago]}, 1, 0]}
+                            }
+                        }}
+                    ],
+                    "sources": [
+                        {"$group": {"_id": "$source", "count": {"$sum": 1}}},
+                        {"$sort": {"count": -1}}
+                    ],
+                    "fuel_types": [
+                        {"$group": {"_id": "$fuel_type", "count": {"$sum": 1}}},
+                        {"$sort": {"count": -1}}
+                    ],
+                    "transmission_types": [
+                        {"$group": {"_id": "$transmission", "count": {"$sum": 1}}},
+                        {"$sort": {"count": -1}}
+                    ]
+                }}
             ])
-            transmission_types = {}
-            async for doc in transmission_types_cursor:
-                if doc["_id"]:  # Ignorer les valeurs nulles
-                    transmission_types[doc["_id"]] = doc["count"]
-            
-            # Récupérer les nouvelles annonces des 7 derniers jours
-            seven_days_ago = datetime.utcnow() - timedelta(days=7)
-            new_listings_count = await db.cars.count_documents({
-                **query,
-                "created_at": {"$gte": seven_days_ago}
-            })
-            
-            return MarketOverview(
+            overview_docs = await overview_cursor.to_list(length=1)
+            overview_doc = overview_docs[0] if overview_docs else {}
+            
+            totals = (overview_doc.get("totals") or [{}])[0]
+            total_listings = totals.get("total_listings", 0)
+            avg_price = totals.get("avg_price") or 0
+            avg_mileage = totals.get("avg_mileage") or 0
+            avg_year = totals.get("avg_year")
+            avg_age = datetime.now().year - avg_year if avg_year else 0
+            good_deals_count = totals.get("good_deals_count", 0)
+            new_listings_count = totals.get("new_listings_count", 0)
+            
+            sources = {doc["_id"]: doc["count"] for doc in overview_doc.get("sources", [])}
+            
+            # Ignorer les valeurs nulles
+            fuel_types = {
+                doc["_id"]: doc["count"] for doc in overview_doc.get("fuel_types", []) if doc["_id"]
+            }
+            transmission_types = {
+                doc["_id"]: doc["count"] for doc in overview_doc.get("transmission_types", []) if doc["_id"]
+            }
+            
+            overview = MarketOverview(
                 total_listings=total_listings,
                 avg_price=round(avg_price, 2),
                 avg_mileage=round(avg_mileage, 2),
@@ -123,6 +143,8 @@ class StatsService:
                 new_listings_count=new_listings_count,
                 new_listings_percentage=round((new_listings_count / total_listings) * 100, 2) if total_listings > 0 else 0
             )
+            _stats_cache.set(cache_key, overview)
+            return overview
         
         except Exception as e:
             logger.error(f"Erreur lors de la récupération de la vue d'ensemble du marché: {str(e)}")
@@ -145,10 +167,11 @@ class StatsService:
         db: AsyncIOMotorDatabase,
         brand: Optional[str] = None,
         model: Optional[str] = None,
-        bins: int = 10
+        bins: int = 10,
+        distinct_vehicles: bool = False
     ) -> PriceDistribution:
         """
-        Récupère la distribution des prix
+        Récupère la distribution des prix (une annonce par véhicule avec distinct_vehicles)
         """
         try:
             # Construire la requête de base
@@ -158,18 +181,12 @@ class StatsService:
             if model:
                 query["model"] = model
             
-            # Récupérer les prix min et max
-            min_max_cursor = db.cars.aggregate([
-                {"$match": query},
-                {"$group": {
-                    "_id": None,
-                    "min_price": {"$min": "$price"},
-                    "max_price": {"$max": "$price"}
-                }}
-            ])
-            min_max_doc = await min_max_cursor.to_list(length=1)
+            # Intervalles calculés côté serveur en un seul pipeline
+            min_price, max_price, bin_width, bin_docs = await self._aggregate_bins(
+                db, query, "price", bins, default_width=1000, distinct_vehicles=distinct_vehicles
+            )
             
-            if not min_max_doc:
+            if min_price is None:
                 return PriceDistribution(
                     min_price=0,
                     max_price=0,
@@ -177,27 +194,8 @@ class StatsService:
                     bin_counts=[]
                 )
             
-            min_price = min_max_doc[0]["min_price"]
-            max_price = min_max_doc[0]["max_price"]
-            
-            # Calculer la largeur des intervalles
-            bin_width = (max_price - min_price) / bins if max_price > min_price else 1000
-            
-            # Initialiser les compteurs pour chaque intervalle
-            bin_counts = [0] * bins
             bin_edges = [min_price + i * bin_width for i in range(bins + 1)]
-            
-            # Compter le nombre d'annonces dans chaque intervalle
-            for i in range(bins):
-                lower_bound = bin_edges[i]
-                upper_bound = bin_edges[i + 1]
-                
-                count = await db.cars.count_documents({
-                    **query,
-                    "price": {"$gte": lower_bound, "$lt": upper_bound if i < bins - 1 else upper_bound + 1}
-                })
-                
-                bin_counts[i] = count
+            bin_counts = [bin_docs[i]["count"] if i in bin_docs else 0 for i in range(bins)]
             
             # Formater les intervalles pour l'affichage
             bins_formatted = [f"{int(bin_edges[i])}-{int(bin_edges[i+1])}" for i in range(bins)]
@@ -210,13 +208,9 @@ class StatsService:
             )
         
         except Exception as e:
+            # Une erreur d'agrégation ne doit pas passer pour un marché vide
             logger.error(f"Erreur lors de la récupération de la distribution des prix: {str(e)}")
-            return PriceDistribution(
-                min_price=0,
-                max_price=0,
-                bins=[],
-                bin_counts=[]
-            )
+            raise
     
     async def get_price_trends(
         self,
@@ -229,35 +223,20 @@ class StatsService:
         Récupère les tendances de prix sur une période
         """
         try:
-            # Construire la requête de base
-            query = {}
-            if brand:
-                query["brand"] = brand
-            if model:
-                query["model"] = model
-            
             # Calculer la date de début de la période
             start_date = datetime.utcnow() - timedelta(days=period_days)
             
-            # Récupérer les prix moyens par jour
-            price_trend_cursor = db.cars.aggregate([
-                {"$match": {**query, "created_at": {"$gte": start_date}}},
-                {"$group": {
-                    "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
-                    "avg_price": {"$avg": "$price"},
-                    "count": {"$sum": 1}
-                }},
-                {"$sort": {"_id": 1}}
-            ])
+            # Récupérer les prix moyens par jour depuis les instantanés quotidiens
+            daily_series = await self.market_snapshot_service.get_daily_series(db, start_date, brand, model)
             
             dates = []
             prices = []
             volumes = []
             
-            async for doc in price_trend_cursor:
-                dates.append(doc["_id"])
-                prices.append(round(doc["avg_price"], 2))
-                volumes.append(doc["count"])
+            for day in daily_series:
+                dates.append(day["date"])
+                prices.append(round(day["avg_price"], 2))
+                volumes.append(day["count"])
             
             # Calculer la variation de prix
             price_change = 0
@@ -405,13 +384,16 @@ class StatsService:
             if model:
                 query["model"] = model
             
-            # Récupérer les prix moyens par année
+            # Récupérer les prix moyens par année, avec les sommes nécessaires
+            # à la régression du logarithme du prix sur l'année
             price_by_year_cursor = db.cars.aggregate([
                 {"$match": query},
+                {"$addFields": {"_log_price": {"$ln": {"$max": ["$price", 1]}}}},
                 {"$group": {
                     "_id": "$year",
                     "avg_price": {"$avg": "$price"},
-                    "count": {"$sum": 1}
+                    "count": {"$sum": 1},
+                    "sum_log_price": {"$sum": "$_log_price"}
                 }},
                 {"$sort": {"_id": 1}}
             ])
@@ -419,31 +401,28 @@ class StatsService:
             years = []
             prices = []
             counts = []
+            regression = [0, 0.0, 0.0, 0.0, 0.0]  # n, Σx, Σy, Σx², Σxy
+            current_year = datetime.now().year
             
             async for doc in price_by_year_cursor:
                 if doc["_id"]:  # Ignorer les valeurs nulles
                     years.append(doc["_id"])
                     prices.append(round(doc["avg_price"], 2))
                     counts.append(doc["count"])
-            
-            # Calculer la dépréciation annuelle moyenne
+                    
+                    age = current_year - doc["_id"]
+                    regression[0] += doc["count"]
+                    regression[1] += doc["count"] * age
+                    regression[2] += doc["sum_log_price"]
+                    regression[3] += doc["count"] * age * age
+                    regression[4] += age * doc["sum_log_price"]
+            
+            # Dépréciation annuelle moyenne : pente des moindres carrés de
+            # ln(prix) en fonction de l'âge, convertie en pourcentage annuel
             depreciation_rate = 0
-            if len(years) >= 2 and len(prices) >= 2:
-                # Trier les années et les prix
-                sorted_data = sorted(zip(years, prices), key=lambda x: x[0])
-                sorted_years = [y for y, _ in sorted_data]
-                sorted_prices = [p for _, p in sorted_data]
-                
-                # Calculer la dépréciation entre la première et la dernière année
-                first_year = sorted_years[0]
-                last_year = sorted_years[-1]
-                first_price = sorted_prices[0]
-                last_price = sorted_prices[-1]
-                
-                year_diff = last_year - first_year
-                if year_diff > 0 and first_price > 0:
-                    total_depreciation = (first_price - last_price) / first_price
-                    depreciation_rate = (total_depreciation / year_diff) * 100
+            if len(years) >= 2:
+                slope = self._least_squares_slope(*regression)
+                depreciation_rate = (1 - math.exp(slope)) * 100
             
             return PriceByAge(
                 years=years,
@@ -466,10 +445,11 @@ class StatsService:
         db: AsyncIOMotorDatabase,
         brand: Optional[str] = None,
         model: Optional[str] = None,
-        bins: int = 10
+        bins: int = 10,
+        distinct_vehicles: bool = False
     ) -> PriceByMileage:
         """
-        Récupère les prix moyens par kilométrage
+        Récupère les prix moyens par kilométrage (une annonce par véhicule avec distinct_vehicles)
         """
         try:
             # Construire la requête de base
@@ -479,18 +459,22 @@ class StatsService:
             if model:
                 query["model"] = model
             
-            # Récupérer les kilométrages min et max
-            min_max_cursor = db.cars.aggregate([
-                {"$match": query},
-                {"$group": {
-                    "_id": None,
-                    "min_mileage": {"$min": "$mileage"},
-                    "max_mileage": {"$max": "$mileage"}
-                }}
-            ])
-            min_max_doc = await min_max_cursor.to_list(length=1)
+            # Intervalles calculés côté serveur en un seul pipeline, avec les
+            # sommes nécessaires à la régression du prix sur le kilométrage
+            min_mileage, max_mileage, bin_width, bin_docs = await self._aggregate_bins(
+                db, query, "mileage", bins, default_width=10000,
+                extra_fields=["price"],
+                distinct_vehicles=distinct_vehicles,
+                accumulators={
+                    "avg_price": {"$avg": "$price"},
+                    "sum_price": {"$sum": "$price"},
+                    "sum_mileage": {"$sum": "$mileage"},
+                    "sum_mileage_sq": {"$sum": {"$multiply": ["$mileage", "$mileage"]}},
+                    "sum_mileage_price": {"$sum": {"$multiply": ["$mileage", "$price"]}}
+                }
+            )
             
-            if not min_max_doc:
+            if min_mileage is None:
                 return PriceByMileage(
                     mileage_ranges=[],
                     prices=[],
@@ -498,70 +482,38 @@ class StatsService:
                     price_per_km=0
                 )
             
-            min_mileage = min_max_doc[0]["min_mileage"]
-            max_mileage = min_max_doc[0]["max_mileage"]
-            
-            # Calculer la largeur des intervalles
-            bin_width = (max_mileage - min_mileage) / bins if max_mileage > min_mileage else 10000
-            
             # Initialiser les tableaux pour les résultats
             mileage_ranges = []
             prices = []
             counts = []
+            regression = [0, 0.0, 0.0, 0.0, 0.0]  # n, Σx, Σy, Σx², Σxy
             
-            # Calculer les prix moyens pour chaque intervalle de kilométrage
             for i in range(bins):
                 lower_bound = min_mileage + i * bin_width
                 upper_bound = min_mileage + (i + 1) * bin_width
                 
                 # Formater l'intervalle pour l'affichage
-                mileage_range = f"{int(lower_bound)}-{int(upper_bound)}"
-                mileage_ranges.append(mileage_range)
+                mileage_ranges.append(f"{int(lower_bound)}-{int(upper_bound)}")
                 
-                # Récupérer le prix moyen pour cet intervalle
-                avg_price_cursor = db.cars.aggregate([
-                    {"$match": {
-                        **query,
-                        "mileage": {"$gte": lower_bound, "$lt": upper_bound if i < bins - 1 else upper_bound + 1}
-                    }},
-                    {"$group": {
-                        "_id": None,
-                        "avg_price": {"$avg": "$price"},
-                        "count": {"$sum": 1}
-                    }}
-                ])
-                avg_price_doc = await avg_price_cursor.to_list(length=1)
-                
-                if avg_price_doc:
-                    prices.append(round(avg_price_doc[0]["avg_price"], 2))
-                    counts.append(avg_price_doc[0]["count"])
+                doc = bin_docs.get(i)
+                if doc:
+                    prices.append(round(doc["avg_price"], 2))
+                    counts.append(doc["count"])
+                    
+                    regression[0] += doc["count"]
+                    regression[1] += doc["sum_mileage"]
+                    regression[2] += doc["sum_price"]
+                    regression[3] += doc["sum_mileage_sq"]
+                    regression[4] += doc["sum_mileage_price"]
                 else:
                     prices.append(0)
                     counts.append(0)
             
-            # Calculer le prix par kilomètre
+            # Prix par kilomètre : pente des moindres carrés sur toutes les annonces
+            # (positive lorsque le prix diminue avec le kilométrage)
             price_per_km = 0
-            if len(prices) >= 2 and max_mileage > min_mileage:
-                # Trouver les intervalles avec des données
-                valid_data = [(m, p) for m, p, c in zip(
-                    [(min_mileage + i * bin_width + min_mileage + (i + 1) * bin_width) / 2 for i in range(bins)],
-                    prices,
-                    counts
-                ) if p > 0 and c > 0]
-                
-                if len(valid_data) >= 2:
-                    # Trier par kilométrage
-                    valid_data.sort(key=lambda x: x[0])
-                    
-                    # Calculer la pente de la régression linéaire
-                    first_mileage, first_price = valid_data[0]
-                    last_mileage, last_price = valid_data[-1]
-                    
-                    mileage_diff = last_mileage - first_mileage
-                    price_diff = first_price - last_price  # Négatif car le prix diminue avec le kilométrage
-                    
-                    if mileage_diff > 0:
-                        price_per_km = price_diff / mileage_diff
+            if max_mileage > min_mileage:
+                price_per_km = -self._least_squares_slope(*regression)
             
             return PriceByMileage(
                 mileage_ranges=mileage_ranges,
@@ -571,13 +523,9 @@ class StatsService:
             )
         
         except Exception as e:
+            # Une erreur d'agrégation ne doit pas passer pour un marché vide
             logger.error(f"Erreur lors de la récupération des prix par kilométrage: {str(e)}")
-            return PriceByMileage(
-                mileage_ranges=[],
-                prices=[],
-                counts=[],
-                price_per_km=0
-            )
+            raise
     
     async def get_market_insights(
         self,
@@ -691,4 +639,82 @@ class StatsService:
         
         except Exception as e:
             logger.error(f"Erreur lors de la récupération des insights du marché: {str(e)}")
-            return [] 
\ No newline at end of file
+            return []
+    
+    async def _aggregate_bins(
+        self,
+        db: AsyncIOMotorDatabase,
+        query: Dict[str, Any],
+        field: str,
+        bins: int,
+        default_width: float,
+        accumulators: Optional[Dict[str, Any]] = None,
+        extra_fields: Optional[List[str]] = None,
+        distinct_vehicles: bool = False
+    ) -> Tuple[Optional[float], Optional[float], float, Dict[int, Dict[str, Any]]]:
+        """
+        Répartit les annonces en intervalles de largeur égale sur un champ numérique
+        
+        Les bornes min/max et l'indice d'intervalle sont calculés côté serveur :
+        une seule agrégation, quel que soit le nombre d'intervalles. Seuls le
+        champ et les extra_fields lus par les accumulateurs sont conservés avant
+        la fenêtre min/max, qui peut déborder sur disque. Avec distinct_vehicles,
+        une seule annonce par vehicle_cluster_id est répartie.
+        Retourne (min, max, largeur, documents par indice d'intervalle).
+        """
+        whole_collection = {"documents": ["unbounded", "unbounded"]}
+        value = f"${field}"
+        width = {"$cond": [
+            {"$gt": ["$_max", "$_min"]},
+            {"$divide": [{"$subtract": ["$_max", "$_min"]}, bins]},
+            default_width
+        ]}
+        
+        projection = {field: 1, **{extra: 1 for extra in extra_fields or []}}
+        if distinct_vehicles:
+            vehicle_stages = [{"$project": {**projection, "vehicle_cluster_id": 1}}, *distinct_vehicle_stages()]
+        else:
+            vehicle_stages = [{"$project": {"_id": 0, **projection}}]
+        
+        cursor = db.cars.aggregate([
+            {"$match": {**query, field: {"$type": "number"}}},
+            *vehicle_stages,
+            {"$setWindowFields": {"output": {
+                "_min": {"$min": value, "window": whole_collection},
+                "_max": {"$max": value, "window": whole_collection}
+            }}},
+            {"$group": {
+                "_id": {"$min": [
+                    bins - 1,
+                    {"$floor": {"$divide": [{"$subtract": [value, "$_min"]}, width]}}
+                ]},
+                "min_value": {"$first": "$_min"},
+                "max_value": {"$first": "$_max"},
+                "count": {"$sum": 1},
+                **(accumulators or {})
+            }}
+        ], allowDiskUse=True)
+        
+        bin_docs = {}
+        min_value = None
+        max_value = None
+        async for doc in cursor:
+            bin_docs[int(doc["_id"])] = doc
+            min_value = doc["min_value"]
+            max_value = doc["max_value"]
+        
+        if min_value is None:
+            return None, None, default_width, {}
+        
+        bin_width = (max_value - min_value) / bins if max_value > min_value else default_width
+        return min_value, max_value, bin_width, bin_docs
+    
+    @staticmethod
+    def _least_squares_slope(n: int, sum_x: float, sum_y: float, sum_xx: float, sum_xy: float) -> float:
+        """
+        Pente de la droite des moindres carrés à partir des sommes agrégées
+        """
+        denominator = n * sum_xx - sum_x * sum_x
+        if n < 2 or denominator <= 0:
+            return 0.0
+        return (n * sum_xy - sum_x * sum_y) / denominator
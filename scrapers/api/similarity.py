@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Moteur d'annonces similaires : plus proches voisins sur des vecteurs de caractéristiques
+"""
+
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .normalization import normalize_brand, normalize_model
+
+logger = logging.getLogger(__name__)
+
+# Caractéristiques numériques : (champ, poids, transformation avant centrage-réduction)
+NUMERIC_FEATURES = [
+    ("year", 1.0, float),
+    ("mileage", 1.0, lambda value: float(np.log1p(value))),
+    ("price", 1.5, lambda value: float(np.log(value))),
+    ("power", 0.5, float),
+]
+
+# Caractéristiques catégorielles : (champ, pénalité si la valeur diffère)
+CATEGORICAL_FEATURES = [
+    ("brand_norm", 12.0),
+    ("model_norm", 4.0),
+    ("fuel_type", 1.5),
+    ("transmission", 0.5),
+    ("body_type", 1.0),
+]
+
+# Champs des annonces nécessaires à la construction de l'index
+SIMILARITY_PROJECTION = {
+    "_id": 1, "brand": 1, "model": 1, "brand_norm": 1, "model_norm": 1,
+    "year": 1, "mileage": 1, "price": 1, "power": 1,
+    "fuel_type": 1, "transmission": 1, "body_type": 1
+}
+
+def _categorical_value(car: Dict[str, Any], field: str) -> Optional[str]:
+    """
+    Valeur catégorielle d'une annonce (marque et modèle normalisés si absents)
+    """
+    if field == "brand_norm" and "brand_norm" not in car:
+        return normalize_brand(car.get("brand")) or None
+    if field == "model_norm" and "model_norm" not in car:
+        return normalize_model(car.get("model"), car.get("brand")) or None
+    return car.get(field) or None
+
+def _numeric_value(car: Dict[str, Any], field: str, transform) -> float:
+    value = car.get(field)
+    if not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0:
+        return np.nan
+    return transform(value)
+
+class _IndexData:
+    """
+    Données figées d'un index construit (remplacées d'un bloc à chaque reconstruction)
+    """
+
+    def __init__(self, cars: List[Dict[str, Any]]):
+        keys = [
+            (_categorical_value(car, "brand_norm") or "", _categorical_value(car, "model_norm") or "")
+            for car in cars
+        ]
+        order = sorted(range(len(cars)), key=lambda position: keys[position])
+        cars = [cars[position] for position in order]
+        keys = [keys[position] for position in order]
+
+        self.ids = [car["_id"] for car in cars]
+        self.positions = {car_id: position for position, car_id in enumerate(self.ids)}
+
+        # Caractéristiques numériques centrées-réduites, valeurs manquantes à la moyenne
+        raw = np.array(
+            [[_numeric_value(car, field, transform) for field, _, transform in NUMERIC_FEATURES] for car in cars],
+            dtype=np.float64
+        ).reshape(len(cars), len(NUMERIC_FEATURES))
+        # Calculées sur les seules valeurs présentes : une colonne vide (power, souvent
+        # absent) donne une moyenne nulle sans avertissement de nanmean/nanstd
+        present = ~np.isnan(raw)
+        counts = np.maximum(present.sum(axis=0), 1)
+        self.means = np.where(present, raw, 0.0).sum(axis=0) / counts
+        stds = np.sqrt(np.where(present, (raw - self.means) ** 2, 0.0).sum(axis=0) / counts)
+        self.stds = np.where(stds > 0, stds, 1.0)
+        # Une ligne contiguë par caractéristique : les distances se calculent colonne par colonne
+        self.numeric = np.ascontiguousarray(np.nan_to_num((raw - self.means) / self.stds).T, dtype=np.float32)
+        self.weights = np.array([weight for _, weight, _ in NUMERIC_FEATURES], dtype=np.float32)
+
+        # Caractéristiques catégorielles codées en entiers (-1 si absente), une colonne par champ
+        self.vocabularies: List[Dict[str, int]] = []
+        self.codes: List[np.ndarray] = []
+        for field, _ in CATEGORICAL_FEATURES:
+            vocabulary: Dict[str, int] = {}
+            column = np.full(len(cars), -1, dtype=np.int32)
+            for row, car in enumerate(cars):
+                value = _categorical_value(car, field)
+                if value is not None:
+                    column[row] = vocabulary.setdefault(value, len(vocabulary))
+            self.vocabularies.append(vocabulary)
+            self.codes.append(column)
+        self.penalties = [np.float32(penalty) for _, penalty in CATEGORICAL_FEATURES]
+
+        # Plages de lignes par marque et par modèle (lignes triées par marque puis modèle)
+        self.brand_ranges: Dict[str, Tuple[int, int]] = {}
+        self.model_ranges: Dict[Tuple[str, str], Tuple[int, int]] = {}
+        for row, key in enumerate(keys):
+            start, _ = self.brand_ranges.get(key[0], (row, row))
+            self.brand_ranges[key[0]] = (start, row + 1)
+            start, _ = self.model_ranges.get(key, (row, row))
+            self.model_ranges[key] = (start, row + 1)
+
+    def query_vector(self, car: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray, List[int]]:
+        """
+        Vecteur d'une annonce : (valeurs numériques réduites, poids effectifs, codes catégoriels)
+        """
+        raw = np.array([_numeric_value(car, field, transform) for field, _, transform in NUMERIC_FEATURES])
+        missing = np.isnan(raw)
+        values = np.nan_to_num((raw - self.means) / self.stds).astype(np.float32)
+        weights = np.where(missing, 0.0, self.weights).astype(np.float32)
+
+        codes = []
+        for column, (field, _) in enumerate(CATEGORICAL_FEATURES):
+            value = _categorical_value(car, field)
+            codes.append(-1 if value is None else self.vocabularies[column].get(value, -2))
+        return values, weights, codes
+
+    def distances(self, start: int, end: int, values, weights, codes, constant_columns: int = 0) -> np.ndarray:
+        """
+        Distances pondérées entre l'annonce et les lignes [start, end)
+
+        Les `constant_columns` premières colonnes catégorielles sont identiques
+        dans le bloc (marque, modèle) et ne sont pas comparées.
+        """
+        distances = np.zeros(end - start, dtype=np.float32)
+        for column, weight in enumerate(weights):
+            if weight:
+                diff = self.numeric[column, start:end] - values[column]
+                diff *= diff
+                diff *= weight
+                distances += diff
+
+        # Pénalité par caractéristique catégorielle différente (ignorée si inconnue pour l'annonce)
+        for column in range(constant_columns, len(codes)):
+            if codes[column] != -1:
+                distances += self.penalties[column] * (self.codes[column][start:end] != codes[column])
+        return distances
+
+class SimilarityIndex:
+    """
+    Index des plus proches voisins des annonces, en mémoire (NumPy)
+
+    Les lignes sont triées par marque puis modèle : la recherche parcourt le
+    bloc du modèle de l'annonce, puis celui de sa marque (les autres modèles y
+    sont pénalisés), puis l'ensemble des annonces, en s'arrêtant au premier
+    bloc qui contient assez d'annonces.
+    """
+
+    def __init__(self):
+        self._data: Optional[_IndexData] = None
+        self.generation = None
+        self.built_at = None
+
+    def __bool__(self) -> bool:
+        return self._data is not None
+
+    def __len__(self) -> int:
+        return len(self._data.ids) if self._data is not None else 0
+
+    @staticmethod
+    def build(cars: Iterable[Dict[str, Any]]) -> _IndexData:
+        """
+        Construit les données d'un index (sans modifier l'index courant)
+        """
+        return _IndexData(list(cars))
+
+    def load(self, data: _IndexData, generation=None, built_at=None) -> None:
+        """
+        Remplace les données de l'index
+        """
+        self._data = data
+        self.generation = generation
+        self.built_at = built_at
+
+    def similar(self, car: Dict[str, Any], k: int = 5, exclude_id: Any = None) -> List[Tuple[Any, float]]:
+        """
+        Retourne les k annonces les plus proches (identifiant, distance), de la plus proche à la plus lointaine
+        """
+        data = self._data
+        if data is None or not data.ids or k <= 0:
+            return []
+
+        values, weights, codes = data.query_vector(car)
+        excluded = data.positions.get(exclude_id)
+
+        brand = _categorical_value(car, "brand_norm") or ""
+        model = _categorical_value(car, "model_norm") or ""
+        # Blocs : (plage de lignes, nombre de colonnes catégorielles constantes dans le bloc)
+        blocks = [
+            (data.model_ranges.get((brand, model)), 2),
+            (data.brand_ranges.get(brand), 1),
+            ((0, len(data.ids)), 0)
+        ]
+        for block, constant_columns in blocks:
+            if block is None:
+                continue
+            start, end = block
+            available = end - start - (1 if excluded is not None and start <= excluded < end else 0)
+            if available >= k:
+                break
+
+        distances = data.distances(start, end, values, weights, codes, constant_columns)
+        if excluded is not None and start <= excluded < end:
+            distances[excluded - start] = np.inf
+
+        count = min(k, end - start)
+        nearest = np.argpartition(distances, count - 1)[:count] if count < end - start else np.arange(end - start)
+        nearest = nearest[np.argsort(distances[nearest], kind="stable")]
+        return [
+            (data.ids[start + row], float(distances[row]))
+            for row in nearest
+            if np.isfinite(distances[row])
+        ]
+
+# Index du processus, reconstruit après les ingestions
+similarity_index = SimilarityIndex()
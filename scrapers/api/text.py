@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Normalisation du texte : minuscules, suppression des accents et découpage en mots
+"""
+
+import re
+import unicodedata
+from typing import List
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def fold(text: str) -> str:
+    """
+    Met un texte en minuscules sans accents ("Citroën Clio" -> "citroen clio")
+    """
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(stripped.lower().split())
+
+def tokenize(text: str) -> List[str]:
+    """
+    Découpe un texte normalisé en mots alphanumériques
+    """
+    return _TOKEN_RE.findall(fold(text))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark d'une rafale de connexions
+Mesure la latence de la boucle d'événements (trafic annonces/recherche simulé)
+pendant une rafale de vérifications bcrypt, exécutées directement dans la
+boucle puis dans le pool dédié de l'AuthService
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scrapers.api.services.auth_service import AuthService
+
+def percentile(values, q):
+    """Percentile par rang sur une liste de valeurs"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+async def probe(stop_event, interval, latencies):
+    """Simule une requête légère toutes les `interval` secondes et mesure son retard"""
+    loop = asyncio.get_running_loop()
+    while not stop_event.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        latencies.append((loop.time() - expected) * 1000)
+
+async def run_burst(auth_service, hashed_password, logins, offload, interval):
+    """Exécute une rafale de connexions et retourne (durée, latences de la sonde)"""
+    latencies = []
+    stop_event = asyncio.Event()
+    probe_task = asyncio.create_task(probe(stop_event, interval, latencies))
+
+    async def login():
+        if offload:
+            return await auth_service.verify_password_async("motdepasse", hashed_password)
+        return auth_service.verify_password("motdepasse", hashed_password)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(login() for _ in range(logins)))
+    duration = time.perf_counter() - start
+
+    stop_event.set()
+    await probe_task
+    assert all(results)
+    return duration, latencies
+
+async def main(logins, interval):
+    auth_service = AuthService()
+    hashed_password = auth_service.get_password_hash("motdepasse")
+
+    print(f"Rafale de {logins} connexions, sonde toutes les {interval * 1000:.0f} ms")
+    print(f"{'mode':<10} {'durée (s)':>10} {'p50 (ms)':>10} {'p99 (ms)':>10} {'max (ms)':>10}")
+    for mode, offload in [("boucle", False), ("pool", True)]:
+        duration, latencies = await run_burst(auth_service, hashed_password, logins, offload, interval)
+        if not latencies:
+            latencies = [duration * 1000]
+        print(
+            f"{mode:<10} {duration:>10.2f} {statistics.median(latencies):>10.1f} "
+            f"{percentile(latencies, 0.99):>10.1f} {max(latencies):>10.1f}"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark d'une rafale de connexions (bcrypt)")
+    parser.add_argument("--logins", type=int, default=50, help="Nombre de connexions simultanées")
+    parser.add_argument("--interval", type=float, default=0.01, help="Intervalle de la sonde en secondes")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.logins, args.interval))
@@ -0,0 +1,77 @@
+import random
+import unittest
+
+from scrapers.api.alert_index import AlertIndex, CompiledAlert
+
+
+class TestCompiledAlert(unittest.TestCase):
+    def test_matches_normalized_brand_model_and_location(self):
+        alert = CompiledAlert({"_id": 1, "brand": "Mercedes", "model": "C Class", "location": "Lyon"})
+
+        self.assertTrue(alert.matches({"brand": "Mercedes-Benz", "model": "Classe C 220", "location": "Lyon 69003"}))
+        self.assertFalse(alert.matches({"brand": "Mercedes-Benz", "model": "Classe E", "location": "Lyon"}))
+        self.assertFalse(alert.matches({"brand": "Mercedes-Benz", "model": "Classe C", "location": "Paris"}))
+
+    def test_ranges_require_a_value(self):
+        alert = CompiledAlert({"_id": 1, "price_min": 5000, "price_max": 10000})
+
+        self.assertTrue(alert.matches({"price": 5000}))
+        self.assertTrue(alert.matches({"price": 10000}))
+        self.assertFalse(alert.matches({"price": 10001}))
+        self.assertFalse(alert.matches({}))
+
+    def test_keywords_must_all_be_present(self):
+        alert = CompiledAlert({"_id": 1, "keywords": "GPS toit"})
+
+        self.assertTrue(alert.matches({"title": "Clio GPS", "description": "Toit ouvrant"}))
+        self.assertFalse(alert.matches({"title": "Clio GPS", "description": "Climatisation"}))
+
+    def test_good_deals_only(self):
+        alert = CompiledAlert({"_id": 1, "good_deals_only": True})
+
+        self.assertTrue(alert.matches({"is_good_deal": True}))
+        self.assertFalse(alert.matches({"is_good_deal": False}))
+
+
+class TestAlertIndex(unittest.TestCase):
+    def test_match_agrees_with_evaluating_every_alert(self):
+        rng = random.Random(7)
+        brands = ["Peugeot", "Renault", "VW", "Volkswagen", None]
+        fuels = ["Diesel", "Essence", None]
+
+        alerts = []
+        for alert_id in range(300):
+            alert = {"_id": alert_id, "brand": rng.choice(brands), "fuel_type": rng.choice(fuels)}
+            if rng.random() < 0.5:
+                alert["price_min"] = rng.randint(0, 20000)
+            if rng.random() < 0.5:
+                alert["price_max"] = rng.randint(5000, 40000)
+            if rng.random() < 0.3:
+                alert["year_min"] = rng.randint(2005, 2020)
+            if rng.random() < 0.3:
+                alert["mileage_max"] = rng.randint(20000, 200000)
+            alerts.append(alert)
+
+        index = AlertIndex(alerts)
+        compiled = [CompiledAlert(alert) for alert in alerts]
+
+        for _ in range(200):
+            car = {
+                "brand": rng.choice(brands[:-1]),
+                "fuel_type": rng.choice(fuels),
+                "price": rng.choice([None, rng.randint(1000, 40000)]),
+                "year": rng.randint(2000, 2023),
+                "mileage": rng.choice([None, rng.randint(0, 250000)])
+            }
+            expected = [alert.alert["_id"] for alert in compiled if alert.matches(car)]
+            self.assertEqual([alert["_id"] for alert in index.match(car)], expected)
+
+    def test_alert_without_brand_is_always_a_candidate(self):
+        index = AlertIndex([{"_id": "any"}, {"_id": "bmw", "brand": "BMW"}])
+
+        self.assertEqual([alert["_id"] for alert in index.match({"brand": "Peugeot"})], ["any"])
+        self.assertEqual(len(index), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
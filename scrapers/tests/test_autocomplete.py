@@ -0,0 +1,65 @@
+import unittest
+
+from scrapers.api.autocomplete import PRECOMPUTED_TOP, AutocompleteIndex, _SortedPrefixIndex
+
+
+class TestSortedPrefixIndex(unittest.TestCase):
+    def test_short_prefixes_use_the_precomputed_top(self):
+        index = _SortedPrefixIndex([("peugeot", "Peugeot", 30), ("porsche", "Porsche", 5), ("renault", "Renault", 20)])
+
+        self.assertEqual(index.top_by_prefix["pe"], [("Peugeot", 30)])
+        self.assertEqual(index.top_by_prefix["por"], [("Porsche", 5)])
+        self.assertEqual(index.lookup("pe", 10), [("Peugeot", 30)])
+        self.assertEqual(index.lookup("peu", 10), [("Peugeot", 30)])
+
+    def test_large_limit_and_long_prefix_use_the_sorted_keys(self):
+        entries = [(f"model {number:03d}", f"Model {number:03d}", number) for number in range(PRECOMPUTED_TOP + 20)]
+        index = _SortedPrefixIndex(entries)
+
+        self.assertEqual(len(index.top_by_prefix["mo"]), PRECOMPUTED_TOP)
+        results = index.lookup("mo", PRECOMPUTED_TOP + 10)
+        self.assertEqual(len(results), PRECOMPUTED_TOP + 10)
+        self.assertEqual(results[0], (f"Model {PRECOMPUTED_TOP + 19:03d}", PRECOMPUTED_TOP + 19))
+        self.assertEqual(index.lookup("model 01", 3), [("Model 019", 19), ("Model 018", 18), ("Model 017", 17)])
+        self.assertEqual(index.lookup("zz", 10), [])
+
+
+class TestAutocompleteIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = AutocompleteIndex()
+        self.index.load({
+            "brand": {"Citroën": 40, "Peugeot": 60},
+            "model": {"C3": 25, "208": 50},
+            "location": {"Saint-Étienne 42000": 8, "Île-de-France": 12},
+            "keyword": {"citadine": 15},
+        })
+
+    def test_empty_index(self):
+        index = AutocompleteIndex()
+
+        self.assertFalse(index)
+        self.assertEqual(index.suggest("pe"), [])
+        self.assertTrue(self.index)
+
+    def test_accents_are_folded(self):
+        self.assertEqual(self.index.suggest("CITROE", "brand"), [("brand", "Citroën", 40)])
+        self.assertEqual(self.index.suggest("île", "location"), [("location", "Île-de-France", 12)])
+        self.assertEqual(self.index.suggest("ile", "location"), [("location", "Île-de-France", 12)])
+
+    def test_locations_are_indexed_by_each_word(self):
+        self.assertEqual(self.index.suggest("etien", "location"), [("location", "Saint-Étienne 42000", 8)])
+        self.assertEqual(self.index.suggest("42", "location"), [("location", "Saint-Étienne 42000", 8)])
+        self.assertEqual(self.index.suggest("fran", "location"), [("location", "Île-de-France", 12)])
+        self.assertEqual(self.index.suggest("etien", "brand"), [])
+
+    def test_all_types_are_ranked_by_frequency(self):
+        self.assertEqual(
+            self.index.suggest("ci"),
+            [("brand", "Citroën", 40), ("keyword", "citadine", 15)]
+        )
+        self.assertEqual(self.index.suggest("ci", limit=1), [("brand", "Citroën", 40)])
+        self.assertEqual(self.index.suggest(" "), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import random
+import unittest
+
+import pandas as pd
+
+from scrapers.api.services.deal_scoring_service import (
+    DealReference, DealScoringService,
+    GOOD_DEAL_THRESHOLD_PERCENTAGE, MILEAGE_FACTOR, YEAR_WINDOW
+)
+
+
+def is_good_deal_per_row(cars, position):
+    """Logique ligne par ligne de CarService._is_good_deal"""
+    car = cars[position]
+    prices = []
+    for other_position, other in enumerate(cars):
+        if other_position == position:
+            continue
+        if other["brand"] != car["brand"] or other["model"] != car["model"]:
+            continue
+        if abs(other["year"] - car["year"]) > YEAR_WINDOW:
+            continue
+        if car["mileage"]:
+            if other["mileage"] is None or not 0 <= other["mileage"] <= car["mileage"] * MILEAGE_FACTOR:
+                continue
+        prices.append(other["price"])
+
+    if not prices:
+        return False
+    market_avg_price = sum(prices) / len(prices)
+    return (market_avg_price - car["price"]) / market_avg_price * 100 >= GOOD_DEAL_THRESHOLD_PERCENTAGE
+
+
+class TestComputeGoodDealFlags(unittest.TestCase):
+    def setUp(self):
+        self.service = DealScoringService()
+
+    def test_matches_per_row_logic(self):
+        rng = random.Random(42)
+        cars = []
+        for _ in range(400):
+            cars.append({
+                "brand": rng.choice(["Peugeot", "Renault"]),
+                "model": rng.choice(["208", "Clio", "3008"]),
+                "year": rng.randint(2008, 2022),
+                "price": float(rng.randint(3000, 30000)),
+                "mileage": rng.choice([None, 0, rng.randint(1000, 250000)])
+            })
+
+        flags = self.service.compute_good_deal_flags(pd.DataFrame(cars))
+
+        expected = [is_good_deal_per_row(cars, position) for position in range(len(cars))]
+        self.assertEqual([bool(flag) for flag in flags], expected)
+
+    def test_no_comparable_is_not_a_good_deal(self):
+        cars = [{"brand": "Peugeot", "model": "208", "year": 2019, "price": 1000.0, "mileage": 50000}]
+        flags = self.service.compute_good_deal_flags(pd.DataFrame(cars))
+        self.assertFalse(flags[0])
+
+
+class TestDealReference(unittest.TestCase):
+    def test_excludes_stored_version_of_the_listing(self):
+        reference = DealReference([
+            {"brand": "Peugeot", "model": "208", "year": 2019, "mileage": 50000, "price": 15000, "source": "lbc", "source_id": "1"},
+            {"brand": "Peugeot", "model": "208", "year": 2019, "mileage": 40000, "price": 12000, "source": "lbc", "source_id": "2"},
+        ])
+        car = {"brand": "Peugeot", "model": "208", "year": 2019, "mileage": 50000, "price": 13000}
+
+        self.assertFalse(reference.is_good_deal({**car, "source": "lc", "source_id": "9"}))
+        self.assertTrue(reference.is_good_deal({**car, "source": "lbc", "source_id": "2"}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+
+from scrapers.api.dedup import (
+    DuplicateDetector, block_key, dedup_fields, hamming, match_score, price_range, simhash,
+    TEXT_MAX_DISTANCE
+)
+
+
+TITLE = "Peugeot 208 GT Line 1.2 PureTech 110 toit panoramique"
+DESCRIPTION = "Première main, entretien complet chez Peugeot, garantie 12 mois, carnet à jour"
+
+
+def listing(**fields):
+    car = {
+        "brand_norm": "peugeot", "model_norm": "208", "year": 2019,
+        "price": 12000, "mileage": 50000, "title": TITLE, "description": DESCRIPTION
+    }
+    car.update(fields)
+    return car
+
+
+class TestFingerprints(unittest.TestCase):
+    def test_simhash_of_close_texts_is_close(self):
+        original = simhash(f"{TITLE} {DESCRIPTION}")
+        reworded = simhash(f"{TITLE} {DESCRIPTION} !")
+        other = simhash("Renault Clio 4 dCi 90 Intens, boîte automatique, 150 000 km, révisée")
+
+        self.assertLessEqual(hamming(original, reworded), TEXT_MAX_DISTANCE)
+        self.assertGreater(hamming(original, other), TEXT_MAX_DISTANCE)
+        self.assertIsNone(simhash(""))
+
+    def test_dedup_fields_keep_stored_image_hashes(self):
+        fields = dedup_fields({"title": TITLE, "image_hashes": ["00ff00ff00ff00ff"]})
+
+        self.assertEqual(len(fields["text_simhash"]), 16)
+        self.assertEqual(fields["image_hashes"], ["00ff00ff00ff00ff"])
+
+    def test_block_key_and_price_range(self):
+        self.assertEqual(block_key(listing()), ("peugeot", "208", 2019))
+        self.assertIsNone(block_key(listing(model_norm=None)))
+        low, high = price_range(11000)
+        self.assertAlmostEqual(low, 10000)
+        self.assertAlmostEqual(high, 12100)
+        self.assertIsNone(price_range(0))
+
+
+class TestMatchScore(unittest.TestCase):
+    def test_same_text_is_a_duplicate(self):
+        self.assertGreater(match_score(listing(), listing(price=12500, mileage=51000)), 0)
+
+    def test_incompatible_price_mileage_or_location(self):
+        self.assertEqual(match_score(listing(), listing(price=15000)), 0)
+        self.assertEqual(match_score(listing(), listing(mileage=80000)), 0)
+        lyon = {"type": "Point", "coordinates": [4.8357, 45.764]}
+        marseille = {"type": "Point", "coordinates": [5.3698, 43.2965]}
+        self.assertEqual(match_score(listing(location_point=lyon), listing(location_point=marseille)), 0)
+
+    def test_close_images_with_different_text(self):
+        car = listing(image_hashes=["0f0f0f0f0f0f0f0f"])
+        other = listing(title="Peugeot 208", description="Voir photos", image_hashes=["0f0f0f0f0f0f0f0e"])
+
+        self.assertGreater(match_score(car, other), 0)
+
+
+class TestDuplicateDetector(unittest.TestCase):
+    def test_batch_listings_without_id_share_a_cluster(self):
+        detector = DuplicateDetector(lambda car: [])
+        first, second = listing(), listing(price=12200)
+        unrelated = listing(title="Peugeot 208 Active", description="Boîte auto, 2 portes, sellerie cuir rouge")
+
+        detector.assign(first)
+        detector.assign(second)
+        detector.assign(unrelated)
+
+        self.assertEqual(first["vehicle_cluster_id"], second["vehicle_cluster_id"])
+        self.assertNotEqual(first["vehicle_cluster_id"], unrelated["vehicle_cluster_id"])
+
+    def test_stored_listing_keeps_its_cluster_and_unclustered_duplicates_join_it(self):
+        stored = [
+            listing(id="lbc_1", vehicle_cluster_id="vc_stored"),
+            listing(id="lc_2", vehicle_cluster_id=None, price=12100),
+        ]
+        detector = DuplicateDetector(lambda car: [dict(candidate) for candidate in stored])
+
+        car = listing(id="lbc_1", price=11900)
+        self.assertEqual(detector.assign(car), "vc_stored")
+        self.assertEqual(detector.updates, {"lc_2": "vc_stored"})
+        self.assertEqual(detector.merges, {})
+
+    def test_matches_in_several_clusters_are_merged(self):
+        stored = [
+            listing(id="a", vehicle_cluster_id="vc_a"),
+            listing(id="b", vehicle_cluster_id="vc_b", price=12100),
+        ]
+        detector = DuplicateDetector(lambda car: [dict(candidate) for candidate in stored])
+
+        cluster_id = detector.assign(listing(id="c", price=12050))
+
+        self.assertIn(cluster_id, ("vc_a", "vc_b"))
+        self.assertEqual(detector.resolve("vc_a"), cluster_id)
+        self.assertEqual(detector.resolve("vc_b"), cluster_id)
+        self.assertEqual(len(detector.merges), 1)
+
+    def test_merges_are_resolved_transitively(self):
+        detector = DuplicateDetector(lambda car: [])
+        detector.merges = {"vc_a": "vc_b", "vc_b": "vc_c"}
+
+        self.assertEqual(detector.resolve("vc_a"), "vc_c")
+        self.assertEqual(detector.resolve("vc_d"), "vc_d")
+        self.assertIsNone(detector.resolve(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from scrapers.api.fulltext import TEXT_SEARCH_LANGUAGE, build_text_filter, stem, stems, text_fields
+
+
+class TestStems(unittest.TestCase):
+    def test_plural_and_singular_share_a_stem(self):
+        self.assertEqual(stem("voitures"), stem("voiture"))
+        self.assertEqual(stem("chevaux"), "cheval")
+        self.assertEqual(stem("208"), "208")
+        self.assertEqual(stem("gti"), "gti")
+
+    def test_stems_are_folded_without_stop_words(self):
+        self.assertEqual(stems("Toit ouvrant et Sièges chauffants"), stems("toit ouvrants siege chauffant"))
+        self.assertNotIn("et", stems("Toit ouvrant et sièges"))
+        self.assertEqual(stems(None), [])
+
+    def test_text_fields_cover_the_indexed_fields(self):
+        fields = text_fields({"title": "Golf GTI", "brand": "Volkswagen", "description": "Voitures de collection"})
+
+        self.assertEqual(fields["text_stems"], stems("Golf GTI Volkswagen Voitures collection"))
+
+
+class TestBuildTextFilter(unittest.TestCase):
+    def test_terms_are_not_phrases(self):
+        text_filter = build_text_filter("Voitures  diesel")
+
+        self.assertEqual(text_filter["$text"], {"$search": "Voitures diesel", "$language": TEXT_SEARCH_LANGUAGE})
+        self.assertEqual(text_filter["text_stems"], {"$all": [stem("voitures"), "diesel"]})
+
+    def test_every_term_is_required_on_stems(self):
+        listing = text_fields({"title": "Voiture diesel", "description": "Toit ouvrant"})["text_stems"]
+
+        for keywords in ("voitures diesel", "voiture toit", ["Diesel", "toits"]):
+            with self.subTest(keywords=keywords):
+                self.assertTrue(set(build_text_filter(keywords)["text_stems"]["$all"]) <= set(listing))
+        self.assertFalse(set(build_text_filter("voiture essence")["text_stems"]["$all"]) <= set(listing))
+
+    def test_quotes_negations_and_duplicates_are_dropped(self):
+        text_filter = build_text_filter(['"golf" -diesel', 'golf \\gti'])
+
+        self.assertEqual(text_filter["$text"]["$search"], "golf diesel gti")
+        self.assertEqual(text_filter["text_stems"], {"$all": ["golf", "diesel", "gti"]})
+
+    def test_stop_words_only_filter_on_text(self):
+        self.assertNotIn("text_stems", build_text_filter("de la"))
+        self.assertIsNone(build_text_filter(" \\ "))
+        self.assertIsNone(build_text_filter(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+
+from scrapers.api.geocoding import (
+    PRECISION_COMMUNE, PRECISION_DEPARTMENT, CommuneTable, geo_point, location_precision, radius_filter, resolve_near
+)
+
+
+COMMUNES = """code_postal,nom_commune,departement,latitude,longitude
+93000,Bobigny,93,48.9077,2.4397
+97400,Saint-Denis,974,-20.8823,55.4504
+69001,Lyon,69,45.7640,4.8357
+13001,Marseille,13,43.2965,5.3698
+20000,Ajaccio,2A,41.9192,8.7386
+"""
+
+
+class TestCommuneTable(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        handle, cls.path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(handle, "w", encoding="utf-8") as f:
+            f.write(COMMUNES)
+        cls.table = CommuneTable(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.path)
+
+    def test_exact_postcode(self):
+        self.assertEqual(self.table.geocode("69001 Lyon"), (45.7640, 4.8357))
+
+    def test_name_is_restricted_to_the_postcode_department(self):
+        # Saint-Denis (93) n'est pas dans la table : repli sur le département, pas sur La Réunion
+        self.assertEqual(self.table.geocode("Saint-Denis 93200"), (48.9077, 2.4397))
+        self.assertEqual(self.table.geocode("Saint Denis (93)"), (48.9077, 2.4397))
+        self.assertEqual(self.table.geocode("Saint-Denis 97490"), (-20.8823, 55.4504))
+
+    def test_name_without_department(self):
+        self.assertEqual(self.table.geocode("Saint-Denis"), (-20.8823, 55.4504))
+        self.assertEqual(self.table.geocode("Lyon 3e"), (45.7640, 4.8357))
+
+    def test_department_fallbacks(self):
+        self.assertEqual(self.table.geocode("Vénissieux 69200"), (45.7640, 4.8357))
+        self.assertEqual(self.table.geocode("Porto-Vecchio 20137"), (41.9192, 8.7386))
+        self.assertEqual(self.table.geocode("Aubagne 13"), (43.2965, 5.3698))
+
+    def test_unknown_location(self):
+        self.assertIsNone(self.table.geocode("Quelque part"))
+        self.assertIsNone(self.table.geocode("Brest 29200"))
+
+    def test_precision(self):
+        self.assertEqual(self.table.locate("69001 Lyon"), ((45.7640, 4.8357), PRECISION_COMMUNE))
+        self.assertEqual(self.table.locate("Lyon"), ((45.7640, 4.8357), PRECISION_COMMUNE))
+        self.assertEqual(self.table.locate("Vénissieux 69200"), ((45.7640, 4.8357), PRECISION_DEPARTMENT))
+        self.assertEqual(self.table.locate("Saint Denis (93)"), ((48.9077, 2.4397), PRECISION_DEPARTMENT))
+        self.assertIsNone(self.table.locate("Quelque part"))
+
+    def test_department_of(self):
+        self.assertEqual(CommuneTable.department_of("20100"), "2a")
+        self.assertEqual(CommuneTable.department_of("20200"), "2b")
+        self.assertEqual(CommuneTable.department_of("97400"), "974")
+        self.assertEqual(CommuneTable.department_of("75016"), "75")
+
+
+class TestGeoHelpers(unittest.TestCase):
+    def test_resolve_near_accepts_coordinates(self):
+        self.assertEqual(resolve_near("45.5, 4.8"), (45.5, 4.8))
+        self.assertIsNone(resolve_near("95, 4.8"))
+
+    def test_geo_point_is_longitude_first(self):
+        point = geo_point("Lyon 69003")
+
+        self.assertEqual(point["type"], "Point")
+        self.assertEqual(point["coordinates"], [4.8357, 45.764])
+        self.assertIsNone(geo_point(None))
+
+    def test_department_guess_is_not_a_position(self):
+        self.assertIsNone(geo_point("Villefranche-sur-Saône 69400"))
+        self.assertEqual(location_precision("Villefranche-sur-Saône 69400"), PRECISION_DEPARTMENT)
+        self.assertEqual(location_precision("Lyon 69003"), PRECISION_COMMUNE)
+        self.assertIsNone(location_precision(None))
+        self.assertIsNone(resolve_near("Villefranche-sur-Saône 69400"))
+        self.assertIsNotNone(resolve_near("Lyon"))
+
+    def test_radius_filter(self):
+        condition = radius_filter((45.0, 5.0), 63.781)["$geoWithin"]["$centerSphere"]
+
+        self.assertEqual(condition[0], [5.0, 45.0])
+        self.assertAlmostEqual(condition[1], 0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import asyncio
+import unittest
+
+from scrapers.api.ingest import MAX_ITEM_SIZE, iter_json_array, iter_ndjson
+
+
+async def _chunks(*parts):
+    for part in parts:
+        yield part
+
+
+def parse(parser, *parts):
+    async def collect():
+        return [item async for item in parser(_chunks(*parts))]
+    return asyncio.run(collect())
+
+
+def errors(items):
+    return [(index, str(item)) for index, item in items if isinstance(item, ValueError)]
+
+
+class TestIterJsonArray(unittest.TestCase):
+    def test_items_split_across_chunks(self):
+        items = parse(iter_json_array, b'[{"a": 1}, {"b"', b': "\xc3', b'\xa9"}, 12', b'3]')
+
+        self.assertEqual(items, [(0, {"a": 1}), (1, {"b": "é"}), (2, 123)])
+
+    def test_empty_array(self):
+        self.assertEqual(parse(iter_json_array, b" [ ] \n"), [])
+
+    def test_missing_comma(self):
+        items = parse(iter_json_array, b"[1 2]")
+
+        self.assertEqual(items[0], (0, 1))
+        self.assertEqual(errors(items), [(1, "Virgule attendue entre les éléments du tableau JSON")])
+
+    def test_extra_commas(self):
+        for body in (b"[1,,2]", b"[,1]", b"[1,]"):
+            with self.subTest(body=body):
+                self.assertEqual(errors(parse(iter_json_array, body))[0][1], "Élément attendu dans le tableau JSON")
+
+    def test_data_after_the_array(self):
+        items = parse(iter_json_array, b"[1]", b"  x")
+
+        self.assertEqual(items[0], (0, 1))
+        self.assertEqual(errors(items), [(1, "Données après la fin du tableau JSON")])
+        self.assertEqual(errors(parse(iter_json_array, b"[1][2]")), [(1, "Données après la fin du tableau JSON")])
+
+    def test_unterminated_or_not_an_array(self):
+        self.assertEqual(errors(parse(iter_json_array, b"[1, 2")), [(2, "Tableau JSON non terminé")])
+        self.assertEqual(errors(parse(iter_json_array, b'{"a": 1}'))[0][1], "Le corps de la requête doit être un tableau JSON")
+        self.assertEqual(errors(parse(iter_json_array, b""))[0][1], "Le corps de la requête doit être un tableau JSON")
+
+    def test_invalid_item_stops_reading(self):
+        items = parse(iter_json_array, b'[1, {"a": }, 3]')
+
+        self.assertEqual(items[0], (0, 1))
+        self.assertEqual(len(items), 2)
+        self.assertTrue(str(items[1][1]).startswith("JSON invalide"))
+
+    def test_item_too_large(self):
+        items = parse(iter_json_array, b'["' + b"x" * (MAX_ITEM_SIZE + 1), b'"]')
+
+        self.assertEqual(errors(items), [(0, "Élément trop volumineux")])
+
+
+class TestIterNdjson(unittest.TestCase):
+    def test_lines_split_across_chunks(self):
+        items = parse(iter_ndjson, b'{"a": 1}\n\n{"b"', b': 2}\n3')
+
+        self.assertEqual(items, [(0, {"a": 1}), (1, {"b": 2}), (2, 3)])
+
+    def test_invalid_line_is_reported_and_reading_continues(self):
+        items = parse(iter_ndjson, b'{"a": 1}\nnope\n{"b": 2}\n')
+
+        self.assertEqual(items[0], (0, {"a": 1}))
+        self.assertTrue(str(items[1][1]).startswith("JSON invalide"))
+        self.assertEqual(items[2], (2, {"b": 2}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+from scrapers.api.normalization import (
+    location_tokens, normalize_brand, normalize_key, normalize_model, normalized_fields, prefix_pattern
+)
+
+
+class TestNormalizeBrandAndModel(unittest.TestCase):
+    def test_brand_is_folded_and_canonical(self):
+        self.assertEqual(normalize_brand("Citroën"), "citroen")
+        self.assertEqual(normalize_brand("VW"), "volkswagen")
+        self.assertEqual(normalize_brand("Mercedes-Benz"), "mercedes benz")
+        self.assertEqual(normalize_brand("  MERCEDES "), "mercedes benz")
+        self.assertEqual(normalize_brand(None), "")
+
+    def test_model_drops_brand_prefix_and_aliases(self):
+        self.assertEqual(normalize_model("Peugeot 208", "Peugeot"), "208")
+        self.assertEqual(normalize_model("Mercedes C Class", "Mercedes"), "classe c")
+        self.assertEqual(normalize_model("Classe C 220", "Mercedes-Benz"), "classe c 220")
+        self.assertEqual(normalize_model("3er", "BMW"), "serie 3")
+        self.assertEqual(normalize_model("Evoque", "Range Rover"), "range rover evoque")
+        self.assertEqual(normalize_model("VW Coccinelle", "Volkswagen"), "beetle")
+
+    def test_model_without_brand_is_only_folded(self):
+        self.assertEqual(normalize_model("Golf GTI", None), "golf gti")
+        self.assertEqual(normalize_model(None, "Peugeot"), "")
+
+
+class TestNormalizeLocation(unittest.TestCase):
+    def test_key_and_tokens(self):
+        self.assertEqual(normalize_key("Île-de-France"), "ile de france")
+        self.assertEqual(location_tokens("Paris 75 Paris"), ["paris", "75"])
+        self.assertEqual(location_tokens(None), [])
+
+    def test_prefix_pattern_is_anchored(self):
+        pattern = prefix_pattern("classe c")
+
+        self.assertIsNotNone(pattern.match("classe c 220"))
+        self.assertIsNone(pattern.match("la classe c"))
+        self.assertIsNone(prefix_pattern("c+").match("c3"))
+
+
+class TestNormalizedFields(unittest.TestCase):
+    def test_fields_of_a_listing(self):
+        fields = normalized_fields({"brand": "VW", "model": "Golf 7", "location": "Lyon 69003"})
+
+        self.assertEqual(fields["brand_norm"], "volkswagen")
+        self.assertEqual(fields["model_norm"], "golf 7")
+        self.assertEqual(fields["location_norm"], "lyon 69003")
+        self.assertEqual(fields["location_tokens"], ["lyon", "69003"])
+        self.assertEqual(fields["location_point"]["type"], "Point")
+        self.assertEqual(fields["location_precision"], "commune")
+
+    def test_missing_values_are_none(self):
+        fields = normalized_fields({})
+
+        self.assertIsNone(fields["brand_norm"])
+        self.assertIsNone(fields["model_norm"])
+        self.assertIsNone(fields["location_norm"])
+        self.assertEqual(fields["location_tokens"], [])
+        self.assertIsNone(fields["location_point"])
+        self.assertIsNone(fields["location_precision"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from datetime import datetime, timedelta
+
+from scrapers.api.price_history import PRICE_HISTORY_MAX_ENTRIES, price_drop_since, track_price
+
+
+NOW = datetime(2024, 3, 1, 12, 0)
+
+
+class TestTrackPrice(unittest.TestCase):
+    def test_new_listing(self):
+        fields = track_price(None, 10000, NOW)
+
+        self.assertEqual(fields["price_history"], [{"date": NOW.isoformat(), "price": 10000}])
+        self.assertEqual(fields["price_peak"], 10000)
+        self.assertEqual(fields["price_drop"], 0.0)
+        self.assertIsNone(fields["last_price_drop_at"])
+        self.assertEqual(fields["first_seen_at"], NOW)
+        self.assertEqual(fields["days_on_market"], 0)
+
+    def test_unchanged_price_adds_no_entry(self):
+        first = track_price(None, 10000, NOW)
+        fields = track_price({"price": 10000, **first}, 10000, NOW + timedelta(days=3))
+
+        self.assertEqual(len(fields["price_history"]), 1)
+        self.assertEqual(fields["days_on_market"], 3)
+
+    def test_price_drop(self):
+        first = track_price(None, 10000, NOW)
+        later = NOW + timedelta(days=10)
+        fields = track_price({"price": 10000, **first}, 9000, later)
+
+        self.assertEqual([entry["price"] for entry in fields["price_history"]], [10000, 9000])
+        self.assertEqual(fields["price_peak"], 10000)
+        self.assertEqual(fields["price_drop"], 0.1)
+        self.assertEqual(fields["last_price_drop_at"], later)
+
+    def test_legacy_listing_without_history(self):
+        created_at = NOW - timedelta(days=5)
+        fields = track_price({"price": 12000, "created_at": created_at.isoformat()}, 11000, NOW)
+
+        self.assertEqual(fields["price_history"][0], {"date": created_at.isoformat(), "price": 12000})
+        self.assertEqual(fields["first_seen_at"], created_at)
+        self.assertEqual(fields["days_on_market"], 5)
+        self.assertEqual(fields["last_price_drop_at"], NOW)
+
+    def test_history_is_capped(self):
+        fields = track_price(None, 1000, NOW)
+        for step in range(1, PRICE_HISTORY_MAX_ENTRIES + 10):
+            fields = track_price(fields, 1000 + step, NOW + timedelta(days=step))
+
+        history = fields["price_history"]
+        self.assertEqual(len(history), PRICE_HISTORY_MAX_ENTRIES)
+        self.assertEqual(history[0]["price"], 1000)
+        self.assertEqual(history[-1]["price"], 1000 + PRICE_HISTORY_MAX_ENTRIES + 9)
+
+    def test_invalid_price_is_ignored(self):
+        fields = track_price(None, None, NOW)
+
+        self.assertEqual(fields["price_history"], [])
+        self.assertEqual(fields["price_drop"], 0.0)
+
+
+class TestPriceDropSince(unittest.TestCase):
+    def test_reference_is_the_price_in_force_at_since(self):
+        history = [
+            {"date": (NOW - timedelta(days=30)).isoformat(), "price": 12000},
+            {"date": (NOW - timedelta(days=20)).isoformat(), "price": 10000},
+            {"date": (NOW - timedelta(days=2)).isoformat(), "price": 9000},
+        ]
+
+        self.assertEqual(price_drop_since(history, NOW - timedelta(days=7)), 0.1)
+        self.assertEqual(price_drop_since(history, NOW - timedelta(days=25)), 0.25)
+
+    def test_highest_price_after_since(self):
+        history = [
+            {"date": (NOW - timedelta(days=30)).isoformat(), "price": 10000},
+            {"date": (NOW - timedelta(days=5)).isoformat(), "price": 11000},
+            {"date": (NOW - timedelta(days=1)).isoformat(), "price": 9900},
+        ]
+
+        self.assertEqual(price_drop_since(history, NOW - timedelta(days=7)), 0.1)
+
+    def test_no_drop(self):
+        history = [
+            {"date": (NOW - timedelta(days=30)).isoformat(), "price": 9000},
+            {"date": (NOW - timedelta(days=1)).isoformat(), "price": 9500},
+        ]
+
+        self.assertEqual(price_drop_since(history, NOW - timedelta(days=7)), 0.0)
+        self.assertEqual(price_drop_since([], NOW), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
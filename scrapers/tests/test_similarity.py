@@ -0,0 +1,75 @@
+import unittest
+import warnings
+
+from scrapers.api.similarity import SimilarityIndex
+
+
+def listing(car_id, brand, model, **fields):
+    car = {"_id": car_id, "brand": brand, "model": model, "year": 2019, "mileage": 50000, "price": 12000}
+    car.update(fields)
+    return car
+
+
+CARS = [
+    listing("208a", "Peugeot", "208", price=11800),
+    listing("208b", "Peugeot", "208", price=12500, mileage=60000),
+    listing("208c", "Peugeot", "208", year=2012, price=6000, mileage=150000),
+    listing("308a", "Peugeot", "308", price=13000),
+    listing("clio", "Renault", "Clio", price=11900),
+]
+
+
+def build(cars):
+    index = SimilarityIndex()
+    index.load(SimilarityIndex.build(cars))
+    return index
+
+
+class TestSimilarityIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = build(CARS)
+
+    def test_model_block_is_searched_first(self):
+        results = self.index.similar(listing(None, "Peugeot", "208"), k=2)
+
+        self.assertEqual([car_id for car_id, _ in results], ["208a", "208b"])
+        self.assertLessEqual(results[0][1], results[1][1])
+
+    def test_exclude_id(self):
+        results = self.index.similar(CARS[0], k=2, exclude_id="208a")
+
+        self.assertEqual([car_id for car_id, _ in results], ["208b", "208c"])
+
+    def test_falls_back_to_the_brand_block(self):
+        # Trois 208 seulement : le bloc Peugeot complète avec la 308
+        results = self.index.similar(CARS[0], k=3, exclude_id="208a")
+
+        self.assertEqual({car_id for car_id, _ in results}, {"208b", "208c", "308a"})
+
+    def test_falls_back_to_the_whole_index(self):
+        results = self.index.similar(listing(None, "Dacia", "Sandero"), k=2)
+        self.assertEqual(len(results), 2)
+
+        # Marque inconnue de l'index ; la plus proche par le prix et le kilométrage
+        self.assertEqual(self.index.similar(listing(None, "Dacia", "Sandero", price=12000), k=5)[0][0], "clio")
+        self.assertEqual(len(self.index.similar(CARS[3], k=10, exclude_id="308a")), 4)
+
+    def test_missing_features_are_ignored(self):
+        results = self.index.similar({"brand": "Peugeot", "model": "208"}, k=3)
+
+        self.assertEqual({car_id for car_id, _ in results}, {"208a", "208b", "208c"})
+        self.assertTrue(all(distance == 0 for _, distance in results))
+
+    def test_build_without_warnings(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            index = build([listing("a", "Peugeot", "208"), listing("b", "Peugeot", "208", price=None)])
+            empty = build([])
+
+        self.assertEqual(len(index), 2)
+        self.assertEqual(empty.similar(CARS[0]), [])
+        self.assertEqual(SimilarityIndex().similar(CARS[0]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -11,10 +11,14 @@ import json
 import logging
 import pandas as pd
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, JSON
+from sqlalchemy import create_engine, inspect, text, Column, Integer, String, Float, DateTime, Text, JSON, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from scrapers.api.normalization import normalized_fields
+from scrapers.api.price_history import track_price
+from scrapers.api.dedup import DuplicateDetector, block_key, price_range
+
 logger = logging.getLogger("CarScraper.Database")
 
 Base = declarative_base()
@@ -34,6 +38,21 @@ class Car(Base):
     fuel_type = Column(String(50))
     transmission = Column(String(50))
     location = Column(String(255))
+    brand_norm = Column(String(100), index=True)
+    model_norm = Column(String(100), index=True)
+    location_norm = Column(String(255), index=True)
+    location_tokens = Column(JSON)
+    location_point = Column(JSON)
+    location_precision = Column(String(20))
+    vehicle_cluster_id = Column(String(40), index=True)
+    text_simhash = Column(String(16))
+    image_hashes = Column(JSON)
+    price_history = Column(JSON)
+    price_peak = Column(Float)
+    price_drop = Column(Float)
+    last_price_drop_at = Column(DateTime)
+    first_seen_at = Column(DateTime)
+    days_on_market = Column(Integer)
     description = Column(Text)
     url = Column(String(500))
     images = Column(JSON)
@@ -45,6 +64,12 @@ class Car(Base):
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     
+    # Index des candidats doublons (marque, modèle, année normalisés, prix) et des baisses de prix récentes
+    __table_args__ = (
+        Index("ix_cars_dedup_candidates", "brand_norm", "model_norm", "year", "price"),
+        Index("ix_cars_price_drop", "last_price_drop_at", "price_drop"),
+    )
+    
     def __repr__(self):
         return f"<Car(id='{self.id}', brand='{self.brand}', model='{self.model}', year={self.year}, price={self.price})>"
 
@@ -74,6 +99,7 @@ class DatabaseManager:
             
             # Créer les tables si elles n'existent pas
             Base.metadata.create_all(self.engine)
+            self._migrate_schema()
             
             # Créer une session
             Session = sessionmaker(bind=self.engine)
@@ -86,6 +112,22 @@ class DatabaseManager:
             # Fallback to JSON
             self.db_type = "json"
     
+    def _migrate_schema(self):
+        """Ajoute à une table cars existante les colonnes et index apparus depuis sa création"""
+        inspector = inspect(self.engine)
+        existing_columns = {column["name"] for column in inspector.get_columns(Car.__tablename__)}
+        missing_columns = [column for column in Car.__table__.columns if column.name not in existing_columns]
+        
+        with self.engine.begin() as connection:
+            for column in missing_columns:
+                column_type = column.type.compile(dialect=self.engine.dialect)
+                connection.execute(text(f"ALTER TABLE {Car.__tablename__} ADD COLUMN {column.name} {column_type}"))
+                logger.info(f"Colonne {column.name} ajoutée à la table {Car.__tablename__}")
+        
+        # create_all ne crée pas les index d'une table déjà existante
+        for index in Car.__table__.indexes:
+            index.create(self.engine, checkfirst=True)
+    
     def save_cars(self, cars, source):
         """Sauvegarde les annonces dans la base de données"""
         if not cars:
@@ -105,13 +147,21 @@ class DatabaseManager:
     
     def _save_to_database(self, cars, source):
         """Sauvegarde les annonces dans une base de données SQL"""
+        detector = DuplicateDetector(self._find_duplicate_candidates)
+        
         for car_data in cars:
-            # Ajouter la source
+            # Ajouter la source, les champs normalisés et le cluster de doublons
             car_data["source"] = source
+            car_data.update(normalized_fields(car_data))
+            detector.assign(car_data)
             
             # Vérifier si l'annonce existe déjà
             existing_car = self.session.query(Car).filter_by(id=car_data.get("id")).first()
             
+            # Historique des prix : une entrée seulement si le prix a changé
+            previous = {c.name: getattr(existing_car, c.name) for c in Car.__table__.columns} if existing_car else None
+            car_data.update(track_price(previous, car_data.get("price"), datetime.utcnow()))
+            
             if existing_car:
                 # Mettre à jour l'annonce existante
                 for key, value in car_data.items():
@@ -122,9 +172,42 @@ class DatabaseManager:
                 car = Car(**car_data)
                 self.session.add(car)
         
+        # Les clusters fusionnés en cours de lot sont remplacés par le cluster final
+        for car in list(self.session.new) + list(self.session.dirty):
+            if isinstance(car, Car):
+                car.vehicle_cluster_id = detector.resolve(car.vehicle_cluster_id)
+        
+        # Rattacher les annonces déjà stockées sans cluster à celui de leurs doublons
+        for car_id, cluster_id in detector.updates.items():
+            self.session.query(Car).filter_by(id=car_id).update({"vehicle_cluster_id": detector.resolve(cluster_id)})
+        
+        # Regrouper les clusters fusionnés (doublons rattachés à plusieurs clusters)
+        for old_cluster_id in detector.merges:
+            self.session.query(Car).filter_by(vehicle_cluster_id=old_cluster_id).update(
+                {"vehicle_cluster_id": detector.resolve(old_cluster_id)}
+            )
+        
         # Commit les changements
         self.session.commit()
     
+    def _find_duplicate_candidates(self, car_data):
+        """Annonces stockées du même bloc de doublons (marque, modèle, année, prix)"""
+        key = block_key(car_data)
+        if key is None:
+            return []
+        
+        brand_norm, model_norm, year = key
+        query = self.session.query(Car).filter(
+            Car.brand_norm == brand_norm,
+            Car.model_norm == model_norm,
+            Car.year == year
+        )
+        bounds = price_range(car_data.get("price"))
+        if bounds:
+            query = query.filter(Car.price.between(*bounds))
+        
+        return [{c.name: getattr(car, c.name) for c in car.__table__.columns} for car in query.all()]
+    
     def _save_to_json(self, cars, source):
         """Sauvegarde les annonces dans un fichier JSON"""
         json_path = self.config.get("path", "scrapers/data/cars.json")
@@ -141,10 +224,27 @@ class DatabaseManager:
             except json.JSONDecodeError:
                 logger.warning(f"Fichier JSON corrompu: {json_path}, création d'un nouveau fichier")
         
+        # Blocs de doublons des annonces existantes (marque, modèle, année)
+        blocks = {}
+        for existing_car in existing_data.values():
+            key = block_key(existing_car)
+            if key is not None:
+                blocks.setdefault(key, []).append(existing_car)
+        detector = DuplicateDetector(lambda car: blocks.get(block_key(car), []))
+        
         # Ajouter ou mettre à jour les annonces
         for car in cars:
             car["source"] = source
             car["updated_at"] = datetime.now().isoformat()
+            car.update(normalized_fields(car))
+            detector.assign(car)
+            
+            # Historique des prix : une entrée seulement si le prix a changé
+            history = track_price(existing_data.get(car.get("id")), car.get("price"), datetime.utcnow())
+            for field in ("last_price_drop_at", "first_seen_at"):
+                if history[field] is not None:
+                    history[field] = history[field].isoformat()
+            car.update(history)
             
             if "id" in car:
                 existing_data[car["id"]] = car
@@ -154,6 +254,11 @@ class DatabaseManager:
                 car["id"] = car_id
                 existing_data[car_id] = car
         
+        # Regrouper les clusters fusionnés (doublons rattachés à plusieurs clusters)
+        if detector.merges:
+            for stored_car in existing_data.values():
+                stored_car["vehicle_cluster_id"] = detector.resolve(stored_car.get("vehicle_cluster_id"))
+        
         # Sauvegarder les données
         with open(json_path, 'w', encoding='utf-8') as f:
             json.dump(existing_data, f, ensure_ascii=False, indent=2)